@@ -0,0 +1,96 @@
+"""
+Departure Shield: Base Risk Scoring Benchmark
+
+Scores synthetic secrets and file transfers with the scalar base risk functions and with
+the vectorized ones in core.batch_scoring, reports both timings and checks that every
+level agrees. Needs NumPy.
+
+Usage:
+    python benchmarks/base_scoring.py [--records N] [--seed S]
+
+Exits with status 1 when any vectorized level differs from the scalar one.
+"""
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+from typing import Any, Dict, List
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, REPO_ROOT)
+
+from core.batch_scoring import assess_base_data_exfiltration_risk_batch, assess_base_persistent_access_risk_batch  # noqa: E402
+from core.file_transfer_evaluation import assess_base_data_exfiltration_risk, calculate_days_since_activity  # noqa: E402
+from core.secret_evaluation import assess_base_persistent_access_risk, calculate_days_since_last_access, calculate_days_until_rotation  # noqa: E402
+
+
+DESTINATIONS = ["Personal Google Drive", "Company SharePoint", "personal USB drive", "Corporate S3 bucket"]
+SHARING_STATUSES = ["Private", "Shared Internally", "Shared Externally", "Restricted", "External - Restricted"]
+
+
+def synthetic_records(count: int, seed: int):
+    rng = random.Random(seed)
+    today = datetime.date.today()
+
+    def date(offset: int) -> datetime.date:
+        return today + datetime.timedelta(days=offset)
+
+    secrets = [{
+        "next_rotation_date": rng.choice([None, "", date(rng.randint(-30, 200)).isoformat()]),
+        "last_accessed": date(-rng.randint(0, 60)).isoformat(),
+    } for _ in range(count)]
+    file_transfers = [{
+        "timestamp": date(-rng.randint(0, 15)).strftime("%Y-%m-%d") + f"T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00Z",
+        "size_mb": rng.choice([0.5, 9.99, 10, 50, 99.9, 100, 2048]),
+        "location": {"source": "Laptop", "destination": rng.choice(DESTINATIONS)},
+        "sharing_status": rng.choice(SHARING_STATUSES),
+    } for _ in range(count)]
+    return secrets, file_transfers
+
+
+def scalar_secret_levels(secrets: List[Dict[str, Any]]) -> List[int]:
+    return [assess_base_persistent_access_risk(
+        calculate_days_until_rotation(secret['next_rotation_date']),
+        calculate_days_since_last_access(secret['last_accessed'])).value for secret in secrets]
+
+
+def scalar_file_transfer_levels(file_transfers: List[Dict[str, Any]]) -> List[int]:
+    return [assess_base_data_exfiltration_risk(
+        calculate_days_since_activity(file_transfer['timestamp']), file_transfer['size_mb'], file_transfer).value
+        for file_transfer in file_transfers]
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Compare scalar and vectorized base risk scoring.")
+    parser.add_argument("--records", type=int, default=200000,
+                        help="number of secrets and of file transfers to score")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    secrets, file_transfers = synthetic_records(args.records, args.seed)
+    mismatches = 0
+    for name, scalar, vectorized, records in (
+            ("secrets", scalar_secret_levels, assess_base_persistent_access_risk_batch, secrets),
+            ("file transfers", scalar_file_transfer_levels, assess_base_data_exfiltration_risk_batch, file_transfers)):
+        expected, scalar_seconds = timed(scalar, records)
+        levels, vectorized_seconds = timed(vectorized, records)
+        differing = sum(1 for level, expected_level in zip(levels.tolist(), expected) if level != expected_level)
+        mismatches += differing
+        print(f"{name}: scalar {scalar_seconds:.2f}s, vectorized {vectorized_seconds:.2f}s "
+              f"({scalar_seconds / max(vectorized_seconds, 1e-9):.1f}x), {differing} mismatches")
+
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
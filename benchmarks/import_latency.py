@@ -0,0 +1,101 @@
+"""
+Departure Shield: Import Latency Benchmark
+
+Measures how long a fresh interpreter takes to import the modules every CLI run and
+worker process pays for. Each module is imported in its own subprocess so earlier
+imports do not warm the module cache.
+
+Usage:
+    python benchmarks/import_latency.py [--runs N] [--max-ms MS]
+
+With --max-ms the script exits with status 1 when any module's median import time
+exceeds the budget, so it can be used to catch regressions.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+MODULES = [
+    "utils.ai_service",
+    "core.secret_evaluation",
+    "core.file_transfer_evaluation",
+    "departure_risk",
+]
+
+# The heavy SDKs that must not be imported just by importing the modules above
+PROVIDER_SDKS = ["openai", "anthropic", "google.generativeai", "flask", "IPython"]
+
+
+def measure_import(module: str) -> Dict[str, float]:
+    """
+    Import a module in a fresh interpreter and report its import time.
+
+    Args:
+        module (str): The dotted module name to import.
+
+    Returns:
+        Dict[str, float]: The import time in milliseconds and the names of any provider SDKs it loaded.
+    """
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        f"import {module}\n"
+        "elapsed = (time.perf_counter() - start) * 1000\n"
+        f"loaded = [name for name in {PROVIDER_SDKS!r} if name in sys.modules]\n"
+        "print(elapsed)\n"
+        "print(','.join(loaded))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.splitlines()
+    return {
+        "ms": float(output[0]),
+        "sdks": [name for name in output[1].split(',') if name] if len(output) > 1 else [],
+    }
+
+
+def run_benchmark(modules: List[str], runs: int) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for module in modules:
+        samples = [measure_import(module) for _ in range(runs)]
+        timings = [sample["ms"] for sample in samples]
+        results[module] = {
+            "median_ms": statistics.median(timings),
+            "min_ms": min(timings),
+            "max_ms": max(timings),
+            "sdks": samples[-1]["sdks"],
+        }
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the import latency of the Departure Shield modules.")
+    parser.add_argument("--runs", type=int, default=5,
+                        help="fresh interpreters per module (default: 5)")
+    parser.add_argument("--max-ms", type=float, default=None,
+                        help="fail if a module's median import time exceeds this budget")
+    args = parser.parse_args()
+
+    results = run_benchmark(MODULES, args.runs)
+
+    exit_code = 0
+    for module, result in results.items():
+        sdks = ', '.join(result["sdks"]) or "none"
+        print(f"{module:32} median {result['median_ms']:8.1f} ms  "
+              f"(min {result['min_ms']:.1f}, max {result['max_ms']:.1f})  provider SDKs loaded: {sdks}")
+        if args.max_ms is not None and result["median_ms"] > args.max_ms:
+            print(f"  exceeds the {args.max_ms:.1f} ms budget")
+            exit_code = 1
+
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
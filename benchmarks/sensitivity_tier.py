@@ -0,0 +1,69 @@
+"""
+Departure Shield: Local Sensitivity Tier Evaluation
+
+Reports, for a set of confidence thresholds, how many descriptions the local data
+sensitivity classifier would escalate to the AI provider and how often its verdicts
+agree with the AI's on a labelled sample.
+
+The bundled sample (benchmarks/sensitivity_sample.json) holds reference labels. Pass
+--label-with-ai to relabel its descriptions with the AI assessment first, which needs
+the provider API keys.
+
+Usage:
+    python benchmarks/sensitivity_tier.py [--sample PATH] [--thresholds T ...] [--label-with-ai]
+"""
+
+import argparse
+import json
+import os
+import sys
+from typing import List, Tuple
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, REPO_ROOT)
+
+from utils.sensitivity_classifier import evaluate_local_classifier  # noqa: E402
+
+
+DEFAULT_SAMPLE = os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), 'sensitivity_sample.json')
+
+
+def load_sample(path: str, label_with_ai: bool) -> List[Tuple[str, str]]:
+    with open(path, 'r') as f:
+        entries = json.load(f)
+
+    if not label_with_ai:
+        return [(entry['description'], entry['level']) for entry in entries]
+
+    from core.secret_evaluation import assess_data_sensitivity_with_ai
+    return [(entry['description'], assess_data_sensitivity_with_ai(entry['description']).name)
+            for entry in entries]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Evaluate the local data sensitivity tier against AI labels.")
+    parser.add_argument("--sample", default=DEFAULT_SAMPLE,
+                        help="JSON list of {description, level} entries")
+    parser.add_argument("--thresholds", type=float, nargs='+', default=[0.7, 0.8, 0.85, 0.9, 0.95],
+                        help="confidence thresholds to evaluate")
+    parser.add_argument("--label-with-ai", action="store_true",
+                        help="relabel the sample with the AI assessment before evaluating")
+    args = parser.parse_args()
+
+    samples = load_sample(args.sample, args.label_with_ai)
+    print(f"{len(samples)} labelled descriptions")
+    for threshold in args.thresholds:
+        result = evaluate_local_classifier(samples, threshold)
+        agreement = result['agreement_on_local']
+        agreement = f"{agreement:.0%}" if agreement is not None else "n/a"
+        print(f"threshold {threshold:.2f}: escalation rate {result['escalation_rate']:.0%}, "
+              f"agreement on local verdicts {agreement}, "
+              f"agreement overall {result['agreement_overall']:.0%}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
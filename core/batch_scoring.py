@@ -0,0 +1,326 @@
+"""
+Departure Shield: Vectorized Base Risk Scoring
+
+Columnar counterparts of assess_base_persistent_access_risk and
+assess_base_data_exfiltration_risk for org-wide sweeps. Dates are parsed once per column
+into NumPy datetime64 arrays, and the day deltas, threshold comparisons and string
+predicates are computed over whole columns, so base levels for millions of records come
+out in one pass. The results match the scalar functions exactly, including the operator
+precedence of the data exfiltration rule.
+
+Levels are returned as int8 arrays of RiskLevel / FileTransferRiskLevel values, with 0
+for a level that was not assessed, the codes the compiled adjustment tables in
+utils.risk_adjustment_tables are indexed with.
+"""
+
+import datetime
+from typing import Any, Dict, List, Tuple
+
+from core.file_transfer_evaluation import (DAYS_SINCE_HIGH_TRANSFER_RISK, DAYS_SINCE_MEDIUM_TRANSFER_RISK,
+                                           HIGH_RISK_FILE_SIZE_MB, MEDIUM_RISK_FILE_SIZE_MB, assess_activity_type_risk)
+from core.secret_evaluation import (DAYS_SINCE_HIGH_ACCESS_RISK, DAYS_SINCE_MEDIUM_ACCESS_RISK,
+                                    HIGH_ROTATION_THRESHOLD, MID_ROTATION_THRESHOLD, assess_service_criticality)
+from models.file_transfer_risk_models import FileTransferRiskLevel
+from models.secret_risk_models import RiskLevel
+from utils.clock import evaluation_date
+from utils.risk_adjustment_tables import get_tables
+
+
+# Days until rotation of a secret that is not scheduled for rotation, as in calculate_days_until_rotation
+NO_ROTATION_DAYS = 365 * 5
+
+
+def parse_dates(values: List[str], date_format: str = "%Y-%m-%d"):
+    """
+    Parse a column of dates into a datetime64[D] array.
+
+    ISO dates are parsed by NumPy in one pass, timestamps being cut to their date part
+    first. Columns NumPy rejects are parsed with datetime.strptime, so that whatever
+    the scalar path accepts is accepted here too.
+
+    Args:
+        values (List[str]): The dates, all in `date_format`.
+        date_format (str): The strptime format of the dates.
+
+    Returns:
+        The dates as a datetime64[D] array.
+    """
+    import numpy as np
+
+    column = np.asarray(values, dtype=str)
+    try:
+        if date_format == "%Y-%m-%d":
+            # NumPy also accepts bare years and months, which strptime does not
+            if column.size and not np.all(np.char.str_len(column) == 10):
+                raise ValueError("not a YYYY-MM-DD column")
+            dates = column.astype('datetime64[D]')
+            _check_round_trip(dates, column)
+            return dates
+        if date_format == "%Y-%m-%dT%H:%M:%SZ":
+            if column.size and not (np.all(np.char.str_len(column) == 20) and np.all(np.char.endswith(column, 'Z'))):
+                raise ValueError("not a YYYY-MM-DDTHH:MM:SSZ column")
+            # Validate the time part the way strptime would, then keep the date
+            _check_round_trip(np.char.rstrip(column, 'Z').astype('datetime64[s]'), np.char.rstrip(column, 'Z'))
+            return column.astype('<U10').astype('datetime64[D]')
+    except ValueError:
+        pass
+    return np.array([datetime.datetime.strptime(value, date_format).date() for value in values], dtype='datetime64[D]')
+
+
+def _check_round_trip(parsed, column):
+    """
+    Raise ValueError unless NumPy read `column` as written. NumPy also accepts signed
+    years, year 0 and a space before the time, which strptime does not.
+    """
+    import numpy as np
+
+    if column.size and not (np.all(parsed.astype(str) == column) and np.all(parsed >= np.datetime64('0001-01-01'))):
+        raise ValueError("not a strptime-compatible column")
+
+
+def _today(today: datetime.date = None):
+    import numpy as np
+
+    return np.datetime64(today or evaluation_date(), 'D')
+
+
+def persistent_access_risk_levels(days_until_rotation, days_since_last_access):
+    """
+    Vectorized assess_base_persistent_access_risk.
+
+    Args:
+        days_until_rotation: Integer array of days until the next rotation.
+        days_since_last_access: Integer array of days since the last access.
+
+    Returns:
+        An int8 array of RiskLevel values.
+    """
+    import numpy as np
+
+    high = (days_until_rotation > HIGH_ROTATION_THRESHOLD) & (
+        days_since_last_access < DAYS_SINCE_HIGH_ACCESS_RISK)
+    medium = (days_until_rotation > MID_ROTATION_THRESHOLD) | (
+        days_since_last_access < DAYS_SINCE_MEDIUM_ACCESS_RISK)
+    return np.select([high, medium], [RiskLevel.HIGH.value, RiskLevel.MEDIUM.value],
+                     RiskLevel.LOW.value).astype(np.int8)
+
+
+def data_exfiltration_risk_levels(days_since_activity, file_size_mb, personal_destination, external_sharing, restricted_sharing):
+    """
+    Vectorized assess_base_data_exfiltration_risk.
+
+    Args:
+        days_since_activity: Integer array of days since the transfer.
+        file_size_mb: Array of file sizes in MB.
+        personal_destination: Boolean array, 'personal' in the lower-cased destination.
+        external_sharing: Boolean array, 'external' in the lower-cased sharing status.
+        restricted_sharing: Boolean array, 'restricted' in the lower-cased sharing status.
+
+    Returns:
+        An int8 array of FileTransferRiskLevel values.
+    """
+    import numpy as np
+
+    # Same precedence as the scalar rule: (recent or large) and personal, or external
+    high = ((days_since_activity <= DAYS_SINCE_HIGH_TRANSFER_RISK) | (file_size_mb >= HIGH_RISK_FILE_SIZE_MB)) & personal_destination \
+        | external_sharing
+    medium = ((days_since_activity <= DAYS_SINCE_MEDIUM_TRANSFER_RISK) | (file_size_mb >= MEDIUM_RISK_FILE_SIZE_MB)) & restricted_sharing
+    return np.select([high, medium], [FileTransferRiskLevel.HIGH.value, FileTransferRiskLevel.MEDIUM.value],
+                     FileTransferRiskLevel.LOW.value).astype(np.int8)
+
+
+def factorize(values: List[str]):
+    """
+    Dictionary-encode a string column.
+
+    Returns:
+        The distinct values in order of first appearance, and an integer array of each
+        value's index among them.
+    """
+    import numpy as np
+
+    codes = {}
+    indices = np.fromiter((codes.setdefault(value, len(codes)) for value in values),
+                          dtype=np.int64, count=len(values))
+    return list(codes), indices
+
+
+def contains_lower(distinct_values: List[str], indices, needle: str):
+    """
+    Boolean array of `needle in value.lower()` for a factorized column. Location and
+    sharing status columns hold few distinct strings, so the test runs once per string.
+    """
+    import numpy as np
+
+    return np.array([needle in value.lower() for value in distinct_values], dtype=bool)[indices]
+
+
+def secret_columns(secrets: List[Dict[str, Any]], today: datetime.date = None) -> Dict[str, Any]:
+    """
+    The day deltas the secret base risk depends on, as integer arrays.
+
+    Returns:
+        Dict[str, Any]: 'days_until_rotation' and 'days_since_last_access' arrays.
+    """
+    import numpy as np
+
+    today = _today(today)
+    rotation_dates = [secret['next_rotation_date'] for secret in secrets]
+    scheduled = np.array([bool(date) for date in rotation_dates], dtype=bool)
+
+    days_until_rotation = np.full(len(secrets), NO_ROTATION_DAYS, dtype=np.int64)
+    if scheduled.any():
+        scheduled_dates = parse_dates([date for date in rotation_dates if date])
+        days_until_rotation[scheduled] = (scheduled_dates - today).astype(np.int64)
+
+    last_accessed = parse_dates([secret['last_accessed'] for secret in secrets])
+    return {
+        "days_until_rotation": days_until_rotation,
+        "days_since_last_access": (today - last_accessed).astype(np.int64),
+    }
+
+
+def file_transfer_columns(file_transfers: List[Dict[str, Any]], today: datetime.date = None) -> Dict[str, Any]:
+    """
+    The columns the file transfer base risk depends on, with the string predicates precomputed.
+
+    Returns:
+        Dict[str, Any]: 'days_since_activity', 'file_size_mb', 'personal_destination',
+        'external_sharing' and 'restricted_sharing' arrays.
+    """
+    import numpy as np
+
+    timestamps = parse_dates([file_transfer['timestamp'] for file_transfer in file_transfers],
+                             "%Y-%m-%dT%H:%M:%SZ")
+    destinations = factorize([file_transfer['location']['destination'] for file_transfer in file_transfers])
+    sharing_statuses = factorize([file_transfer['sharing_status'] for file_transfer in file_transfers])
+    return {
+        "days_since_activity": (_today(today) - timestamps).astype(np.int64),
+        "file_size_mb": np.array([file_transfer['size_mb'] for file_transfer in file_transfers], dtype=np.float64),
+        "personal_destination": contains_lower(*destinations, 'personal'),
+        "external_sharing": contains_lower(*sharing_statuses, 'external'),
+        "restricted_sharing": contains_lower(*sharing_statuses, 'restricted'),
+    }
+
+
+def assess_base_persistent_access_risk_batch(secrets: List[Dict[str, Any]], today: datetime.date = None):
+    """
+    Base persistent access risk of many secrets in one pass.
+
+    Args:
+        secrets (List[Dict[str, Any]]): Secret metadata records.
+        today (datetime.date): The evaluation date, today by default.
+
+    Returns:
+        An int8 array of RiskLevel values, in the order of `secrets`.
+    """
+    columns = secret_columns(secrets, today)
+    return persistent_access_risk_levels(columns['days_until_rotation'], columns['days_since_last_access'])
+
+
+def assess_base_data_exfiltration_risk_batch(file_transfers: List[Dict[str, Any]], today: datetime.date = None):
+    """
+    Base data exfiltration risk of many file transfers in one pass.
+
+    Args:
+        file_transfers (List[Dict[str, Any]]): File transfer metadata records.
+        today (datetime.date): The evaluation date, today by default.
+
+    Returns:
+        An int8 array of FileTransferRiskLevel values, in the order of `file_transfers`.
+    """
+    return data_exfiltration_risk_levels(**file_transfer_columns(file_transfers, today))
+
+
+def service_criticality_levels(secrets: List[Dict[str, Any]]):
+    """assess_service_criticality of every secret, evaluated once per distinct service."""
+    import numpy as np
+
+    services, indices = factorize([secret['service'] for secret in secrets])
+    return np.array([assess_service_criticality(service).value for service in services], dtype=np.int8)[indices]
+
+
+def activity_type_risk_levels(file_transfers: List[Dict[str, Any]]):
+    """assess_activity_type_risk of every file transfer, evaluated once per distinct activity type."""
+    import numpy as np
+
+    activity_types, indices = factorize([file_transfer['activity_type'] for file_transfer in file_transfers])
+    return np.array([assess_activity_type_risk(activity_type).value for activity_type in activity_types], dtype=np.int8)[indices]
+
+
+def secret_influenced_levels(levels, service_criticality, data_sensitivity):
+    """
+    Vectorized adjust_risk_factors_by_influencers, through the compiled table.
+
+    Args:
+        levels: RiskLevel codes of the persistent access risk.
+        service_criticality: RiskLevel codes of the service criticality.
+        data_sensitivity: RiskLevel codes of the data sensitivity, 0 where not assessed.
+
+    Returns:
+        An int8 array of the adjusted RiskLevel codes.
+    """
+    return get_tables()["secret_influencers"].as_array()[levels, service_criticality, data_sensitivity]
+
+
+def file_transfer_influenced_levels(levels, data_sensitivity, activity_type_risk):
+    """
+    Vectorized adjust_file_transfer_risk_factors_by_influencers, through the compiled table.
+
+    Args:
+        levels: FileTransferRiskLevel codes of the data exfiltration risk.
+        data_sensitivity: FileTransferRiskLevel codes of the data sensitivity, 0 where not assessed.
+        activity_type_risk: FileTransferRiskLevel codes of the activity type risk.
+
+    Returns:
+        An int8 array of the adjusted FileTransferRiskLevel codes.
+    """
+    return get_tables()["file_transfer_influencers"].as_array()[levels, data_sensitivity, activity_type_risk]
+
+
+def _level_bound_tables(influencers_table: str, context_table: str, enrichment_axes: Tuple[int, ...]):
+    """
+    The lowest and highest final level per (base level, influencer) pair over every AI enrichment.
+
+    The influencer table is indexed by the base level, then two influencer codes; the one at
+    enrichment_axes[0] is the data sensitivity. The additional context table maps its output
+    level and every context code to the final level.
+    """
+    import numpy as np
+
+    influenced = get_tables()[influencers_table].as_array()
+    context = get_tables()[context_table].as_array()
+    final = context[influenced]
+    # Every data sensitivity and every additional context, level 0 rows being unused padding
+    axes = enrichment_axes + tuple(range(influenced.ndim, final.ndim))
+    return final.min(axis=axes).astype(np.int8), final.max(axis=axes).astype(np.int8)
+
+
+def secret_level_bounds(secrets: List[Dict[str, Any]], today: datetime.date = None):
+    """
+    The lowest and highest risk level each secret can be scored at, whatever its data
+    sensitivity, external mitigation and heightened risks turn out to be.
+
+    Returns:
+        Two int8 arrays of RiskLevel values, in the order of `secrets`.
+    """
+    levels = assess_base_persistent_access_risk_batch(secrets, today)
+    service_criticality = service_criticality_levels(secrets)
+    # secret_influencers is indexed [level, service criticality, data sensitivity]
+    low, high = _level_bound_tables("secret_influencers", "secret_additional_context", (2,))
+    return low[levels, service_criticality], high[levels, service_criticality]
+
+
+def file_transfer_level_bounds(file_transfers: List[Dict[str, Any]], today: datetime.date = None):
+    """
+    The lowest and highest risk level each file transfer can be scored at, whatever its data
+    sensitivity and heightened risks turn out to be.
+
+    Returns:
+        Two int8 arrays of FileTransferRiskLevel values, in the order of `file_transfers`.
+    """
+    levels = assess_base_data_exfiltration_risk_batch(file_transfers, today)
+    activity_type_risk = activity_type_risk_levels(file_transfers)
+    # file_transfer_influencers is indexed [level, data sensitivity, activity type risk]
+    low, high = _level_bound_tables("file_transfer_influencers", "file_transfer_additional_context", (1,))
+    return low[levels, activity_type_risk], high[levels, activity_type_risk]
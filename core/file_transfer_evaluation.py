@@ -5,16 +5,25 @@ This module provides functionality to assess the risk associated with an employe
 focusing on potential data exfiltration and unauthorized sharing.
 """
 
-from utils.file_transfer_risk_adjustment_helper import adjust_file_transfer_risk_factors_by_additional_context, adjust_file_transfer_risk_factors_by_influencers
-from utils.file_transfer_risk_adjustment_helper import adjust_file_transfer_risk_factors_by_additional_context, adjust_file_transfer_risk_factors_by_influencers
+from utils.file_transfer_risk_adjustment_helper import additional_context_can_change_file_transfer_risk
+from utils.risk_adjustment_tables import adjust_file_transfer_risk_factors
 from models.file_transfer_risk_models import FILE_TRANSFER_RISK_MITIGATION_STRATEGIES, FileTransferRiskFactor, FileTransferRiskLevel
-from external_risk_assessment.file_transfer_assessment import assess_file_transfer_heightened_risk
-from utils.ai_service import get_ai_chat_response
-from typing import Dict, Any
+from external_risk_assessment.file_transfer_assessment import assess_file_transfer_heightened_risk, async_assess_file_transfer_heightened_risk, file_transfer_surrogate_input
+from utils.ai_service import ai_tenant, async_get_ai_chat_response, get_ai_chat_response, should_hedge, track_deadline
+from utils.metadata_store import FILE_TRANSFER_METADATA_FILE, get_metadata_item_ids, get_metadata_store, get_recent_metadata
+from utils.lazy_enrichment import FULL_ENRICHMENT, record_skipped
+from utils.item_state import fingerprint, item_state_enabled, reuse_enrichments, store_enrichments
+from utils.clock import evaluation_date, next_transition
+from utils.batch_classification import SENSITIVITY_BATCH_SIZE, async_classify_in_batches, classify_in_batches
+from utils.near_duplicates import NEAR_DUPLICATE_ITEM_THRESHOLD, cluster_representatives
+from utils.sensitivity_classifier import split_confident
+from utils.surrogate_model import FILE_TRANSFER_DATA_SENSITIVITY, FILE_TRANSFER_HEIGHTENED_RISK, consult_surrogate, observe_live_verdict
+from utils.verdict_store import sensitivity_labels
+from typing import Dict, Any, List, Set, Tuple, Union
+import asyncio
 import json
 from enum import Enum
 import datetime
-import os
 
 
 # Constants for risk assessment thresholds
@@ -23,34 +32,27 @@ DAYS_SINCE_MEDIUM_TRANSFER_RISK = 7
 HIGH_RISK_FILE_SIZE_MB = 100
 MEDIUM_RISK_FILE_SIZE_MB = 10
 
+# Item state store kind, and the field only the date-dependent scoring reads, which is left
+# out of a transfer's fingerprint so that the passing days re-score without re-enriching
+FILE_TRANSFER_STATE_KIND = "file_transfers"
+FILE_TRANSFER_DATE_FIELDS = ('timestamp',)
 
-def load_file_transfers(user_id: str) -> Dict[str, Any]:
+
+def load_file_transfers(user_id: str, since: datetime.date = None) -> Dict[str, Any]:
     """
     Load file transfer and access data associated with a given user ID from a JSON file.
 
     Args:
         user_id (str): The ID of the user whose file transfer data is to be loaded.
+        since (datetime.date): If given, only load the file transfers and accesses timestamped on or after this date;
+            the sqlite metadata backend filters in SQL.
 
     Returns:
         Dict[str, Any]: A dictionary containing the user's file transfer data, or None if the user is not found.
     """
-    # Get the directory of the current file
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-
-    # Construct the path to the mock_data directory
-    mock_data_dir = os.path.join(current_dir, '..', 'mock_data')
-
-    # Load the file transfer metadata for all employees
-    with open(os.path.join(mock_data_dir, 'file_transfer_metadata.json'), 'r') as f:
-        all_data = json.load(f)
-
-    # Find the specific employee's data
-    for employee in all_data['employees']:
-        if employee['user_id'] == user_id:
-            return employee
-
-    # Return None if the user is not found
-    return None
+    if since is not None:
+        return get_recent_metadata(FILE_TRANSFER_METADATA_FILE, user_id, since)
+    return get_metadata_store(FILE_TRANSFER_METADATA_FILE).get(user_id)
 
 
 def calculate_days_since_activity(activity_date: str) -> int:
@@ -63,13 +65,13 @@ def calculate_days_since_activity(activity_date: str) -> int:
     Returns:
         int: The number of days since the activity.
     """
-    today = datetime.date.today()
+    today = evaluation_date()
     activity_date = datetime.datetime.strptime(
         activity_date, "%Y-%m-%dT%H:%M:%SZ").date()
     return (today - activity_date).days
 
 
-def get_additional_context_from_ai(file_transfer: Dict[str, Any]) -> Dict[str, Any]:
+def get_additional_context_from_ai(file_transfer: Dict[str, Any], risk_factors_to_settle: List[Dict[FileTransferRiskFactor, FileTransferRiskLevel]] = None) -> Dict[str, Any]:
     """
     Get additional context for risk assessment using AI services.
 
@@ -78,15 +80,40 @@ def get_additional_context_from_ai(file_transfer: Dict[str, Any]) -> Dict[str, A
 
     Args:
         file_transfer (Dict[str, Any]): A dictionary containing file transfer metadata.
+        risk_factors_to_settle (List[Dict[FileTransferRiskFactor, FileTransferRiskLevel]]): The risk factors,
+            after the influencer adjustments, of the transfers this context is for. The heightened risk
+            assessment is skipped when it cannot change any of them; None always runs it.
 
     Returns:
         Dict[str, Any]: A dictionary containing external mitigation status and heightened risks.
     """
-    # Assess external mitigation
+    if not _heightened_risks_needed(risk_factors_to_settle):
+        return build_additional_context({})
 
     # Assess heightened risks
     heightened_risks = assess_file_transfer_heightened_risk(file_transfer)
 
+    return build_additional_context(heightened_risks)
+
+
+async def async_get_additional_context_from_ai(file_transfer: Dict[str, Any], risk_factors_to_settle: List[Dict[FileTransferRiskFactor, FileTransferRiskLevel]] = None) -> Dict[str, Any]:
+    if not _heightened_risks_needed(risk_factors_to_settle):
+        return build_additional_context({})
+
+    heightened_risks = await async_assess_file_transfer_heightened_risk(file_transfer)
+
+    return build_additional_context(heightened_risks)
+
+
+def _heightened_risks_needed(risk_factors_to_settle: List[Dict[FileTransferRiskFactor, FileTransferRiskLevel]]) -> bool:
+    if risk_factors_to_settle is None or any(
+            additional_context_can_change_file_transfer_risk(risk_factors) for risk_factors in risk_factors_to_settle):
+        return True
+    record_skipped(FILE_TRANSFER_HEIGHTENED_RISK)
+    return False
+
+
+def build_additional_context(heightened_risks: Dict[Any, FileTransferRiskLevel]) -> Dict[str, Any]:
     # Convert heightened risks to a more usable format
     processed_risks = {
         risk_vector.name: risk_level
@@ -98,7 +125,61 @@ def get_additional_context_from_ai(file_transfer: Dict[str, Any]) -> Dict[str, A
     }
 
 
-def evaluate_file_transfer_risk(file_transfer: Dict[str, Any]) -> Dict[str, Any]:
+def enrich_file_transfer(file_transfer: Dict[str, Any], data_sensitivity: FileTransferRiskLevel = None) -> Dict[str, Any]:
+    """
+    Run the AI-backed assessments for a file transfer.
+
+    Args:
+        file_transfer (Dict[str, Any]): A dictionary containing file transfer metadata.
+        data_sensitivity (FileTransferRiskLevel): An already assessed data sensitivity level, if any.
+
+    Returns:
+        Dict[str, Any]: The data sensitivity level and the additional context from AI services.
+    """
+    if data_sensitivity is None:
+        data_sensitivity = assess_data_sensitivity(
+            file_transfer['description'])
+    additional_context = get_additional_context_from_ai(file_transfer)
+
+    return {
+        "data_sensitivity": data_sensitivity,
+        "additional_context": additional_context
+    }
+
+
+async def async_enrich_file_transfer(file_transfer: Dict[str, Any], data_sensitivity: FileTransferRiskLevel = None) -> Dict[str, Any]:
+    if data_sensitivity is None:
+        data_sensitivity, additional_context = await asyncio.gather(
+            async_assess_data_sensitivity(file_transfer['description']),
+            async_get_additional_context_from_ai(file_transfer))
+    else:
+        additional_context = await async_get_additional_context_from_ai(file_transfer)
+
+    return {
+        "data_sensitivity": data_sensitivity,
+        "additional_context": additional_context
+    }
+
+
+def evaluate_file_transfer_risk(file_transfer: Dict[str, Any], data_sensitivity: FileTransferRiskLevel = None) -> Dict[str, Any]:
+    return score_file_transfer_risk(file_transfer, enrich_file_transfer(file_transfer, data_sensitivity))
+
+
+async def async_evaluate_file_transfer_risk(file_transfer: Dict[str, Any], data_sensitivity: FileTransferRiskLevel = None) -> Dict[str, Any]:
+    return score_file_transfer_risk(file_transfer, await async_enrich_file_transfer(file_transfer, data_sensitivity))
+
+
+def score_file_transfer_risk(file_transfer: Dict[str, Any], enrichment: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Score a file transfer from its metadata and the results of enrich_file_transfer.
+
+    Args:
+        file_transfer (Dict[str, Any]): A dictionary containing file transfer metadata.
+        enrichment (Dict[str, Any]): The AI assessments returned by enrich_file_transfer.
+
+    Returns:
+        Dict[str, Any]: The risk levels, justifications, mitigation strategies and additional context.
+    """
     # Calculate time-based metrics
     days_since_activity = calculate_days_since_activity(
         file_transfer['timestamp'])
@@ -112,21 +193,17 @@ def evaluate_file_transfer_risk(file_transfer: Dict[str, Any]) -> Dict[str, Any]
     }
 
     # Assess influencing factors
-    data_sensitivity = assess_data_sensitivity(file_transfer['description'])
+    data_sensitivity = enrichment['data_sensitivity']
     activity_type_risk = assess_activity_type_risk(
         file_transfer['activity_type'])
 
     # Store initial risk factors for justification
     initial_risk_factors = risk_factors.copy()
 
-    # Adjust risk factors
-    adjust_file_transfer_risk_factors_by_influencers(
-        risk_factors, data_sensitivity, activity_type_risk)
-
-    # Get additional context and further adjust risk factors
-    additional_context = get_additional_context_from_ai(file_transfer)
-    adjust_file_transfer_risk_factors_by_additional_context(
-        risk_factors, additional_context)
+    # Adjust risk factors by the influencers, then further with the additional context
+    additional_context = enrichment['additional_context']
+    adjust_file_transfer_risk_factors(
+        risk_factors, data_sensitivity, activity_type_risk, additional_context)
 
     justifications = {}
     mitigation_strategies = {}
@@ -148,7 +225,7 @@ def evaluate_file_transfer_risk(file_transfer: Dict[str, Any]) -> Dict[str, Any]
 
         if level != initial_level:
             justification += "\nRisk level was adjusted due to:"
-            if data_sensitivity != FileTransferRiskLevel.LOW:
+            if data_sensitivity not in (None, FileTransferRiskLevel.LOW):
                 justification += "\n- The transferred data is considered sensitive."
             if activity_type_risk != FileTransferRiskLevel.LOW:
                 justification += f"\n- The activity type '{file_transfer['activity_type']}' is considered risky."
@@ -170,6 +247,64 @@ def evaluate_file_transfer_risk(file_transfer: Dict[str, Any]) -> Dict[str, Any]
     }
 
 
+def assess_influenced_file_transfer_risk_factors(file_transfer: Dict[str, Any], data_sensitivity: FileTransferRiskLevel) -> Dict[FileTransferRiskFactor, FileTransferRiskLevel]:
+    """
+    The risk factors of a file transfer after the influencer adjustments, before the additional context.
+    """
+    risk_factors = {
+        FileTransferRiskFactor.DATA_EXFILTRATION: assess_base_data_exfiltration_risk(
+            calculate_days_since_activity(file_transfer['timestamp']), file_transfer['size_mb'], file_transfer),
+    }
+    adjust_file_transfer_risk_factors(
+        risk_factors, data_sensitivity, assess_activity_type_risk(file_transfer['activity_type']))
+    return risk_factors
+
+
+def data_sensitivity_can_change_file_transfer_risk(file_transfer: Dict[str, Any]) -> bool:
+    """
+    Whether the data sensitivity of a file transfer can change its risk, which it cannot once
+    the base level or the activity type alone make every risk factor HIGH.
+    """
+    outcomes = [assess_influenced_file_transfer_risk_factors(file_transfer, level) for level in FileTransferRiskLevel]
+    return any(outcome != outcomes[0] for outcome in outcomes[1:])
+
+
+def assess_file_transfer_risk_factors(file_transfer: Dict[str, Any], enrichment: Dict[str, Any]) -> Dict[FileTransferRiskFactor, FileTransferRiskLevel]:
+    """
+    The risk factors score_file_transfer_risk arrives at, without its justifications.
+    """
+    risk_factors = {
+        FileTransferRiskFactor.DATA_EXFILTRATION: assess_base_data_exfiltration_risk(
+            calculate_days_since_activity(file_transfer['timestamp']), file_transfer['size_mb'], file_transfer),
+    }
+    adjust_file_transfer_risk_factors(risk_factors, enrichment['data_sensitivity'],
+                                      assess_activity_type_risk(file_transfer['activity_type']),
+                                      enrichment['additional_context'])
+    return risk_factors
+
+
+def file_transfer_transition_dates(file_transfer: Dict[str, Any]) -> List[datetime.date]:
+    """
+    The dates on which the days since the transfer exceed a threshold of
+    assess_base_data_exfiltration_risk, the only dates its risk can change on.
+    """
+    activity_date = datetime.datetime.strptime(file_transfer['timestamp'], "%Y-%m-%dT%H:%M:%SZ").date()
+    return [activity_date + datetime.timedelta(days=threshold + 1)
+            for threshold in (DAYS_SINCE_HIGH_TRANSFER_RISK, DAYS_SINCE_MEDIUM_TRANSFER_RISK)]
+
+
+def next_file_transfer_transition(file_transfer: Dict[str, Any], enrichment: Dict[str, Any],
+                                  full_enrichment: bool) -> Union[datetime.date, None]:
+    """
+    The next date on which the passing days change the transfer's risk factors, or leave its
+    enrichment without an assessment that lazy enrichment skipped but that can then change them.
+    None if neither ever happens.
+    """
+    return next_transition(file_transfer_transition_dates(file_transfer), lambda: (
+        assess_file_transfer_risk_factors(file_transfer, enrichment),
+        enrichment_covers_file_transfer(file_transfer, enrichment, full_enrichment)))
+
+
 def assess_base_data_exfiltration_risk(days_since_activity: int, file_size_mb: float, file_transfer: Dict[str, Any]) -> FileTransferRiskLevel:
     if (days_since_activity <= DAYS_SINCE_HIGH_TRANSFER_RISK or file_size_mb >= HIGH_RISK_FILE_SIZE_MB) and 'personal' in file_transfer['location']['destination'].lower() or 'external' in file_transfer['sharing_status'].lower():
         return FileTransferRiskLevel.HIGH
@@ -179,8 +314,14 @@ def assess_base_data_exfiltration_risk(days_since_activity: int, file_size_mb: f
         return FileTransferRiskLevel.LOW
 
 
-def assess_data_sensitivity(description: str) -> FileTransferRiskLevel:
-    prompt = f"""
+DATA_SENSITIVITY_SUBJECT = "a file or data transfer"
+DATA_SENSITIVITY_GUIDELINES = """    - HIGH: Highly sensitive data (e.g., financial reports, product roadmaps, customer personal information)
+    - MEDIUM: Moderately sensitive data (e.g., internal business processes, project plans)
+    - LOW: Low sensitivity data (e.g., public information, general communications)"""
+
+
+def build_data_sensitivity_prompt(description: str) -> str:
+    return f"""
     Analyze the following description of a file or data transfer and assess its data sensitivity level. 
     Consider factors such as the type of data, potential impact if exposed, and regulatory implications.
 
@@ -193,16 +334,14 @@ def assess_data_sensitivity(description: str) -> FileTransferRiskLevel:
     }}
 
     Base your assessment on these guidelines:
-    - HIGH: Highly sensitive data (e.g., financial reports, product roadmaps, customer personal information)
-    - MEDIUM: Moderately sensitive data (e.g., internal business processes, project plans)
-    - LOW: Low sensitivity data (e.g., public information, general communications)
+{DATA_SENSITIVITY_GUIDELINES}
 
     Respond only with the JSON object, no additional text.
     """
 
+
+def parse_data_sensitivity_response(response: Any) -> FileTransferRiskLevel:
     try:
-        response = get_ai_chat_response(
-            prompt, ai_engine='openAI', response_format="json_object")
         if response and isinstance(response, list) and len(response) > 0:
             assessment = response[0]
             return FileTransferRiskLevel[assessment['risk_level'].upper()]
@@ -213,6 +352,70 @@ def assess_data_sensitivity(description: str) -> FileTransferRiskLevel:
     return FileTransferRiskLevel.MEDIUM
 
 
+def assess_data_sensitivity(description: str) -> FileTransferRiskLevel:
+    """
+    Assess the data sensitivity of a description, asking the AI provider only when neither
+    the local classifier nor the surrogate model is confident.
+    """
+    decided, _ = split_confident([description])
+    if description in decided:
+        return FileTransferRiskLevel[decided[description]]
+    surrogate_labels, check_live = consult_surrogate(FILE_TRANSFER_DATA_SENSITIVITY, description)
+    if not check_live:
+        return FileTransferRiskLevel[surrogate_labels['data_sensitivity']]
+    return assess_data_sensitivity_with_ai(description, surrogate_labels)
+
+
+async def async_assess_data_sensitivity(description: str) -> FileTransferRiskLevel:
+    decided, _ = split_confident([description])
+    if description in decided:
+        return FileTransferRiskLevel[decided[description]]
+    surrogate_labels, check_live = consult_surrogate(FILE_TRANSFER_DATA_SENSITIVITY, description)
+    if not check_live:
+        return FileTransferRiskLevel[surrogate_labels['data_sensitivity']]
+    return await async_assess_data_sensitivity_with_ai(description, surrogate_labels)
+
+
+def assess_data_sensitivity_with_ai(description: str, surrogate_labels: Dict[str, str] = None) -> FileTransferRiskLevel:
+    response = get_ai_chat_response(
+        build_data_sensitivity_prompt(description), ai_engine='openAI', response_format="json_object",
+        hedge=should_hedge('file_transfer_data_sensitivity'))
+    observe_live_verdict(FILE_TRANSFER_DATA_SENSITIVITY, description, sensitivity_labels(response), surrogate_labels)
+    return parse_data_sensitivity_response(response)
+
+
+async def async_assess_data_sensitivity_with_ai(description: str, surrogate_labels: Dict[str, str] = None) -> FileTransferRiskLevel:
+    response = await async_get_ai_chat_response(
+        build_data_sensitivity_prompt(description), ai_engine='openAI', response_format="json_object",
+        hedge=should_hedge('file_transfer_data_sensitivity'))
+    observe_live_verdict(FILE_TRANSFER_DATA_SENSITIVITY, description, sensitivity_labels(response), surrogate_labels)
+    return parse_data_sensitivity_response(response)
+
+
+def assess_data_sensitivity_batch(descriptions: List[str], batch_size: int = SENSITIVITY_BATCH_SIZE) -> Dict[str, FileTransferRiskLevel]:
+    """
+    Assess the data sensitivity of several descriptions with one AI request per batch.
+
+    Args:
+        descriptions (List[str]): The descriptions to assess.
+        batch_size (int): The maximum number of descriptions per request.
+
+    Returns:
+        Dict[str, FileTransferRiskLevel]: The sensitivity level for each distinct description.
+    """
+    return classify_in_batches(
+        descriptions, DATA_SENSITIVITY_SUBJECT, DATA_SENSITIVITY_GUIDELINES,
+        lambda level: FileTransferRiskLevel[level], assess_data_sensitivity_with_ai, batch_size, FILE_TRANSFER_DATA_SENSITIVITY)
+
+
+async def async_assess_data_sensitivity_batch(descriptions: List[str], batch_size: int = SENSITIVITY_BATCH_SIZE,
+                                              expired: Set[str] = None) -> Dict[str, FileTransferRiskLevel]:
+    return await async_classify_in_batches(
+        descriptions, DATA_SENSITIVITY_SUBJECT, DATA_SENSITIVITY_GUIDELINES,
+        lambda level: FileTransferRiskLevel[level], async_assess_data_sensitivity_with_ai, batch_size, FILE_TRANSFER_DATA_SENSITIVITY,
+        expired)
+
+
 def assess_activity_type_risk(activity_type: str) -> FileTransferRiskLevel:
     high_risk_activities = ['Bulk Transfer', 'Data Export']
     medium_risk_activities = ['File Sharing']
@@ -225,15 +428,283 @@ def assess_activity_type_risk(activity_type: str) -> FileTransferRiskLevel:
         return FileTransferRiskLevel.LOW
 
 
-def evaluate_overall_file_transfer_risk(user_id: str) -> Dict[str, Any]:
-    user_file_transfers = load_file_transfers(user_id)
+def cluster_file_transfers(file_transfers: List[Dict[str, Any]], threshold: float = NEAR_DUPLICATE_ITEM_THRESHOLD) -> List[int]:
+    """
+    Cluster file transfers whose activity, description, locations and sharing status are near-duplicates.
+
+    Returns:
+        List[int]: For each transfer, the index of the transfer whose additional context it shares.
+    """
+    return cluster_representatives(
+        [file_transfer_surrogate_input(file_transfer) for file_transfer in file_transfers], threshold, "file_transfers")
+
+
+def _descriptions_to_assess(file_transfers: List[Dict[str, Any]], full_enrichment: bool) -> List[str]:
+    """The descriptions whose data sensitivity can change the risk of a transfer that has them."""
+    descriptions = [file_transfer['description'] for file_transfer in file_transfers
+                    if full_enrichment or data_sensitivity_can_change_file_transfer_risk(file_transfer)]
+    record_skipped(FILE_TRANSFER_DATA_SENSITIVITY,
+                   len({file_transfer['description'] for file_transfer in file_transfers} - set(descriptions)))
+    return descriptions
+
+
+def _risk_factors_to_settle(file_transfers: List[Dict[str, Any]], sensitivities: Dict[str, FileTransferRiskLevel],
+                            representatives: List[int], full_enrichment: bool) -> Dict[int, List[Dict[FileTransferRiskFactor, FileTransferRiskLevel]]]:
+    """The influenced risk factors of the members of each cluster; empty under full enrichment, so that nothing is skipped."""
+    grouped = {}
+    if full_enrichment:
+        return grouped
+    for file_transfer, representative in zip(file_transfers, representatives):
+        grouped.setdefault(representative, []).append(assess_influenced_file_transfer_risk_factors(
+            file_transfer, sensitivities.get(file_transfer['description'])))
+    return grouped
+
+
+def enrich_file_transfers(file_transfers: List[Dict[str, Any]], sensitivity_batch_size: int = SENSITIVITY_BATCH_SIZE,
+                          full_enrichment: bool = False) -> List[Dict[str, Any]]:
+    """
+    Run the AI-backed assessments for several file transfers, sharing work between them.
+
+    Near-duplicate transfers share the additional context of their cluster's first transfer, and
+    the data sensitivity of all transfers is classified up front, several per request.
+
+    Returns:
+        List[Dict[str, Any]]: The enrichment of each file transfer, in the shape enrich_file_transfer returns.
+    """
+    representatives = cluster_file_transfers(file_transfers)
+
+    sensitivities = assess_data_sensitivity_batch(
+        _descriptions_to_assess(file_transfers, full_enrichment), sensitivity_batch_size)
+
+    risk_factors_to_settle = _risk_factors_to_settle(
+        file_transfers, sensitivities, representatives, full_enrichment)
+    additional_contexts = {index: get_additional_context_from_ai(file_transfers[index], risk_factors_to_settle.get(index))
+                           for index in dict.fromkeys(representatives)}
+
+    return [{
+        "data_sensitivity": sensitivities.get(file_transfer['description']),
+        "additional_context": additional_contexts[representative]
+    } for file_transfer, representative in zip(file_transfers, representatives)]
+
+
+async def async_enrich_file_transfers(file_transfers: List[Dict[str, Any]], sensitivity_batch_size: int = SENSITIVITY_BATCH_SIZE,
+                                      full_enrichment: bool = False) -> Tuple[List[Dict[str, Any]], List[bool]]:
+    """
+    Async variant of enrich_file_transfers; the assessments of all transfers run concurrently.
+
+    Under full enrichment the data sensitivity and heightened risk requests run concurrently;
+    otherwise the heightened risk requests wait for the data sensitivity verdicts they may be
+    skipped on. Inside utils.ai_service.ai_deadline, assessments still unanswered at the
+    deadline fall back to MEDIUM data sensitivity and LOW heightened risks.
+
+    Returns:
+        Tuple[List[Dict[str, Any]], List[bool]]: The enrichment of each file transfer, and
+        whether it rests on any of these fallbacks.
+    """
+    representatives = cluster_file_transfers(file_transfers)
+    unique_representatives = list(dict.fromkeys(representatives))
+    expired_descriptions = set()
+    if full_enrichment:
+        sensitivities, additional_contexts = await asyncio.gather(
+            async_assess_data_sensitivity_batch(
+                _descriptions_to_assess(file_transfers, full_enrichment), sensitivity_batch_size, expired_descriptions),
+            asyncio.gather(*(track_deadline(async_get_additional_context_from_ai(file_transfers[index]))
+                             for index in unique_representatives)))
+    else:
+        sensitivities = await async_assess_data_sensitivity_batch(
+            _descriptions_to_assess(file_transfers, full_enrichment), sensitivity_batch_size, expired_descriptions)
+        risk_factors_to_settle = _risk_factors_to_settle(
+            file_transfers, sensitivities, representatives, full_enrichment)
+        additional_contexts = await asyncio.gather(
+            *(track_deadline(async_get_additional_context_from_ai(file_transfers[index], risk_factors_to_settle[index]))
+              for index in unique_representatives))
+    # (context, whether it was cut short by the deadline) per representative
+    additional_contexts = dict(zip(unique_representatives, additional_contexts))
+
+    enrichments = [{
+        "data_sensitivity": sensitivities.get(file_transfer['description']),
+        "additional_context": additional_contexts[representative][0]
+    } for file_transfer, representative in zip(file_transfers, representatives)]
+    partial = [file_transfer['description'] in expired_descriptions or additional_contexts[representative][1]
+               for file_transfer, representative in zip(file_transfers, representatives)]
+    return enrichments, partial
+
+
+def file_transfer_fingerprint(file_transfer: Dict[str, Any]) -> str:
+    """Fingerprint of the fields a file transfer's enrichment depends on."""
+    return fingerprint(file_transfer, FILE_TRANSFER_DATE_FIELDS)
+
+
+def decode_enrichment(state: Dict[str, Any]) -> Dict[str, Any]:
+    """The enrichment stored by the item state store, i.e. passed through enum_to_str, with its enums restored."""
+    return {
+        "data_sensitivity": FileTransferRiskLevel[state['data_sensitivity']] if state['data_sensitivity'] else None,
+        "additional_context": {
+            "heightened_risks": {vector: FileTransferRiskLevel[level]
+                                 for vector, level in state['additional_context']['heightened_risks'].items()}
+        }
+    }
+
+
+def enrichment_covers_file_transfer(file_transfer: Dict[str, Any], enrichment: Dict[str, Any], full_enrichment: bool) -> bool:
+    """
+    Whether an enrichment has every assessment that can change the transfer's risk today.
+    An assessment skipped by lazy enrichment may matter once time moves the transfer out of
+    the HIGH level.
+    """
+    data_sensitivity = enrichment['data_sensitivity']
+    heightened_risks = enrichment['additional_context']['heightened_risks']
+    if data_sensitivity is not None and heightened_risks:
+        return True
+    if full_enrichment:
+        return False
+
+    if data_sensitivity is None and data_sensitivity_can_change_file_transfer_risk(file_transfer):
+        return False
+    if not heightened_risks and additional_context_can_change_file_transfer_risk(
+            assess_influenced_file_transfer_risk_factors(file_transfer, data_sensitivity)):
+        return False
+    return True
+
+
+def reusable_enrichment(file_transfer: Dict[str, Any], state: Dict[str, Any], full_enrichment: bool) -> Union[Dict[str, Any], None]:
+    """A stored enrichment, unless it lacks an assessment that can now change the transfer's risk."""
+    enrichment = decode_enrichment(state)
+    return enrichment if enrichment_covers_file_transfer(file_transfer, enrichment, full_enrichment) else None
+
+
+def schedule_file_transfer_transitions(file_transfers: List[Dict[str, Any]], enrichments: List[Dict[str, Any]],
+                                       evaluations: List[Dict[str, Any]], full_enrichment: bool,
+                                       partial: List[bool] = None) -> Dict[int, Tuple[str, Union[datetime.date, None]]]:
+    """
+    The highest risk level and next transition date of each file transfer, for the item state
+    store. Partially evaluated transfers are due again today.
+    """
+    if not item_state_enabled():
+        return {}
+    if partial is None:
+        partial = [False] * len(file_transfers)
+    return {index: (max(evaluation['risk_levels'].values(), key=lambda x: x.value).name,
+                    evaluation_date() if partially_evaluated
+                    else next_file_transfer_transition(file_transfer, enrichment, full_enrichment))
+            for index, (file_transfer, enrichment, evaluation, partially_evaluated)
+            in enumerate(zip(file_transfers, enrichments, evaluations, partial))}
+
+
+def _reuse_enrichments(user_id: str, file_transfers: List[Dict[str, Any]], fingerprints: List[str],
+                       full_enrichment: bool) -> List[Union[Dict[str, Any], None]]:
+    return reuse_enrichments(FILE_TRANSFER_STATE_KIND, user_id, file_transfers, 'activity_id', fingerprints,
+                             lambda file_transfer, state: reusable_enrichment(file_transfer, state, full_enrichment))
+
+
+def evaluate_overall_file_transfer_risk(user_id: str, user_file_transfers: Dict[str, Any] = None, sensitivity_batch_size: int = SENSITIVITY_BATCH_SIZE,
+                                        full_enrichment: bool = None, since: datetime.date = None) -> Dict[str, Any]:
+    """
+    Evaluate the risk of all file transfers of a user.
+
+    Only transfers that are new, or whose fingerprinted fields changed since the last run, are
+    enriched; the others reuse the enrichment kept in the item state store. Every transfer is
+    scored afresh, as its risk depends on today's date, and the date its risk next changes on is
+    stored for core.transition_sweep.
+
+    Args:
+        user_id (str): The ID of the user.
+        user_file_transfers (Dict[str, Any]): The user's file transfer metadata, loaded from the metadata store if None.
+        sensitivity_batch_size (int): The maximum number of descriptions per data sensitivity request.
+        full_enrichment (bool): Run AI assessments that cannot change a risk level too, so that the
+            justifications and additional context are complete; FULL_ENRICHMENT by default.
+        since (datetime.date): If given, only evaluate the file transfers made on or after this
+            date, filtered in SQL with the sqlite metadata backend; `user_file_transfers` then holds
+            only those. The stored state of the user's other transfers is kept.
+
+    Returns:
+        Dict[str, Any]: The evaluated file transfers grouped by their highest risk level.
+    """
+    if full_enrichment is None:
+        full_enrichment = FULL_ENRICHMENT
+    if user_file_transfers is None:
+        user_file_transfers = load_file_transfers(user_id, since)
+    if not user_file_transfers:
+        return {"error": "User not found"}
+
+    file_transfers = user_file_transfers['files_and_transfers']
+    fingerprints = [file_transfer_fingerprint(file_transfer) for file_transfer in file_transfers]
+    enrichments = _reuse_enrichments(user_id, file_transfers, fingerprints, full_enrichment)
+    stale = [index for index, enrichment in enumerate(enrichments) if enrichment is None]
+    if stale:
+        # Queue this employee's AI requests fairly against other employees'
+        with ai_tenant(user_id):
+            fresh = enrich_file_transfers([file_transfers[index] for index in stale],
+                                          sensitivity_batch_size, full_enrichment)
+        for index, enrichment in zip(stale, fresh):
+            enrichments[index] = enrichment
+
+    evaluations = [score_file_transfer_risk(file_transfer, enrichment)
+                   for file_transfer, enrichment in zip(file_transfers, enrichments)]
+    store_enrichments(FILE_TRANSFER_STATE_KIND, user_id, file_transfers, 'activity_id', fingerprints,
+                      {index: enum_to_str(enrichments[index]) for index in stale},
+                      schedule_file_transfer_transitions(file_transfers, enrichments, evaluations, full_enrichment),
+                      get_metadata_item_ids(FILE_TRANSFER_METADATA_FILE, user_id) if since is not None else None)
+    return summarize_file_transfer_risks(file_transfers, evaluations)
+
+
+async def async_evaluate_overall_file_transfer_risk(user_id: str, user_file_transfers: Dict[str, Any] = None, sensitivity_batch_size: int = SENSITIVITY_BATCH_SIZE,
+                                                    full_enrichment: bool = None, since: datetime.date = None) -> Dict[str, Any]:
+    """
+    Async variant of evaluate_overall_file_transfer_risk.
+
+    The AI enrichment of all file transfers runs concurrently, bounded by the per-provider
+    concurrency limits in utils.ai_service. The result is identical to the sync path, except
+    that inside utils.ai_service.ai_deadline the transfers whose assessments missed the
+    deadline are scored on fallback values and marked partial. Their enrichment is not stored.
+    """
+    if full_enrichment is None:
+        full_enrichment = FULL_ENRICHMENT
+    if user_file_transfers is None:
+        user_file_transfers = load_file_transfers(user_id, since)
     if not user_file_transfers:
         return {"error": "User not found"}
 
+    file_transfers = user_file_transfers['files_and_transfers']
+    fingerprints = [file_transfer_fingerprint(file_transfer) for file_transfer in file_transfers]
+    enrichments = _reuse_enrichments(user_id, file_transfers, fingerprints, full_enrichment)
+    stale = [index for index, enrichment in enumerate(enrichments) if enrichment is None]
+    partial = [False] * len(file_transfers)
+    if stale:
+        with ai_tenant(user_id):
+            fresh, fresh_partial = await async_enrich_file_transfers(
+                [file_transfers[index] for index in stale], sensitivity_batch_size, full_enrichment)
+        for index, enrichment, partially_evaluated in zip(stale, fresh, fresh_partial):
+            enrichments[index] = enrichment
+            partial[index] = partially_evaluated
+
+    evaluations = [score_file_transfer_risk(file_transfer, enrichment)
+                   for file_transfer, enrichment in zip(file_transfers, enrichments)]
+    store_enrichments(FILE_TRANSFER_STATE_KIND, user_id, file_transfers, 'activity_id', fingerprints,
+                      {index: enum_to_str(enrichments[index]) for index in stale if not partial[index]},
+                      schedule_file_transfer_transitions(file_transfers, enrichments, evaluations, full_enrichment, partial),
+                      get_metadata_item_ids(FILE_TRANSFER_METADATA_FILE, user_id) if since is not None else None)
+    return summarize_file_transfer_risks(file_transfers, evaluations, partial)
+
+
+def summarize_file_transfer_risks(file_transfers: List[Dict[str, Any]], evaluations: List[Dict[str, Any]], partial: List[bool] = None) -> Dict[str, Any]:
+    """
+    Group evaluated file transfers by their highest risk level.
+
+    Args:
+        file_transfers (List[Dict[str, Any]]): The file transfers' metadata.
+        evaluations (List[Dict[str, Any]]): The result of score_file_transfer_risk for each file transfer.
+        partial (List[bool]): For each file transfer, whether it was scored on fallback values
+            because its AI assessments missed the deadline; none were by default.
+
+    Returns:
+        Dict[str, Any]: The file transfers under 'low', 'medium' and 'high'.
+    """
     overall_risk = {level: [] for level in FileTransferRiskLevel}
+    if partial is None:
+        partial = [False] * len(file_transfers)
 
-    for file_transfer in user_file_transfers['files_and_transfers']:
-        risk_evaluation = evaluate_file_transfer_risk(file_transfer)
+    for file_transfer, risk_evaluation, partially_evaluated in zip(file_transfers, evaluations, partial):
         risk_level = max(
             risk_evaluation['risk_levels'].values(), key=lambda x: x.value)
 
@@ -244,7 +715,8 @@ def evaluate_overall_file_transfer_risk(user_id: str) -> Dict[str, Any]:
             'risk_factors': {factor.name: level.name for factor, level in risk_evaluation['risk_levels'].items()},
             'justifications': risk_evaluation['justifications'],
             'mitigation_strategies': risk_evaluation['mitigation_strategies'],
-            'additional_context': risk_evaluation['additional_context']
+            'additional_context': risk_evaluation['additional_context'],
+            'partial': partially_evaluated
         })
 
     result = {level.name.lower(): activities for level,
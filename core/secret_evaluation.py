@@ -5,16 +5,27 @@ This module provides functionality to assess the risk associated with an employe
 focusing on their access to sensitive information and secrets.
 """
 
+import asyncio
 import datetime
 from enum import Enum
 import json
 import os
-from typing import Dict, Any
+from typing import Dict, Any, List, Set, Tuple, Union
 
-from utils.ai_service import get_ai_chat_response
-from external_risk_assessment.secret_risk_assessment import assess_external_mitigation, assess_heightened_risk
+from utils.ai_service import ai_tenant, async_get_ai_chat_response, get_ai_chat_response, should_hedge, track_deadline
+from external_risk_assessment.secret_risk_assessment import assess_external_mitigation, assess_heightened_risk, assess_secret_enrichment_fused, async_assess_external_mitigation, async_assess_heightened_risk, async_assess_secret_enrichment_fused, heightened_risk_surrogate_input
 from models.secret_risk_models import RISK_MITIGATION_STRATEGIES, MitigationStatus, RiskFactor, RiskLevel
-from utils.secret_risk_adjustment_helper import adjust_risk_factors_by_additional_context, adjust_risk_factors_by_influencers
+from utils.secret_risk_adjustment_helper import external_mitigation_can_change_risk, heightened_risks_can_change_risk
+from utils.risk_adjustment_tables import adjust_secret_risk_factors
+from utils.metadata_store import SECRET_METADATA_FILE, get_metadata_item_ids, get_metadata_store, get_recent_metadata
+from utils.lazy_enrichment import FULL_ENRICHMENT, record_skipped
+from utils.item_state import fingerprint, item_state_enabled, reuse_enrichments, store_enrichments
+from utils.clock import evaluation_date, next_transition
+from utils.batch_classification import SENSITIVITY_BATCH_SIZE, async_classify_in_batches, classify_in_batches
+from utils.near_duplicates import NEAR_DUPLICATE_ITEM_THRESHOLD, cluster_representatives
+from utils.sensitivity_classifier import split_confident
+from utils.surrogate_model import SECRET_DATA_SENSITIVITY, SECRET_HEIGHTENED_RISK, consult_surrogate, observe_live_verdict
+from utils.verdict_store import sensitivity_labels
 
 
 # Constants for risk assessment thresholds
@@ -23,34 +34,35 @@ MID_ROTATION_THRESHOLD = 30
 DAYS_SINCE_HIGH_ACCESS_RISK = 7
 DAYS_SINCE_MEDIUM_ACCESS_RISK = 30
 
+# Enrichment modes: "separate" asks the data sensitivity, external mitigation and
+# heightened risk questions in separate AI requests, "fused" asks them in one
+ENRICHMENT_MODE_SEPARATE = "separate"
+ENRICHMENT_MODE_FUSED = "fused"
+ENRICHMENT_MODES = (ENRICHMENT_MODE_SEPARATE, ENRICHMENT_MODE_FUSED)
+SECRET_ENRICHMENT_MODE = os.environ.get(
+    "SECRET_ENRICHMENT_MODE", ENRICHMENT_MODE_SEPARATE)
 
-def load_secrets(user_id: str) -> Dict[str, Any]:
+# Item state store kind, and the fields only the date-dependent scoring reads, which are
+# left out of a secret's fingerprint so that a new access date re-scores without re-enriching
+SECRET_STATE_KIND = "secrets"
+SECRET_DATE_FIELDS = ('next_rotation_date', 'last_accessed')
+
+
+def load_secrets(user_id: str, since: datetime.date = None) -> Dict[str, Any]:
     """
     Load secrets associated with a given user ID from a JSON file.
 
     Args:
         user_id (str): The ID of the user whose secrets are to be loaded.
+        since (datetime.date): If given, only load the secrets last accessed on or after this date;
+            the sqlite metadata backend filters in SQL.
 
     Returns:
         Dict[str, Any]: A dictionary containing the user's secrets, or None if the user is not found.
     """
-    # Get the directory of the current file
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-
-    # Construct the path to the mock_data directory
-    mock_data_dir = os.path.join(current_dir, '..', 'mock_data')
-
-    # Load the secret metadata for all employees
-    with open(os.path.join(mock_data_dir, 'secret_metadata.json'), 'r') as f:
-        all_data = json.load(f)
-
-    # Find the specific employee's data
-    for employee in all_data['employees']:
-        if employee['user_id'] == user_id:
-            return employee
-
-    # Return None if the user is not found
-    return None
+    if since is not None:
+        return get_recent_metadata(SECRET_METADATA_FILE, user_id, since)
+    return get_metadata_store(SECRET_METADATA_FILE).get(user_id)
 
 
 def calculate_days_until_rotation(next_rotation_date: str) -> int:
@@ -65,13 +77,28 @@ def calculate_days_until_rotation(next_rotation_date: str) -> int:
     """
     if not next_rotation_date:
         return 365 * 5  # 5 years (arbitrary large value for no rotation)
-    today = datetime.date.today()
+    today = evaluation_date()
     rotation_date = datetime.datetime.strptime(
         next_rotation_date, "%Y-%m-%d").date()
     return (rotation_date - today).days
 
 
-def get_additional_context_from_perplexity(secret: Dict[str, Any]) -> Dict[str, Any]:
+def calculate_days_since_last_access(last_accessed: str) -> int:
+    """
+    Calculate the number of days since a secret was last accessed.
+
+    Args:
+        last_accessed (str): The date of the last access in 'YYYY-MM-DD' format.
+
+    Returns:
+        int: The number of days since the last access.
+    """
+    today = evaluation_date()
+    last_accessed = datetime.datetime.strptime(last_accessed, "%Y-%m-%d").date()
+    return (today - last_accessed).days
+
+
+def get_additional_context_from_perplexity(secret: Dict[str, Any], risk_factors_to_settle: List[Dict[RiskFactor, RiskLevel]] = None) -> Dict[str, Any]:
     """
     Get additional context for risk assessment using Perplexity AI.
 
@@ -80,16 +107,75 @@ def get_additional_context_from_perplexity(secret: Dict[str, Any]) -> Dict[str,
 
     Args:
         secret (Dict[str, Any]): A dictionary containing secret metadata.
+        risk_factors_to_settle (List[Dict[RiskFactor, RiskLevel]]): The risk factors, after the influencer
+            adjustments, of the secrets this context is for. Assessments that cannot change any of them
+            are skipped and reported as None (mitigation) or empty (heightened risks); None runs both.
 
     Returns:
         Dict[str, Any]: A dictionary containing external mitigation status and heightened risks.
     """
+    if risk_factors_to_settle is None:
+        return build_additional_context(assess_external_mitigation(secret), assess_heightened_risk(secret))
+
     # Assess external mitigation
-    mitigation_status = assess_external_mitigation(secret)
+    mitigation_status = None
+    if _external_mitigation_needed(risk_factors_to_settle):
+        mitigation_status = assess_external_mitigation(secret)
 
     # Assess heightened risks
-    heightened_risks = assess_heightened_risk(secret)
+    heightened_risks = {}
+    if _heightened_risks_needed(risk_factors_to_settle, mitigation_status):
+        heightened_risks = assess_heightened_risk(secret)
+
+    return build_additional_context(mitigation_status, heightened_risks)
+
+
+async def async_get_additional_context_from_perplexity(secret: Dict[str, Any], risk_factors_to_settle: List[Dict[RiskFactor, RiskLevel]] = None) -> Dict[str, Any]:
+    """
+    Async variant of get_additional_context_from_perplexity that runs both Perplexity
+    assessments concurrently, unless whether the heightened risks are needed depends on
+    the external mitigation.
+    """
+    if risk_factors_to_settle is None:
+        mitigation_status, heightened_risks = await asyncio.gather(
+            async_assess_external_mitigation(secret),
+            async_assess_heightened_risk(secret))
+        return build_additional_context(mitigation_status, heightened_risks)
+
+    mitigation_needed = _external_mitigation_needed(risk_factors_to_settle)
+    if mitigation_needed and not any(heightened_risks_can_change_risk(risk_factors) for risk_factors in risk_factors_to_settle):
+        # Every level is HIGH, and only a present mitigation can bring them back within reach of the heightened risks
+        mitigation_status = await async_assess_external_mitigation(secret)
+        heightened_risks = {}
+        if _heightened_risks_needed(risk_factors_to_settle, mitigation_status):
+            heightened_risks = await async_assess_heightened_risk(secret)
+    else:
+        mitigation_status, heightened_risks = await asyncio.gather(
+            async_assess_external_mitigation(secret) if mitigation_needed else _resolved(None),
+            async_assess_heightened_risk(secret) if _heightened_risks_needed(risk_factors_to_settle, None) else _resolved({}))
+
+    return build_additional_context(mitigation_status, heightened_risks)
+
 
+async def _resolved(value: Any) -> Any:
+    return value
+
+
+def _external_mitigation_needed(risk_factors_to_settle: List[Dict[RiskFactor, RiskLevel]]) -> bool:
+    if any(external_mitigation_can_change_risk(risk_factors) for risk_factors in risk_factors_to_settle):
+        return True
+    record_skipped('secret_external_mitigation')
+    return False
+
+
+def _heightened_risks_needed(risk_factors_to_settle: List[Dict[RiskFactor, RiskLevel]], mitigation_status: MitigationStatus) -> bool:
+    if any(heightened_risks_can_change_risk(risk_factors, mitigation_status) for risk_factors in risk_factors_to_settle):
+        return True
+    record_skipped(SECRET_HEIGHTENED_RISK)
+    return False
+
+
+def build_additional_context(mitigation_status: MitigationStatus, heightened_risks: Dict[Any, RiskLevel]) -> Dict[str, Any]:
     # Convert heightened risks to a more usable format
     processed_risks = {
         risk_vector.name: risk_level
@@ -102,12 +188,93 @@ def get_additional_context_from_perplexity(secret: Dict[str, Any]) -> Dict[str,
     }
 
 
-def evaluate_secret_risk(secret: Dict[str, Any]) -> Dict[str, Any]:
+def enrich_secret(secret: Dict[str, Any], data_sensitivity: RiskLevel = None) -> Dict[str, Any]:
+    """
+    Run the AI-backed assessments for a secret.
+
+    Args:
+        secret (Dict[str, Any]): A dictionary containing secret metadata.
+        data_sensitivity (RiskLevel): An already assessed data sensitivity level, if any.
+
+    Returns:
+        Dict[str, Any]: The data sensitivity level and the additional context from Perplexity.
+    """
+    if data_sensitivity is None:
+        data_sensitivity = assess_data_sensitivity(secret['description'])
+    additional_context = get_additional_context_from_perplexity(secret)
+
+    return {
+        "data_sensitivity": data_sensitivity,
+        "additional_context": additional_context
+    }
+
+
+async def async_enrich_secret(secret: Dict[str, Any], data_sensitivity: RiskLevel = None) -> Dict[str, Any]:
+    if data_sensitivity is None:
+        data_sensitivity, additional_context = await asyncio.gather(
+            async_assess_data_sensitivity(secret['description']),
+            async_get_additional_context_from_perplexity(secret))
+    else:
+        additional_context = await async_get_additional_context_from_perplexity(secret)
+
+    return {
+        "data_sensitivity": data_sensitivity,
+        "additional_context": additional_context
+    }
+
+
+def enrich_secret_fused(secret: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Run the AI-backed assessments for a secret with a single fused request.
+
+    Args:
+        secret (Dict[str, Any]): A dictionary containing secret metadata.
+
+    Returns:
+        Dict[str, Any]: The data sensitivity level and the additional context, in the same shape as enrich_secret.
+    """
+    data_sensitivity, mitigation_status, heightened_risks = assess_secret_enrichment_fused(
+        secret)
+
+    return {
+        "data_sensitivity": data_sensitivity,
+        "additional_context": build_additional_context(mitigation_status, heightened_risks)
+    }
+
+
+async def async_enrich_secret_fused(secret: Dict[str, Any]) -> Dict[str, Any]:
+    data_sensitivity, mitigation_status, heightened_risks = await async_assess_secret_enrichment_fused(secret)
+
+    return {
+        "data_sensitivity": data_sensitivity,
+        "additional_context": build_additional_context(mitigation_status, heightened_risks)
+    }
+
+
+def evaluate_secret_risk(secret: Dict[str, Any], data_sensitivity: RiskLevel = None) -> Dict[str, Any]:
+    return score_secret_risk(secret, enrich_secret(secret, data_sensitivity))
+
+
+async def async_evaluate_secret_risk(secret: Dict[str, Any], data_sensitivity: RiskLevel = None) -> Dict[str, Any]:
+    return score_secret_risk(secret, await async_enrich_secret(secret, data_sensitivity))
+
+
+def score_secret_risk(secret: Dict[str, Any], enrichment: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Score a secret from its metadata and the results of enrich_secret.
+
+    Args:
+        secret (Dict[str, Any]): A dictionary containing secret metadata.
+        enrichment (Dict[str, Any]): The AI assessments returned by enrich_secret.
+
+    Returns:
+        Dict[str, Any]: The risk levels, justifications, mitigation strategies and additional context.
+    """
     # Calculate time-based metrics
     days_until_rotation = calculate_days_until_rotation(
         secret['next_rotation_date'])
-    days_since_last_access = (datetime.date.today(
-    ) - datetime.datetime.strptime(secret['last_accessed'], "%Y-%m-%d").date()).days
+    days_since_last_access = calculate_days_since_last_access(
+        secret['last_accessed'])
 
     # Assess base risk levels
     persistent_access_risk = assess_base_persistent_access_risk(
@@ -119,18 +286,15 @@ def evaluate_secret_risk(secret: Dict[str, Any]) -> Dict[str, Any]:
 
     # Assess influencing factors
     service_criticality = assess_service_criticality(secret['service'])
-    data_sensitivity = assess_data_sensitivity(secret['description'])
+    data_sensitivity = enrichment['data_sensitivity']
 
     # Store initial risk factors for justification
     initial_risk_factors = risk_factors.copy()
 
-    # Adjust risk factors
-    adjust_risk_factors_by_influencers(
-        risk_factors, service_criticality, data_sensitivity)
-
-    # Get additional context and further adjust risk factors
-    additional_context = get_additional_context_from_perplexity(secret)
-    adjust_risk_factors_by_additional_context(risk_factors, additional_context)
+    # Adjust risk factors by the influencers, then further with the additional context
+    additional_context = enrichment['additional_context']
+    adjust_secret_risk_factors(
+        risk_factors, service_criticality, data_sensitivity, additional_context)
 
     justifications = {}
     mitigation_strategies = {}
@@ -140,11 +304,6 @@ def evaluate_secret_risk(secret: Dict[str, Any]) -> Dict[str, Any]:
         justification = f"{factor.name}: {level.name}\n"
 
         if factor == RiskFactor.PERSISTENT_ACCESS_RISK:
-            days_until_rotation = calculate_days_until_rotation(
-                secret['next_rotation_date'])
-            days_since_last_access = (datetime.date.today(
-            ) - datetime.datetime.strptime(secret['last_accessed'], "%Y-%m-%d").date()).days
-
             justification += f"This secret was last accessed {days_since_last_access} days ago"
             if days_until_rotation == 365 * 5:  # If it's our arbitrary large value
                 justification += " and is not scheduled for rotation."
@@ -160,11 +319,11 @@ def evaluate_secret_risk(secret: Dict[str, Any]) -> Dict[str, Any]:
             justification += "\nRisk level was adjusted due to:"
             if service_criticality != RiskLevel.LOW:
                 justification += f"\n- The service '{secret['service']}' is considered critical."
-            if data_sensitivity != RiskLevel.LOW:
+            if data_sensitivity not in (None, RiskLevel.LOW):
                 justification += f"\n- The data accessed is considered sensitive."
 
             external_mitigation = additional_context['external_mitigation']
-            if external_mitigation != MitigationStatus.ABSENT:
+            if external_mitigation not in (None, MitigationStatus.ABSENT):
                 justification += f"\n- There are some external mitigation measures in place."
 
             heightened_risks = additional_context['heightened_risks']
@@ -184,6 +343,72 @@ def evaluate_secret_risk(secret: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
+def assess_influenced_risk_factors(secret: Dict[str, Any], data_sensitivity: RiskLevel) -> Dict[RiskFactor, RiskLevel]:
+    """
+    The risk factors of a secret after the influencer adjustments, before the additional context.
+    """
+    days_since_last_access = calculate_days_since_last_access(
+        secret['last_accessed'])
+    risk_factors = {
+        RiskFactor.PERSISTENT_ACCESS_RISK: assess_base_persistent_access_risk(
+            calculate_days_until_rotation(secret['next_rotation_date']), days_since_last_access),
+    }
+    adjust_secret_risk_factors(
+        risk_factors, assess_service_criticality(secret['service']), data_sensitivity)
+    return risk_factors
+
+
+def data_sensitivity_can_change_secret_risk(secret: Dict[str, Any]) -> bool:
+    """
+    Whether the data sensitivity of a secret can change its risk, which it cannot once the
+    base level and the service criticality alone make every risk factor HIGH.
+    """
+    outcomes = [assess_influenced_risk_factors(secret, level) for level in RiskLevel]
+    return any(outcome != outcomes[0] for outcome in outcomes[1:])
+
+
+def assess_secret_risk_factors(secret: Dict[str, Any], enrichment: Dict[str, Any]) -> Dict[RiskFactor, RiskLevel]:
+    """
+    The risk factors score_secret_risk arrives at, without its justifications.
+    """
+    risk_factors = {
+        RiskFactor.PERSISTENT_ACCESS_RISK: assess_base_persistent_access_risk(
+            calculate_days_until_rotation(secret['next_rotation_date']),
+            calculate_days_since_last_access(secret['last_accessed'])),
+    }
+    adjust_secret_risk_factors(risk_factors, assess_service_criticality(secret['service']),
+                               enrichment['data_sensitivity'], enrichment['additional_context'])
+    return risk_factors
+
+
+def secret_transition_dates(secret: Dict[str, Any]) -> List[datetime.date]:
+    """
+    The dates on which one of the secret's day counts crosses a threshold of
+    assess_base_persistent_access_risk, the only dates its risk can change on.
+    """
+    dates = []
+    if secret['next_rotation_date']:
+        rotation_date = datetime.datetime.strptime(secret['next_rotation_date'], "%Y-%m-%d").date()
+        # Days until rotation stop exceeding a threshold once they are down to it
+        dates += [rotation_date - datetime.timedelta(days=threshold)
+                  for threshold in (HIGH_ROTATION_THRESHOLD, MID_ROTATION_THRESHOLD)]
+    last_accessed = datetime.datetime.strptime(secret['last_accessed'], "%Y-%m-%d").date()
+    # Days since the last access stop being below a threshold once they reach it
+    dates += [last_accessed + datetime.timedelta(days=threshold)
+              for threshold in (DAYS_SINCE_HIGH_ACCESS_RISK, DAYS_SINCE_MEDIUM_ACCESS_RISK)]
+    return dates
+
+
+def next_secret_transition(secret: Dict[str, Any], enrichment: Dict[str, Any], full_enrichment: bool) -> Union[datetime.date, None]:
+    """
+    The next date on which the passing days change the secret's risk factors, or leave its
+    enrichment without an assessment that lazy enrichment skipped but that can then change them.
+    None if neither ever happens.
+    """
+    return next_transition(secret_transition_dates(secret), lambda: (
+        assess_secret_risk_factors(secret, enrichment), enrichment_covers_secret(secret, enrichment, full_enrichment)))
+
+
 def assess_base_persistent_access_risk(days_until_rotation: int, days_since_last_access: int) -> RiskLevel:
     return (
         RiskLevel.HIGH if days_until_rotation > HIGH_ROTATION_THRESHOLD and days_since_last_access < DAYS_SINCE_HIGH_ACCESS_RISK
@@ -196,8 +421,14 @@ def assess_service_criticality(service: str) -> RiskLevel:
     return RiskLevel.HIGH if 'production' in service.lower() else RiskLevel.MEDIUM
 
 
-def assess_data_sensitivity(description: str) -> RiskLevel:
-    prompt = f"""
+DATA_SENSITIVITY_SUBJECT = "a secret or sensitive information"
+DATA_SENSITIVITY_GUIDELINES = """    - HIGH: Highly sensitive data (e.g., customer personal information, payment details, trade secrets)
+    - MEDIUM: Moderately sensitive data (e.g., internal business processes, proprietary but non-critical information)
+    - LOW: Low sensitivity data (e.g., publicly available information, non-confidential internal data)"""
+
+
+def build_data_sensitivity_prompt(description: str) -> str:
+    return f"""
     Analyze the following description of a secret or sensitive information and assess its data sensitivity level. 
     Consider factors such as the type of data, potential impact if exposed, and regulatory implications.
 
@@ -210,16 +441,14 @@ def assess_data_sensitivity(description: str) -> RiskLevel:
     }}
 
     Base your assessment on these guidelines:
-    - HIGH: Highly sensitive data (e.g., customer personal information, payment details, trade secrets)
-    - MEDIUM: Moderately sensitive data (e.g., internal business processes, proprietary but non-critical information)
-    - LOW: Low sensitivity data (e.g., publicly available information, non-confidential internal data)
+{DATA_SENSITIVITY_GUIDELINES}
 
     Respond only with the JSON object, no additional text.
     """
 
+
+def parse_data_sensitivity_response(response: Any) -> RiskLevel:
     try:
-        response = get_ai_chat_response(
-            prompt, ai_engine='openAI', response_format="json_object")
         if response and isinstance(response, list) and len(response) > 0:
             assessment = response[0]
             return RiskLevel[assessment['risk_level'].upper()]
@@ -230,15 +459,371 @@ def assess_data_sensitivity(description: str) -> RiskLevel:
     return RiskLevel.MEDIUM
 
 
-def evaluate_overall_secret_risk(user_id: str) -> Dict[str, Any]:
-    user_secrets = load_secrets(user_id)
+def assess_data_sensitivity(description: str) -> RiskLevel:
+    """
+    Assess the data sensitivity of a description, asking the AI provider only when neither
+    the local classifier nor the surrogate model is confident.
+    """
+    decided, _ = split_confident([description])
+    if description in decided:
+        return RiskLevel[decided[description]]
+    surrogate_labels, check_live = consult_surrogate(SECRET_DATA_SENSITIVITY, description)
+    if not check_live:
+        return RiskLevel[surrogate_labels['data_sensitivity']]
+    return assess_data_sensitivity_with_ai(description, surrogate_labels)
+
+
+async def async_assess_data_sensitivity(description: str) -> RiskLevel:
+    decided, _ = split_confident([description])
+    if description in decided:
+        return RiskLevel[decided[description]]
+    surrogate_labels, check_live = consult_surrogate(SECRET_DATA_SENSITIVITY, description)
+    if not check_live:
+        return RiskLevel[surrogate_labels['data_sensitivity']]
+    return await async_assess_data_sensitivity_with_ai(description, surrogate_labels)
+
+
+def assess_data_sensitivity_with_ai(description: str, surrogate_labels: Dict[str, str] = None) -> RiskLevel:
+    response = get_ai_chat_response(
+        build_data_sensitivity_prompt(description), ai_engine='openAI', response_format="json_object",
+        hedge=should_hedge('secret_data_sensitivity'))
+    observe_live_verdict(SECRET_DATA_SENSITIVITY, description, sensitivity_labels(response), surrogate_labels)
+    return parse_data_sensitivity_response(response)
+
+
+async def async_assess_data_sensitivity_with_ai(description: str, surrogate_labels: Dict[str, str] = None) -> RiskLevel:
+    response = await async_get_ai_chat_response(
+        build_data_sensitivity_prompt(description), ai_engine='openAI', response_format="json_object",
+        hedge=should_hedge('secret_data_sensitivity'))
+    observe_live_verdict(SECRET_DATA_SENSITIVITY, description, sensitivity_labels(response), surrogate_labels)
+    return parse_data_sensitivity_response(response)
+
+
+def assess_data_sensitivity_batch(descriptions: List[str], batch_size: int = SENSITIVITY_BATCH_SIZE) -> Dict[str, RiskLevel]:
+    """
+    Assess the data sensitivity of several descriptions with one AI request per batch.
+
+    Args:
+        descriptions (List[str]): The descriptions to assess.
+        batch_size (int): The maximum number of descriptions per request.
+
+    Returns:
+        Dict[str, RiskLevel]: The sensitivity level for each distinct description.
+    """
+    return classify_in_batches(
+        descriptions, DATA_SENSITIVITY_SUBJECT, DATA_SENSITIVITY_GUIDELINES,
+        lambda level: RiskLevel[level], assess_data_sensitivity_with_ai, batch_size, SECRET_DATA_SENSITIVITY)
+
+
+async def async_assess_data_sensitivity_batch(descriptions: List[str], batch_size: int = SENSITIVITY_BATCH_SIZE,
+                                              expired: Set[str] = None) -> Dict[str, RiskLevel]:
+    return await async_classify_in_batches(
+        descriptions, DATA_SENSITIVITY_SUBJECT, DATA_SENSITIVITY_GUIDELINES,
+        lambda level: RiskLevel[level], async_assess_data_sensitivity_with_ai, batch_size, SECRET_DATA_SENSITIVITY,
+        expired)
+
+
+def cluster_secrets(secrets: List[Dict[str, Any]], threshold: float = NEAR_DUPLICATE_ITEM_THRESHOLD) -> List[int]:
+    """
+    Cluster secrets whose description and service are near-duplicates.
+
+    Returns:
+        List[int]: For each secret, the index of the secret whose enrichment it shares.
+    """
+    return cluster_representatives(
+        [heightened_risk_surrogate_input(secret) for secret in secrets], threshold, "secrets")
+
+
+def _check_enrichment_mode(enrichment_mode: str):
+    if enrichment_mode not in ENRICHMENT_MODES:
+        raise ValueError(
+            f"Unknown enrichment mode '{enrichment_mode}', expected one of {', '.join(ENRICHMENT_MODES)}")
+
+
+def _descriptions_to_assess(secrets: List[Dict[str, Any]], full_enrichment: bool) -> List[str]:
+    """The descriptions whose data sensitivity can change the risk of a secret that has them."""
+    descriptions = [secret['description'] for secret in secrets
+                    if full_enrichment or data_sensitivity_can_change_secret_risk(secret)]
+    record_skipped(SECRET_DATA_SENSITIVITY,
+                   len({secret['description'] for secret in secrets} - set(descriptions)))
+    return descriptions
+
+
+def _risk_factors_to_settle(secrets: List[Dict[str, Any]], sensitivities: Dict[str, RiskLevel],
+                            representatives: List[int], full_enrichment: bool) -> Dict[int, List[Dict[RiskFactor, RiskLevel]]]:
+    """The influenced risk factors of the members of each cluster; empty under full enrichment, so that nothing is skipped."""
+    grouped = {}
+    if full_enrichment:
+        return grouped
+    for secret, representative in zip(secrets, representatives):
+        grouped.setdefault(representative, []).append(
+            assess_influenced_risk_factors(secret, sensitivities.get(secret['description'])))
+    return grouped
+
+
+def enrich_secrets(secrets: List[Dict[str, Any]], sensitivity_batch_size: int = SENSITIVITY_BATCH_SIZE,
+                   enrichment_mode: str = SECRET_ENRICHMENT_MODE, full_enrichment: bool = False) -> List[Dict[str, Any]]:
+    """
+    Run the AI-backed assessments for several secrets, sharing work between them.
+
+    Near-duplicate secrets share the additional context of their cluster's first secret, and the
+    data sensitivity of all secrets is classified up front, several per request.
+
+    Returns:
+        List[Dict[str, Any]]: The enrichment of each secret, in the shape enrich_secret returns.
+    """
+    representatives = cluster_secrets(secrets)
+    if enrichment_mode == ENRICHMENT_MODE_FUSED:
+        enrichments = {index: enrich_secret_fused(secrets[index])
+                       for index in dict.fromkeys(representatives)}
+        return [enrichments[representative] for representative in representatives]
+
+    sensitivities = assess_data_sensitivity_batch(
+        _descriptions_to_assess(secrets, full_enrichment), sensitivity_batch_size)
+
+    risk_factors_to_settle = _risk_factors_to_settle(
+        secrets, sensitivities, representatives, full_enrichment)
+    additional_contexts = {index: get_additional_context_from_perplexity(secrets[index], risk_factors_to_settle.get(index))
+                           for index in dict.fromkeys(representatives)}
+
+    return [{
+        "data_sensitivity": sensitivities.get(secret['description']),
+        "additional_context": additional_contexts[representative]
+    } for secret, representative in zip(secrets, representatives)]
+
+
+async def async_enrich_secrets(secrets: List[Dict[str, Any]], sensitivity_batch_size: int = SENSITIVITY_BATCH_SIZE,
+                               enrichment_mode: str = SECRET_ENRICHMENT_MODE, full_enrichment: bool = False) -> Tuple[List[Dict[str, Any]], List[bool]]:
+    """
+    Async variant of enrich_secrets; the assessments of all secrets run concurrently.
+
+    Under full enrichment the data sensitivity and Perplexity requests run concurrently;
+    otherwise the Perplexity requests wait for the data sensitivity verdicts they may be
+    skipped on. Inside utils.ai_service.ai_deadline, assessments still unanswered at the
+    deadline fall back to MEDIUM data sensitivity, ABSENT external mitigation and LOW
+    heightened risks.
+
+    Returns:
+        Tuple[List[Dict[str, Any]], List[bool]]: The enrichment of each secret, and whether
+        it rests on any of these fallbacks.
+    """
+    representatives = cluster_secrets(secrets)
+    unique_representatives = list(dict.fromkeys(representatives))
+    if enrichment_mode == ENRICHMENT_MODE_FUSED:
+        enrichments = dict(zip(unique_representatives, await asyncio.gather(
+            *(track_deadline(async_enrich_secret_fused(secrets[index])) for index in unique_representatives))))
+        return ([enrichments[representative][0] for representative in representatives],
+                [enrichments[representative][1] for representative in representatives])
+
+    expired_descriptions = set()
+    if full_enrichment:
+        sensitivities, additional_contexts = await asyncio.gather(
+            async_assess_data_sensitivity_batch(
+                _descriptions_to_assess(secrets, full_enrichment), sensitivity_batch_size, expired_descriptions),
+            asyncio.gather(*(track_deadline(async_get_additional_context_from_perplexity(secrets[index]))
+                             for index in unique_representatives)))
+    else:
+        sensitivities = await async_assess_data_sensitivity_batch(
+            _descriptions_to_assess(secrets, full_enrichment), sensitivity_batch_size, expired_descriptions)
+        risk_factors_to_settle = _risk_factors_to_settle(
+            secrets, sensitivities, representatives, full_enrichment)
+        additional_contexts = await asyncio.gather(
+            *(track_deadline(async_get_additional_context_from_perplexity(secrets[index], risk_factors_to_settle[index]))
+              for index in unique_representatives))
+    # (context, whether it was cut short by the deadline) per representative
+    additional_contexts = dict(zip(unique_representatives, additional_contexts))
+
+    enrichments = [{
+        "data_sensitivity": sensitivities.get(secret['description']),
+        "additional_context": additional_contexts[representative][0]
+    } for secret, representative in zip(secrets, representatives)]
+    partial = [secret['description'] in expired_descriptions or additional_contexts[representative][1]
+               for secret, representative in zip(secrets, representatives)]
+    return enrichments, partial
+
+
+def secret_fingerprint(secret: Dict[str, Any], enrichment_mode: str = SECRET_ENRICHMENT_MODE) -> str:
+    """Fingerprint of the fields a secret's enrichment depends on."""
+    return fingerprint(secret, SECRET_DATE_FIELDS, enrichment_mode=enrichment_mode)
+
+
+def decode_enrichment(state: Dict[str, Any]) -> Dict[str, Any]:
+    """The enrichment stored by the item state store, i.e. passed through enum_to_str, with its enums restored."""
+    additional_context = state['additional_context']
+    return {
+        "data_sensitivity": RiskLevel[state['data_sensitivity']] if state['data_sensitivity'] else None,
+        "additional_context": {
+            "external_mitigation": MitigationStatus[additional_context['external_mitigation']]
+            if additional_context['external_mitigation'] else None,
+            "heightened_risks": {vector: RiskLevel[level] for vector, level in additional_context['heightened_risks'].items()}
+        }
+    }
+
+
+def enrichment_covers_secret(secret: Dict[str, Any], enrichment: Dict[str, Any], full_enrichment: bool) -> bool:
+    """
+    Whether an enrichment has every assessment that can change the secret's risk today. An
+    assessment skipped by lazy enrichment may matter once the secret's dates move it out of
+    the HIGH level.
+    """
+    data_sensitivity = enrichment['data_sensitivity']
+    mitigation_status = enrichment['additional_context']['external_mitigation']
+    heightened_risks = enrichment['additional_context']['heightened_risks']
+    if data_sensitivity is not None and mitigation_status is not None and heightened_risks:
+        return True
+    if full_enrichment:
+        return False
+
+    if data_sensitivity is None and data_sensitivity_can_change_secret_risk(secret):
+        return False
+    risk_factors = assess_influenced_risk_factors(secret, data_sensitivity)
+    if mitigation_status is None and external_mitigation_can_change_risk(risk_factors):
+        return False
+    if not heightened_risks and heightened_risks_can_change_risk(risk_factors, mitigation_status):
+        return False
+    return True
+
+
+def reusable_enrichment(secret: Dict[str, Any], state: Dict[str, Any], full_enrichment: bool) -> Union[Dict[str, Any], None]:
+    """A stored enrichment, unless it lacks an assessment that can now change the secret's risk."""
+    enrichment = decode_enrichment(state)
+    return enrichment if enrichment_covers_secret(secret, enrichment, full_enrichment) else None
+
+
+def schedule_secret_transitions(secrets: List[Dict[str, Any]], enrichments: List[Dict[str, Any]], evaluations: List[Dict[str, Any]],
+                                full_enrichment: bool, partial: List[bool] = None) -> Dict[int, Tuple[str, Union[datetime.date, None]]]:
+    """
+    The highest risk level and next transition date of each secret, for the item state store.
+    Partially evaluated secrets are due again today.
+    """
+    if not item_state_enabled():
+        return {}
+    if partial is None:
+        partial = [False] * len(secrets)
+    return {index: (max(evaluation['risk_levels'].values(), key=lambda x: x.value).name,
+                    evaluation_date() if partially_evaluated else next_secret_transition(secret, enrichment, full_enrichment))
+            for index, (secret, enrichment, evaluation, partially_evaluated)
+            in enumerate(zip(secrets, enrichments, evaluations, partial))}
+
+
+def _reuse_enrichments(user_id: str, secrets: List[Dict[str, Any]], fingerprints: List[str],
+                       full_enrichment: bool) -> List[Union[Dict[str, Any], None]]:
+    return reuse_enrichments(SECRET_STATE_KIND, user_id, secrets, 'secret_id', fingerprints,
+                             lambda secret, state: reusable_enrichment(secret, state, full_enrichment))
+
+
+def evaluate_overall_secret_risk(user_id: str, user_secrets: Dict[str, Any] = None, sensitivity_batch_size: int = SENSITIVITY_BATCH_SIZE,
+                                 enrichment_mode: str = SECRET_ENRICHMENT_MODE, full_enrichment: bool = None,
+                                 since: datetime.date = None) -> Dict[str, Any]:
+    """
+    Evaluate the risk of all secrets of a user.
+
+    Only secrets that are new, or whose fingerprinted fields changed since the last run, are
+    enriched; the others reuse the enrichment kept in the item state store. Every secret is
+    scored afresh, as its risk depends on today's date, and the date its risk next changes on is
+    stored for core.transition_sweep.
+
+    Args:
+        user_id (str): The ID of the user.
+        user_secrets (Dict[str, Any]): The user's secret metadata, loaded from the metadata store if None.
+        sensitivity_batch_size (int): The maximum number of descriptions per data sensitivity request.
+        enrichment_mode (str): ENRICHMENT_MODE_SEPARATE or ENRICHMENT_MODE_FUSED.
+        full_enrichment (bool): Run AI assessments that cannot change a risk level too, so that the
+            justifications and additional context are complete; FULL_ENRICHMENT by default. The
+            fused mode always enriches fully.
+        since (datetime.date): If given, only evaluate the secrets last accessed on or after this
+            date, filtered in SQL with the sqlite metadata backend; `user_secrets` then holds only
+            those. The stored state of the user's other secrets is kept.
+
+    Returns:
+        Dict[str, Any]: The evaluated secrets grouped by their highest risk level.
+    """
+    _check_enrichment_mode(enrichment_mode)
+    if full_enrichment is None:
+        full_enrichment = FULL_ENRICHMENT
+    if user_secrets is None:
+        user_secrets = load_secrets(user_id, since)
+    if not user_secrets:
+        return {"error": "User not found"}
+
+    secrets = user_secrets['secrets']
+    fingerprints = [secret_fingerprint(secret, enrichment_mode) for secret in secrets]
+    enrichments = _reuse_enrichments(user_id, secrets, fingerprints, full_enrichment)
+    stale = [index for index, enrichment in enumerate(enrichments) if enrichment is None]
+    if stale:
+        # Queue this employee's AI requests fairly against other employees'
+        with ai_tenant(user_id):
+            fresh = enrich_secrets([secrets[index] for index in stale],
+                                   sensitivity_batch_size, enrichment_mode, full_enrichment)
+        for index, enrichment in zip(stale, fresh):
+            enrichments[index] = enrichment
+
+    evaluations = [score_secret_risk(secret, enrichment) for secret, enrichment in zip(secrets, enrichments)]
+    store_enrichments(SECRET_STATE_KIND, user_id, secrets, 'secret_id', fingerprints,
+                      {index: enum_to_str(enrichments[index]) for index in stale},
+                      schedule_secret_transitions(secrets, enrichments, evaluations, full_enrichment),
+                      get_metadata_item_ids(SECRET_METADATA_FILE, user_id) if since is not None else None)
+    return summarize_secret_risks(secrets, evaluations)
+
+
+async def async_evaluate_overall_secret_risk(user_id: str, user_secrets: Dict[str, Any] = None, sensitivity_batch_size: int = SENSITIVITY_BATCH_SIZE,
+                                             enrichment_mode: str = SECRET_ENRICHMENT_MODE, full_enrichment: bool = None,
+                                             since: datetime.date = None) -> Dict[str, Any]:
+    """
+    Async variant of evaluate_overall_secret_risk.
+
+    The AI enrichment of all secrets runs concurrently, bounded by the per-provider
+    concurrency limits in utils.ai_service. The result is identical to the sync path, except
+    that inside utils.ai_service.ai_deadline the secrets whose assessments missed the
+    deadline are scored on fallback values and marked partial. Their enrichment is not stored.
+    """
+    _check_enrichment_mode(enrichment_mode)
+    if full_enrichment is None:
+        full_enrichment = FULL_ENRICHMENT
+    if user_secrets is None:
+        user_secrets = load_secrets(user_id, since)
     if not user_secrets:
         return {"error": "User not found"}
 
+    secrets = user_secrets['secrets']
+    fingerprints = [secret_fingerprint(secret, enrichment_mode) for secret in secrets]
+    enrichments = _reuse_enrichments(user_id, secrets, fingerprints, full_enrichment)
+    stale = [index for index, enrichment in enumerate(enrichments) if enrichment is None]
+    partial = [False] * len(secrets)
+    if stale:
+        with ai_tenant(user_id):
+            fresh, fresh_partial = await async_enrich_secrets(
+                [secrets[index] for index in stale], sensitivity_batch_size, enrichment_mode, full_enrichment)
+        for index, enrichment, partially_evaluated in zip(stale, fresh, fresh_partial):
+            enrichments[index] = enrichment
+            partial[index] = partially_evaluated
+
+    evaluations = [score_secret_risk(secret, enrichment) for secret, enrichment in zip(secrets, enrichments)]
+    store_enrichments(SECRET_STATE_KIND, user_id, secrets, 'secret_id', fingerprints,
+                      {index: enum_to_str(enrichments[index]) for index in stale if not partial[index]},
+                      schedule_secret_transitions(secrets, enrichments, evaluations, full_enrichment, partial),
+                      get_metadata_item_ids(SECRET_METADATA_FILE, user_id) if since is not None else None)
+    return summarize_secret_risks(secrets, evaluations, partial)
+
+
+def summarize_secret_risks(secrets: List[Dict[str, Any]], evaluations: List[Dict[str, Any]], partial: List[bool] = None) -> Dict[str, Any]:
+    """
+    Group evaluated secrets by their highest risk level.
+
+    Args:
+        secrets (List[Dict[str, Any]]): The secrets' metadata.
+        evaluations (List[Dict[str, Any]]): The result of score_secret_risk for each secret.
+        partial (List[bool]): For each secret, whether it was scored on fallback values
+            because its AI assessments missed the deadline; none were by default.
+
+    Returns:
+        Dict[str, Any]: The secrets under 'low', 'medium' and 'high'.
+    """
     overall_risk = {level: [] for level in RiskLevel}
+    if partial is None:
+        partial = [False] * len(secrets)
 
-    for secret in user_secrets['secrets']:
-        risk_evaluation = evaluate_secret_risk(secret)
+    for secret, risk_evaluation, partially_evaluated in zip(secrets, evaluations, partial):
         risk_level = max(
             risk_evaluation['risk_levels'].values(), key=lambda x: x.value)
 
@@ -249,7 +834,8 @@ def evaluate_overall_secret_risk(user_id: str) -> Dict[str, Any]:
             'risk_factors': {factor.name: level.name for factor, level in risk_evaluation['risk_levels'].items()},
             'justifications': risk_evaluation['justifications'],
             'mitigation_strategies': risk_evaluation['mitigation_strategies'],
-            'additional_context': risk_evaluation['additional_context']
+            'additional_context': risk_evaluation['additional_context'],
+            'partial': partially_evaluated
         })
 
     result = {level.name.lower(): secrets for level,
@@ -0,0 +1,138 @@
+"""
+Departure Shield: Transition Sweep
+
+An item's base risk level depends on today's date only through day counts compared with
+fixed thresholds, so it can only change on a few dates known in advance. Every evaluation
+records the next of those dates for each item in the item state store's transition index.
+The daily sweep re-scores just the items whose date has arrived, from their stored
+enrichment, and records their next date; all other items keep their level.
+
+A due item whose stored enrichment cannot be reused, because its metadata changed, the
+enrichment expired or lacks an assessment that now matters, is evaluated again together
+with the rest of its user's items of that kind.
+
+Usage:
+    python departure_risk.py --sweep [--today YYYY-MM-DD]
+"""
+
+import datetime
+from typing import Any, Dict, List, Tuple, Union
+
+from core.file_transfer_evaluation import (FILE_TRANSFER_STATE_KIND, assess_file_transfer_risk_factors, evaluate_overall_file_transfer_risk,
+                                           file_transfer_fingerprint, load_file_transfers, next_file_transfer_transition)
+from core.file_transfer_evaluation import reusable_enrichment as reusable_file_transfer_enrichment
+from core.secret_evaluation import (SECRET_STATE_KIND, assess_secret_risk_factors, evaluate_overall_secret_risk, load_secrets,
+                                    next_secret_transition, secret_fingerprint)
+from core.secret_evaluation import reusable_enrichment as reusable_secret_enrichment
+from utils.clock import evaluation_date, frozen_today
+from utils.item_state import get_item_state_store
+from utils.lazy_enrichment import FULL_ENRICHMENT
+
+
+# How to load, fingerprint, re-score and re-evaluate the items of each kind
+ITEM_KINDS = {
+    SECRET_STATE_KIND: {
+        "load": load_secrets,
+        "items_field": 'secrets',
+        "id_field": 'secret_id',
+        "fingerprint": secret_fingerprint,
+        "reusable_enrichment": reusable_secret_enrichment,
+        "risk_factors": assess_secret_risk_factors,
+        "next_transition": next_secret_transition,
+        "evaluate": evaluate_overall_secret_risk,
+    },
+    FILE_TRANSFER_STATE_KIND: {
+        "load": load_file_transfers,
+        "items_field": 'files_and_transfers',
+        "id_field": 'activity_id',
+        "fingerprint": file_transfer_fingerprint,
+        "reusable_enrichment": reusable_file_transfer_enrichment,
+        "risk_factors": assess_file_transfer_risk_factors,
+        "next_transition": next_file_transfer_transition,
+        "evaluate": evaluate_overall_file_transfer_risk,
+    },
+}
+
+
+def _rescore(kind: str, items: Dict[str, Dict[str, Any]], states: Dict[str, Tuple[str, Any, bool]], item_ids: List[str],
+             full_enrichment: bool) -> Union[Dict[str, Tuple[str, Union[datetime.date, None]]], None]:
+    """
+    The new highest risk level and next transition date of each due item, re-scored from its
+    stored enrichment; None if any of them cannot be.
+    """
+    item_kind = ITEM_KINDS[kind]
+    transitions = {}
+    for item_id in item_ids:
+        item, state = items.get(item_id), states.get(item_id)
+        if item is None or state is None or state[2] or state[0] != item_kind["fingerprint"](item):
+            return None
+        enrichment = item_kind["reusable_enrichment"](item, state[1], full_enrichment)
+        if enrichment is None:
+            return None
+        risk_level = max(item_kind["risk_factors"](item, enrichment).values(), key=lambda x: x.value).name
+        transitions[item_id] = (risk_level, item_kind["next_transition"](item, enrichment, full_enrichment))
+    return transitions
+
+
+def sweep_transitions(today: datetime.date = None, full_enrichment: bool = None) -> Dict[str, Any]:
+    """
+    Re-score the items whose next transition date is on or before `today`.
+
+    The transition index is only kept up to date with the item state store enabled.
+
+    Args:
+        today (datetime.date): The date to sweep as of, evaluation_date() by default.
+        full_enrichment (bool): Whether the evaluations ran with full enrichment; FULL_ENRICHMENT by default.
+
+    Returns:
+        Dict[str, Any]: The sweep 'date'; the number of items 'due', 'rescored' from their stored
+        enrichment, 're_evaluated' and 'removed' because their user no longer has them; and the
+        'changes' of highest risk level, each with the kind, user ID, item ID, previous and new
+        risk level and next transition date.
+    """
+    today = today or evaluation_date()
+    if full_enrichment is None:
+        full_enrichment = FULL_ENRICHMENT
+    item_state_store = get_item_state_store()
+
+    due: Dict[Tuple[str, str], Dict[str, str]] = {}
+    for kind, user_id, item_id, risk_level in item_state_store.due(today):
+        due.setdefault((kind, user_id), {})[item_id] = risk_level
+
+    report = {"date": today.isoformat(), "due": sum(len(items) for items in due.values()),
+              "rescored": 0, "re_evaluated": 0, "removed": 0, "changes": []}
+    with frozen_today(today):
+        for (kind, user_id), previous_levels in due.items():
+            item_kind = ITEM_KINDS[kind]
+            metadata = item_kind["load"](user_id)
+            if not metadata:
+                # The user left the metadata; forget their items of this kind
+                item_state_store.save(kind, user_id, {}, [])
+                report["removed"] += len(previous_levels)
+                continue
+
+            items = {item[item_kind["id_field"]]: item for item in metadata[item_kind["items_field"]]}
+            transitions = _rescore(kind, items, item_state_store.load(kind, user_id),
+                                   list(previous_levels), full_enrichment)
+            if transitions is not None:
+                item_state_store.schedule(kind, user_id, transitions)
+                report["rescored"] += len(transitions)
+            else:
+                # Re-enriches what it must and records every item's transition again
+                item_kind["evaluate"](user_id, metadata, full_enrichment=full_enrichment)
+                transitions = item_state_store.transitions(kind, user_id)
+                report["re_evaluated"] += sum(1 for item_id in previous_levels if item_id in transitions)
+                report["removed"] += sum(1 for item_id in previous_levels if item_id not in transitions)
+
+            for item_id, previous_level in previous_levels.items():
+                if item_id in transitions and transitions[item_id][0] != previous_level:
+                    risk_level, next_transition = transitions[item_id]
+                    report["changes"].append({
+                        "kind": kind,
+                        "user_id": user_id,
+                        "item_id": item_id,
+                        "previous_level": previous_level,
+                        "risk_level": risk_level,
+                        "next_transition": next_transition.isoformat() if next_transition else None,
+                    })
+    return report
@@ -1,30 +1,123 @@
+import argparse
+import asyncio
+import collections
+import datetime
+import itertools
 import json
-from core.secret_evaluation import evaluate_overall_secret_risk
-from core.file_transfer_evaluation import evaluate_overall_file_transfer_risk
+import logging
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 
+from core.secret_evaluation import async_evaluate_overall_secret_risk
+from core.file_transfer_evaluation import async_evaluate_overall_file_transfer_risk
+from core.transition_sweep import sweep_transitions
+from core.batch_scoring import file_transfer_level_bounds, secret_level_bounds
+from utils.ai_service import (ai_deadline, get_ai_cache_stats, get_deadline_stats, get_failed_request_stats, get_provider_connection_stats,
+                              get_rate_limit_stats, get_rate_limits, get_single_flight_stats, share_rate_limits)
+from utils.sensitivity_classifier import get_local_sensitivity_stats
+from utils.surrogate_model import SURROGATE_MODE, get_surrogate_stats
+from utils.near_duplicates import get_clustering_stats
+from utils.lazy_enrichment import get_lazy_enrichment_stats
+from utils.item_state import get_item_state_stats, item_state_enabled
+from utils.clock import evaluation_date, frozen_today
+from utils.metadata_store import (FILE_TRANSFER_METADATA_FILE, SECRET_METADATA_FILE, get_metadata_store, get_metadata_store_stats,
+                                  get_recent_metadata, get_results_database, recently_active_user_ids)
+from utils.metadata_stream import join_employees
+from utils.result_stream import ResultStream, merge_results
 
-def evaluate_departure_risk(user_id: str) -> dict:
+
+# Seconds a user's evaluation may wait for AI assessments before falling back to defaults; unset for no deadline
+EVALUATION_DEADLINE_SECONDS = float(os.environ["EVALUATION_DEADLINE_SECONDS"]) \
+    if os.environ.get("EVALUATION_DEADLINE_SECONDS") else None
+
+# Risk assessments written to the results table per transaction with the sqlite metadata backend
+RESULT_SAVE_BATCH_SIZE = int(os.environ.get("RESULT_SAVE_BATCH_SIZE", 100))
+
+logger = logging.getLogger(__name__)
+
+
+def evaluate_departure_risk(user_id: str, deadline_seconds: Union[float, None] = EVALUATION_DEADLINE_SECONDS) -> dict:
     """
     Evaluate the overall departure risk for a given user by assessing both
     secret access and file transfer risks.
 
+    The two are evaluated concurrently on a new event loop, so this must not be called
+    from a running one; use async_evaluate_departure_risk there.
+
     Args:
         user_id (str): The ID of the user being evaluated.
+        deadline_seconds (Union[float, None]): How long to wait for AI assessments. Those
+            unanswered by then fall back to their defaults and the affected items are marked
+            partial. None waits for all of them.
 
     Returns:
         dict: A dictionary containing the combined risk assessment results.
     """
-    secret_risk = evaluate_overall_secret_risk(user_id)
-    file_transfer_risk = evaluate_overall_file_transfer_risk(user_id)
+    return asyncio.run(async_evaluate_departure_risk(user_id, deadline_seconds))
+
+
+async def async_evaluate_departure_risk(user_id: str, deadline_seconds: Union[float, None] = EVALUATION_DEADLINE_SECONDS,
+                                        records: Tuple[Optional[dict], Optional[dict]] = None,
+                                        since: Union[datetime.date, None] = None) -> dict:
+    """
+    Async variant of evaluate_departure_risk that evaluates the secret and file transfer
+    risks concurrently.
 
-    combined_risk = {
+    `records` are the user's secret and file transfer records when the caller has read them,
+    e.g. with utils.metadata_stream, None for a side the user has no record in. By default
+    they are looked up in the metadata store. With `since`, only the secrets accessed and
+    file transfers made on or after that date are looked up and evaluated.
+    """
+    if records is None and since is not None:
+        user_secrets = get_recent_metadata(SECRET_METADATA_FILE, user_id, since)
+        user_file_transfers = get_recent_metadata(FILE_TRANSFER_METADATA_FILE, user_id, since)
+    elif records is None:
+        user_secrets = get_metadata_store(SECRET_METADATA_FILE).get(user_id)
+        user_file_transfers = get_metadata_store(
+            FILE_TRANSFER_METADATA_FILE).get(user_id)
+    else:
+        # An empty record is reported as user not found, without a metadata store lookup
+        user_secrets, user_file_transfers = (record or {} for record in records)
+
+    with ai_deadline(deadline_seconds):
+        secret_risk, file_transfer_risk = await asyncio.gather(
+            async_evaluate_overall_secret_risk(user_id, user_secrets, since=since),
+            async_evaluate_overall_file_transfer_risk(user_id, user_file_transfers, since=since))
+
+    return {
         "user_id": user_id,
         "secret_risk": secret_risk,
         "file_transfer_risk": file_transfer_risk,
-        "overall_risk_level": calculate_overall_risk_level(secret_risk, file_transfer_risk)
+        "overall_risk_level": calculate_overall_risk_level(secret_risk, file_transfer_risk),
+        "partial": count_partial_items(secret_risk) + count_partial_items(file_transfer_risk) > 0
+    }
+
+
+def failed_risk_assessment(user_id: str, error: Exception) -> dict:
+    """
+    The entry recorded for a user whose evaluation raised, so that one user cannot end a
+    batch run: no items, no overall risk level, and the error.
+    """
+    message = f"{type(error).__name__}: {error}"
+    return {
+        "user_id": user_id,
+        "secret_risk": {"error": message},
+        "file_transfer_risk": {"error": message},
+        "overall_risk_level": None,
+        "partial": False,
+        "error": message
     }
 
-    return combined_risk
+
+def count_partial_items(risk: dict) -> int:
+    """The number of items of a secret or file transfer risk that were scored on fallback values."""
+    return sum(1 for items in risk.values() if isinstance(items, list)
+               for item in items if item.get('partial'))
 
 
 def calculate_overall_risk_level(secret_risk: dict, file_transfer_risk: dict) -> str:
@@ -52,6 +145,100 @@ def calculate_overall_risk_level(secret_risk: dict, file_transfer_risk: dict) ->
         return 'LOW'
 
 
+RISK_LEVELS = ['low', 'medium', 'high']
+
+
+def _risk_score(overall_level: int, points: int) -> float:
+    return overall_level + points / (points + 1)
+
+
+def calculate_risk_score(secret_risk: dict, file_transfer_risk: dict) -> float:
+    """
+    A numeric departure risk that ranks employees by calculate_overall_risk_level first.
+
+    The integer part is the overall risk level, 1 for LOW to 3 for HIGH. The fraction grows
+    with the employee's risky items, 2 points per HIGH and 1 per MEDIUM secret or file
+    transfer, and stays below 1, so it only orders employees of the same overall level.
+
+    Args:
+        secret_risk (dict): The secret risk assessment results.
+        file_transfer_risk (dict): The file transfer risk assessment results.
+
+    Returns:
+        float: The risk score, from 1 up to but excluding 4.
+    """
+    overall_level = RISK_LEVELS.index(calculate_overall_risk_level(secret_risk, file_transfer_risk).lower()) + 1
+    points = sum(2 * len(risk.get('high', [])) + len(risk.get('medium', []))
+                 for risk in (secret_risk, file_transfer_risk))
+    return _risk_score(overall_level, points)
+
+
+def _can_dominate(level: int, bounds: Sequence[Tuple[int, int]]) -> bool:
+    """
+    Whether some choice of item levels within `bounds` makes calculate_overall_risk_level
+    pick `level` (0 low to 2 high) for one kind of item, i.e. the most common level, ties
+    going to the lower one.
+    """
+    count = sum(1 for low, high in bounds if low <= level <= high)
+    # The other items are all below or all above `level`; split the ones that may be either
+    # of two levels between them as evenly as possible
+    others = [(low, high) for low, high in bounds if not low <= level <= high]
+    fixed = [sum(1 for low, high in others if low == high == other) for other in range(3) if other != level]
+    if level == 1:
+        return count > fixed[0] and count >= fixed[1]
+    largest_other = max(*fixed, math.ceil(len(others) / 2))
+    return count >= largest_other if level == 0 else count > largest_other
+
+
+def _dominant_level_range(bounds: Sequence[Tuple[int, int]]) -> Tuple[int, int]:
+    """The lowest and highest level (0 low to 2 high) calculate_overall_risk_level can pick for one kind of item."""
+    levels = [level for level in range(3) if _can_dominate(level, bounds)]
+    return levels[0], levels[-1]
+
+
+def risk_score_bounds(user_ids: List[str], today: Union[datetime.date, None] = None) -> Tuple[List[float], List[float]]:
+    """
+    Lower and upper bounds on calculate_risk_score for many users, without AI requests.
+
+    Each item's level is bounded by its vectorized base level run through the compiled
+    adjustment tables with every possible enrichment (see core.batch_scoring), and each
+    user's score by the overall levels and points those item bounds allow. Needs NumPy.
+
+    Args:
+        user_ids (List[str]): The users to bound.
+        today (Union[datetime.date, None]): The date to evaluate as of, evaluation_date() by default.
+
+    Returns:
+        Tuple[List[float], List[float]]: The lower and the upper bound of each user's score.
+    """
+    today = today or evaluation_date()
+    item_bounds = []
+    for metadata_file, items_field, level_bounds in ((SECRET_METADATA_FILE, 'secrets', secret_level_bounds),
+                                                     (FILE_TRANSFER_METADATA_FILE, 'files_and_transfers', file_transfer_level_bounds)):
+        store = get_metadata_store(metadata_file)
+        items, owners = [], []
+        for index, user_id in enumerate(user_ids):
+            record = store.get(user_id)
+            user_items = record[items_field] if record else []
+            items += user_items
+            owners += [index] * len(user_items)
+        bounds = [[] for _ in user_ids]
+        if items:
+            lows, highs = level_bounds(items, today)
+            for owner, low, high in zip(owners, lows.tolist(), highs.tolist()):
+                bounds[owner].append((low - 1, high - 1))
+        item_bounds.append(bounds)
+
+    lower, upper = [], []
+    for secret_bounds, file_transfer_bounds in zip(*item_bounds):
+        secret_levels = _dominant_level_range(secret_bounds)
+        file_transfer_levels = _dominant_level_range(file_transfer_bounds)
+        all_bounds = secret_bounds + file_transfer_bounds
+        lower.append(_risk_score(max(secret_levels[0], file_transfer_levels[0]) + 1, sum(low for low, _ in all_bounds)))
+        upper.append(_risk_score(max(secret_levels[1], file_transfer_levels[1]) + 1, sum(high for _, high in all_bounds)))
+    return lower, upper
+
+
 def generate_risk_summary(risk_assessment: dict) -> str:
     """
     Generate a human-readable summary of the risk assessment.
@@ -63,7 +250,14 @@ def generate_risk_summary(risk_assessment: dict) -> str:
         str: A formatted summary of the risk assessment.
     """
     summary = f"Departure Risk Summary for User ID: {risk_assessment['user_id']}\n"
-    summary += f"Overall Risk Level: {risk_assessment['overall_risk_level']}\n\n"
+    if risk_assessment.get('error'):
+        return summary + f"Evaluation failed: {risk_assessment['error']}\n"
+    summary += f"Overall Risk Level: {risk_assessment['overall_risk_level']}\n"
+    if risk_assessment.get('partial'):
+        partial_items = count_partial_items(risk_assessment['secret_risk']) + \
+            count_partial_items(risk_assessment['file_transfer_risk'])
+        summary += f"Partial: {partial_items} items were scored on default values after missing the deadline or failing\n"
+    summary += "\n"
 
     summary += "Secret Risk Assessment:\n"
     for level in ['high', 'medium', 'low']:
@@ -87,18 +281,474 @@ def generate_risk_summary(risk_assessment: dict) -> str:
     return summary
 
 
+# Users evaluated concurrently inside one worker; their AI requests share the provider limits
+USER_CONCURRENCY = int(os.environ.get("USER_CONCURRENCY", 8))
+# Upper bound on the users handed to a worker process at a time
+MAX_CHUNK_SIZE = 25
+
+DEFAULT_USER_IDS = ["emp12345", "emp67890", "emp24680"]
+
+
+def count_evaluated_items(risk_assessment: dict) -> int:
+    """The number of secrets and file transfers in a risk assessment."""
+    return sum(len(items) for risk in (risk_assessment['secret_risk'], risk_assessment['file_transfer_risk'])
+               for items in risk.values() if isinstance(items, list))
+
+
+def all_user_ids() -> List[str]:
+    """Every user in the secret or file transfer metadata, in file order."""
+    user_ids = get_metadata_store(SECRET_METADATA_FILE).user_ids()
+    user_ids += get_metadata_store(FILE_TRANSFER_METADATA_FILE).user_ids()
+    return list(dict.fromkeys(user_ids))
+
+
+def read_user_ids(path: str) -> List[str]:
+    """User IDs from a file with one ID per line; blank lines and '#' comments are skipped."""
+    with open(path, 'r') as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+
+async def _evaluate_users(user_ids: List[str], concurrency: int, deadline_seconds: Union[float, None],
+                          records: List[Tuple[Optional[dict], Optional[dict]]] = None,
+                          since: Union[datetime.date, None] = None) -> List[dict]:
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def evaluate(user_id: str, user_records: Tuple[Optional[dict], Optional[dict]]) -> dict:
+        # The deadline starts once the user's evaluation does, not while it is queued
+        async with semaphore:
+            try:
+                return await async_evaluate_departure_risk(user_id, deadline_seconds, user_records, since)
+            except Exception as e:
+                # Record the failure and keep going; gather would otherwise discard the whole chunk
+                logger.warning(f"Error evaluating departure risk for {user_id}: {e}")
+                return failed_risk_assessment(user_id, e)
+
+    return await asyncio.gather(*(evaluate(user_id, user_records)
+                                  for user_id, user_records in zip(user_ids, records or [None] * len(user_ids))))
+
+
+def evaluate_chunk(user_ids: List[str], concurrency: int = USER_CONCURRENCY,
+                   deadline_seconds: Union[float, None] = EVALUATION_DEADLINE_SECONDS,
+                   today: Union[datetime.date, None] = None,
+                   records: List[Tuple[Optional[dict], Optional[dict]]] = None,
+                   since: Union[datetime.date, None] = None) -> List[dict]:
+    """
+    Evaluate a chunk of users on a fresh event loop; the unit of work of a worker process.
+    `records` holds each user's secret and file transfer records if they were read already;
+    `since` limits the evaluation to the items dated on or after it.
+    """
+    with frozen_today(today):
+        return asyncio.run(_evaluate_users(user_ids, concurrency, deadline_seconds, records, since))
+
+
+def worker_pool(workers: int) -> ProcessPoolExecutor:
+    """A pool of `workers` processes that split this process's provider rate limits between them."""
+    return ProcessPoolExecutor(max_workers=workers, initializer=share_rate_limits, initargs=(get_rate_limits(), workers))
+
+
+def iter_departure_risks(user_ids: List[str], workers: int = 1, concurrency: int = USER_CONCURRENCY,
+                         deadline_seconds: Union[float, None] = EVALUATION_DEADLINE_SECONDS,
+                         today: Union[datetime.date, None] = None,
+                         since: Union[datetime.date, None] = None) -> Iterator[dict]:
+    """
+    Evaluate many users, yielding their risk assessments in the order of `user_ids`.
+
+    Users are split into chunks. With one worker the chunks are evaluated in this process;
+    otherwise a process pool scores them in parallel. Inside each process the users of a
+    chunk are evaluated concurrently on an event loop, up to `concurrency` at a time.
+
+    Args:
+        user_ids (List[str]): The users to evaluate.
+        workers (int): The number of worker processes.
+        concurrency (int): The number of users evaluated concurrently per process.
+        deadline_seconds (Union[float, None]): The per-user deadline for AI assessments.
+        today (Union[datetime.date, None]): The date to evaluate as of, the system date by default.
+        since (Union[datetime.date, None]): If given, only evaluate the secrets accessed and the
+            file transfers made on or after this date; the sqlite metadata backend filters in SQL.
+
+    Yields:
+        dict: The risk assessment of each user, as returned by evaluate_departure_risk, or
+        failed_risk_assessment for a user whose evaluation raised.
+    """
+    workers = max(workers, 1)
+    chunk_size = min(MAX_CHUNK_SIZE, max(1, math.ceil(len(user_ids) / (workers * 4))))
+    chunks = [user_ids[start:start + chunk_size]
+              for start in range(0, len(user_ids), chunk_size)]
+    evaluate = partial(evaluate_chunk, concurrency=concurrency, deadline_seconds=deadline_seconds, today=today,
+                       since=since)
+
+    if workers == 1:
+        for chunk in chunks:
+            yield from evaluate(chunk)
+        return
+
+    with worker_pool(workers) as executor:
+        # map returns the chunks in submission order, however the workers finish
+        for assessments in executor.map(evaluate, chunks):
+            yield from assessments
+
+
+# Users ranked by top_k_departure_risks, and how many were evaluated or skipped
+top_k_stats = {'users': 0, 'evaluated': 0, 'pruned_by_bounds': 0, 'pruned_after_evaluations': 0}
+
+
+def iter_streamed_departure_risks(employees: Iterable[Tuple[str, Optional[dict], Optional[dict]]], workers: int = 1,
+                                  concurrency: int = USER_CONCURRENCY,
+                                  deadline_seconds: Union[float, None] = EVALUATION_DEADLINE_SECONDS,
+                                  today: Union[datetime.date, None] = None) -> Iterator[dict]:
+    """
+    Evaluate employees as their records are read, yielding their risk assessments in input order.
+
+    The counterpart of iter_departure_risks for exports too large for the metadata store:
+    `employees` is consumed a chunk at a time, e.g. from utils.metadata_stream.join_employees,
+    and at most two chunks per worker are held at once, so memory does not grow with the input.
+
+    Args:
+        employees (Iterable[Tuple[str, Optional[dict], Optional[dict]]]): Each user's ID,
+            secret record and file transfer record.
+        workers (int): The number of worker processes.
+        concurrency (int): The number of users evaluated concurrently per process.
+        deadline_seconds (Union[float, None]): The per-user deadline for AI assessments.
+        today (Union[datetime.date, None]): The date to evaluate as of, the system date by default.
+
+    Yields:
+        dict: The risk assessment of each user, or failed_risk_assessment for a user whose evaluation raised.
+    """
+    employees = iter(employees)
+    chunks = iter(lambda: list(itertools.islice(employees, MAX_CHUNK_SIZE)), [])
+    evaluate = partial(evaluate_chunk, concurrency=concurrency, deadline_seconds=deadline_seconds, today=today)
+
+    def arguments(chunk: List[Tuple[str, Optional[dict], Optional[dict]]]):
+        return [user_id for user_id, _, _ in chunk], [(secrets, file_transfers) for _, secrets, file_transfers in chunk]
+
+    if workers <= 1:
+        for chunk in chunks:
+            user_ids, records = arguments(chunk)
+            yield from evaluate(user_ids, records=records)
+        return
+
+    with worker_pool(workers) as executor:
+        in_flight = collections.deque()
+        for chunk in chunks:
+            user_ids, records = arguments(chunk)
+            in_flight.append(executor.submit(evaluate, user_ids, records=records))
+            if len(in_flight) >= workers * 2:
+                yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+
+def top_k_departure_risks(k: int, user_ids: List[str], workers: int = 1, concurrency: int = USER_CONCURRENCY,
+                          deadline_seconds: Union[float, None] = EVALUATION_DEADLINE_SECONDS,
+                          today: Union[datetime.date, None] = None) -> List[dict]:
+    """
+    The risk assessments of the `k` riskiest users, ranked as a full evaluation would rank them.
+
+    Users are ranked by calculate_risk_score, ties keeping the order of `user_ids`. Every
+    user's score is first bounded by risk_score_bounds, without AI requests. Users are then
+    evaluated in the order of their upper bounds, a batch at a time, until no remaining
+    upper bound can beat the k-th best exact score. Users below the k-th best lower bound
+    are never evaluated.
+
+    Args:
+        k (int): The number of users to return.
+        user_ids (List[str]): The users to rank.
+        workers (int): The number of worker processes per batch.
+        concurrency (int): The number of users evaluated concurrently per process.
+        deadline_seconds (Union[float, None]): The per-user deadline for AI assessments.
+        today (Union[datetime.date, None]): The date to evaluate as of, evaluation_date() by default.
+
+    Returns:
+        List[dict]: The risk assessments of the top `k` users, riskiest first, each with its 'risk_score'.
+    """
+    today = today or evaluation_date()
+    user_ids = list(dict.fromkeys(user_ids))
+    if k <= 0 or not user_ids:
+        return []
+    lower, upper = risk_score_bounds(user_ids, today)
+
+    # At least k users score at least the k-th highest lower bound, so no user below it can make the cut
+    cutoff = sorted(lower, reverse=True)[min(k, len(lower)) - 1]
+    candidates = sorted((index for index in range(len(user_ids)) if upper[index] >= cutoff),
+                        key=lambda index: (-upper[index], index))
+    top_k_stats['users'] += len(user_ids)
+    top_k_stats['pruned_by_bounds'] += len(user_ids) - len(candidates)
+
+    ranked = []  # (-score, index, assessment), best first
+    batch_size = max(workers, 1) * max(concurrency, 1)
+    position = 0
+    while position < len(candidates):
+        batch = []
+        while position < len(candidates) and len(batch) < batch_size:
+            index = candidates[position]
+            if len(ranked) >= k and (-upper[index], index) > ranked[k - 1][:2]:
+                # Candidates come in order of their upper bound, so none of the rest can beat the k-th either
+                position = len(candidates)
+                break
+            batch.append(index)
+            position += 1
+        for index, risk_assessment in zip(batch, iter_departure_risks([user_ids[index] for index in batch], workers,
+                                                                      concurrency, deadline_seconds, today)):
+            risk_assessment['risk_score'] = calculate_risk_score(
+                risk_assessment['secret_risk'], risk_assessment['file_transfer_risk'])
+            ranked.append((-risk_assessment['risk_score'], index, risk_assessment))
+        ranked.sort(key=lambda entry: entry[:2])
+        top_k_stats['evaluated'] += len(batch)
+    top_k_stats['pruned_after_evaluations'] += len(candidates) - len(ranked)
+    return [risk_assessment for _, _, risk_assessment in ranked[:k]]
+
+
+def print_run_stats():
+    """Print the cache, AI request and enrichment statistics of this process."""
+    for store_stats in get_metadata_store_stats():
+        print(f"Metadata store {store_stats['path']}: {store_stats['hits']} hits, "
+              f"{store_stats['misses']} misses, {store_stats['reloads']} reloads")
+
+    cache_stats = get_ai_cache_stats()
+    print(f"AI response cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+          f"{cache_stats['entries']} entries")
+
+    connection_stats = get_provider_connection_stats()
+    print(f"Provider HTTP connections: {connection_stats['requests']} requests, "
+          f"{connection_stats['connections_reused']} reused connections")
+
+    local_stats = get_local_sensitivity_stats()
+    print(f"Local sensitivity tier: {local_stats['local']} decided locally, {local_stats['escalated']} escalated "
+          f"({local_stats['escalation_rate']:.0%} escalation rate)")
+
+    if SURROGATE_MODE == 'on':
+        surrogate_stats = get_surrogate_stats()
+        print(f"Surrogate model: {surrogate_stats['surrogate_verdicts']} verdicts, "
+              f"{surrogate_stats['live_fallbacks']} live fallbacks, "
+              f"{surrogate_stats['drift_disagreements']}/{surrogate_stats['drift_checks']} drift checks disagreed")
+
+    single_flight_stats = get_single_flight_stats()
+    print(f"Coalesced AI requests: {single_flight_stats['coalesced']} calls joined "
+          f"{single_flight_stats['leaders']} in-flight requests")
+
+    for kind, cluster_stats in get_clustering_stats().items():
+        print(f"Near-duplicate {kind}: {cluster_stats['items']} in {cluster_stats['clusters']} clusters "
+              f"(mean size {cluster_stats['mean_cluster_size']:.2f}, largest {cluster_stats['largest_cluster']}), "
+              f"{cluster_stats['requests_saved']} AI requests saved")
+
+    for kind, state_stats in get_item_state_stats().items():
+        print(f"Incremental {kind}: {state_stats['reused']} reused, {state_stats['new']} new, "
+              f"{state_stats['changed']} changed, {state_stats['stale']} stale")
+
+    skipped = get_lazy_enrichment_stats()
+    if skipped:
+        print("Skipped AI assessments that could not change a risk level: " +
+              ", ".join(f"{assessment} {count}" for assessment, count in sorted(skipped.items())))
+
+    expired = get_deadline_stats()
+    if expired:
+        print("AI requests cut short by the deadline: " +
+              ", ".join(f"{provider} {count}" for provider, count in sorted(expired.items())))
+
+    failed = get_failed_request_stats()
+    if failed:
+        print("Failed AI requests scored on default values: " +
+              ", ".join(f"{provider} {count}" for provider, count in sorted(failed.items())))
+
+    for provider, limit_stats in get_rate_limit_stats().items():
+        if limit_stats['granted']:
+            print(f"{provider} rate limiter: {limit_stats['granted']} requests, "
+                  f"avg wait {limit_stats['avg_wait_seconds']:.2f}s, max queue depth {limit_stats['max_queue_depth']}, "
+                  f"{limit_stats['rate_limited']} rate-limited responses")
+
+
+def print_sweep_report(report: dict):
+    """Print the risk level changes found by a transition sweep."""
+    for change in report['changes']:
+        print(f"{change['user_id']} {change['kind']} {change['item_id']}: "
+              f"{change['previous_level']} -> {change['risk_level']} (next transition: {change['next_transition'] or 'none'})")
+    print(f"Transition sweep as of {report['date']}: {report['due']} items due, {report['rescored']} re-scored, "
+          f"{report['re_evaluated']} re-evaluated, {report['removed']} removed, {len(report['changes'])} level changes")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Evaluate the departure risk of employees.")
+    parser.add_argument("user_ids", nargs='*',
+                        help=f"users to evaluate (default: {' '.join(DEFAULT_USER_IDS)})")
+    parser.add_argument("--all", action="store_true",
+                        help="evaluate every user in the metadata")
+    parser.add_argument("--users-file",
+                        help="file with one user ID per line")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes (default: 1, evaluate in this process)")
+    parser.add_argument("--concurrency", type=int, default=USER_CONCURRENCY,
+                        help=f"users evaluated concurrently per worker (default: {USER_CONCURRENCY})")
+    parser.add_argument("--deadline", type=float, default=EVALUATION_DEADLINE_SECONDS,
+                        help="seconds per user to wait for AI assessments before scoring on defaults (default: no deadline)")
+    parser.add_argument("--output", default="departure_risks.json",
+                        help="where to save the full risk assessments")
+    parser.add_argument("--stream", metavar="NDJSON",
+                        help="write each user's assessment to this NDJSON file as it completes, instead of to --output at the end")
+    parser.add_argument("--checkpoint",
+                        help="checkpoint of the users written to --stream (default: the NDJSON path + '.checkpoint')")
+    parser.add_argument("--resume", action="store_true",
+                        help="append to --stream, skipping the users in its checkpoint")
+    parser.add_argument("--merge", action="store_true",
+                        help="after a --stream run, merge the NDJSON file into the JSON array at --output")
+    parser.add_argument("--secrets-file", metavar="PATH",
+                        help="stream every employee of this secret metadata export (.json, .json.gz or .json.zst) instead of the metadata store")
+    parser.add_argument("--file-transfers-file", metavar="PATH",
+                        help="the file transfer metadata export to stream alongside --secrets-file")
+    parser.add_argument("--active-within", type=int, metavar="DAYS",
+                        help="only evaluate the selected users with a secret accessed or a file transfer in the last DAYS days, "
+                             "and only those secrets and file transfers")
+    parser.add_argument("--stored-results", type=str.upper, choices=[level.upper() for level in RISK_LEVELS], metavar="LEVEL",
+                        help="list the stored risk assessments with this overall risk level (LOW, MEDIUM or HIGH) "
+                             "and exit; needs METADATA_BACKEND=sqlite")
+    parser.add_argument("--top", type=int, metavar="K",
+                        help="only find the K riskiest of the selected users, skipping evaluations that cannot make the cut")
+    parser.add_argument("--sweep", action="store_true",
+                        help="only re-score the items whose date-based risk level changes by today, as recorded by earlier runs")
+    parser.add_argument("--today", type=datetime.date.fromisoformat, metavar="YYYY-MM-DD",
+                        help="evaluate or sweep as of this date instead of the system date")
+    parser.add_argument("--no-summaries", action="store_true",
+                        help="do not print a summary per user")
+    args = parser.parse_args()
+    if (args.resume or args.merge or args.checkpoint) and not args.stream:
+        parser.error("--resume, --merge and --checkpoint need --stream")
+    if args.sweep and (args.user_ids or args.users_file or args.all or args.stream):
+        parser.error("--sweep covers every recorded item and takes no users or --stream")
+    streamed_input = bool(args.secrets_file or args.file_transfers_file)
+    if streamed_input and not (args.secrets_file and args.file_transfers_file):
+        parser.error("--secrets-file and --file-transfers-file go together")
+    if streamed_input and (args.user_ids or args.users_file or args.all or args.top is not None or args.sweep
+                           or args.active_within is not None):
+        parser.error("--secrets-file evaluates every employee in the exports and takes no users, --top, --sweep or --active-within")
+    if args.active_within is not None and (args.sweep or args.top is not None):
+        parser.error("--active-within cannot be combined with --sweep or --top")
+    if args.stored_results and get_results_database() is None:
+        parser.error("--stored-results needs METADATA_BACKEND=sqlite")
+
+    if args.stored_results:
+        stored = get_results_database().results(args.stored_results)
+        for risk_assessment in stored:
+            print(f"{risk_assessment['user_id']}: {risk_assessment['overall_risk_level']}"
+                  + (" (partial)" if risk_assessment.get('partial') else ""))
+        print(f"{len(stored)} stored risk assessments with overall risk level {args.stored_results}")
+        return 0
+    if args.top is not None and (args.stream or args.sweep):
+        parser.error("--top cannot be combined with --stream or --sweep")
+    if args.sweep and not item_state_enabled():
+        parser.error("--sweep needs the item state store, which ITEM_STATE_ENABLED=0 turns off")
+
+    if args.sweep:
+        start = time.perf_counter()
+        report = sweep_transitions(args.today)
+        elapsed = time.perf_counter() - start
+        print_sweep_report(report)
+        print_run_stats()
+        print(f"Swept {report['due']} items in {elapsed:.2f}s")
+        return 0
+
+    user_ids = list(args.user_ids)
+    if args.users_file:
+        user_ids += read_user_ids(args.users_file)
+    if args.all:
+        user_ids += all_user_ids()
+    user_ids = list(dict.fromkeys(user_ids)) or DEFAULT_USER_IDS
+    since = None
+    if args.active_within is not None:
+        since = (args.today or evaluation_date()) - datetime.timedelta(days=args.active_within)
+        active = set(recently_active_user_ids(since))
+        print(f"{sum(1 for user_id in user_ids if user_id in active)} of {len(user_ids)} users were active "
+              f"in the last {args.active_within} days")
+        user_ids = [user_id for user_id in user_ids if user_id in active]
+    results_database = get_results_database()
+
+    if args.top is not None:
+        start = time.perf_counter()
+        top_risks = top_k_departure_risks(args.top, user_ids, args.workers, args.concurrency, args.deadline, args.today)
+        elapsed = time.perf_counter() - start
+        for rank, risk_assessment in enumerate(top_risks, 1):
+            print(f"{rank}. {risk_assessment['user_id']}: {risk_assessment['overall_risk_level']} "
+                  f"(risk score {risk_assessment['risk_score']:.3f})")
+        with open(args.output, "w") as f:
+            json.dump(top_risks, f, indent=2)
+        print(f"\nTop {len(top_risks)} risk assessments saved to {args.output}")
+        if results_database is not None:
+            results_database.save_results(top_risks, args.today or evaluation_date())
+        if args.workers <= 1:
+            print_run_stats()
+        print(f"Ranked {top_k_stats['users']} users in {elapsed:.2f}s: {top_k_stats['evaluated']} evaluated, "
+              f"{top_k_stats['pruned_by_bounds']} skipped on their score bounds, "
+              f"{top_k_stats['pruned_after_evaluations']} skipped once the top {args.top} were known")
+        return 0
+
+    stream = None
+    if args.stream:
+        stream = ResultStream(args.stream, args.checkpoint, args.resume)
+        if stream.completed:
+            print(f"Resuming: skipping {len(stream.completed)} users already in {stream.checkpoint_path}")
+            user_ids = [user_id for user_id in user_ids if user_id not in stream.completed]
+
+    if streamed_input:
+        employees = join_employees(args.secrets_file, args.file_transfers_file)
+        if stream is not None and stream.completed:
+            employees = (employee for employee in employees if employee[0] not in stream.completed)
+        risk_assessment_iterator = iter_streamed_departure_risks(
+            employees, args.workers, args.concurrency, args.deadline, args.today)
+    else:
+        risk_assessment_iterator = iter_departure_risks(
+            user_ids, args.workers, args.concurrency, args.deadline, args.today, since)
+
+    start = time.perf_counter()
+    risk_assessments, unsaved_results = [], []
+    users = items = failed = 0
+    try:
+        for risk_assessment in risk_assessment_iterator:
+            if stream is not None:
+                stream.write(risk_assessment)
+            else:
+                risk_assessments.append(risk_assessment)
+            if results_database is not None:
+                unsaved_results.append(risk_assessment)
+                if len(unsaved_results) >= RESULT_SAVE_BATCH_SIZE:
+                    results_database.save_results(unsaved_results, args.today or evaluation_date())
+                    unsaved_results = []
+            users += 1
+            items += count_evaluated_items(risk_assessment)
+            if risk_assessment.get('error'):
+                failed += 1
+            if not args.no_summaries:
+                print(generate_risk_summary(risk_assessment))
+                print("\n" + "-"*50 + "\n")  # Separator between summaries
+    finally:
+        if stream is not None:
+            stream.close()
+        if unsaved_results:
+            results_database.save_results(unsaved_results, args.today or evaluation_date())
+    elapsed = time.perf_counter() - start
+
+    if stream is None:
+        # Save the full risk assessments to a JSON file
+        with open(args.output, "w") as f:
+            json.dump(risk_assessments, f, indent=2)
+        print(f"\nFull risk assessments saved to {args.output}")
+    else:
+        print(f"\nRisk assessments streamed to {args.stream}")
+        if args.merge:
+            merged = merge_results(args.stream, args.output)
+            print(f"Merged {merged} risk assessments into {args.output}")
+    if results_database is not None:
+        print(f"Risk assessments stored in {results_database.path}")
+
+    if args.workers > 1:
+        print("Cache and AI request statistics are kept per worker process and not shown with --workers")
+    else:
+        print_run_stats()
+
+    print(f"Evaluated {users} users and {items} items in {elapsed:.2f}s with {max(args.workers, 1)} worker(s): "
+          f"{users / elapsed:.2f} users/s, {items / elapsed:.2f} items/s")
+    if failed:
+        print(f"{failed} users could not be evaluated; their entries in the results carry the error")
+    return 0
+
+
 if __name__ == "__main__":
-    # Add or modify user IDs as needed
-    user_ids = ["emp12345", "emp67890", "emp24680"]
-    risk_assessments = []
-
-    for user_id in user_ids:
-        risk_assessment = evaluate_departure_risk(user_id)
-        risk_assessments.append(risk_assessment)
-        print(generate_risk_summary(risk_assessment))
-        print("\n" + "-"*50 + "\n")  # Separator between summaries
-
-    # Save the full risk assessments to a JSON file
-    with open("departure_risks.json", "w") as f:
-        json.dump(risk_assessments, f, indent=2)
-    print(f"\nFull risk assessments saved to departure_risks.json")
+    sys.exit(main())
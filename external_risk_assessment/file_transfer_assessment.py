@@ -2,12 +2,30 @@ import json
 from enum import Enum
 from typing import Dict, Any
 
-from utils.ai_service import get_perplexity_response
+from utils.ai_service import async_get_perplexity_response, get_perplexity_response, should_hedge
 from models.file_transfer_risk_models import FileTransferRiskInfluencer, FileTransferRiskLevel
+from utils.surrogate_model import FILE_TRANSFER_HEIGHTENED_RISK, consult_surrogate, observe_live_verdict
+from utils.verdict_store import level_labels
 
 
-def assess_file_transfer_heightened_risk(file_transfer: Dict[str, Any]) -> Dict[FileTransferRiskInfluencer, FileTransferRiskLevel]:
-    prompt = f"""
+# The risk vectors the heightened risk prompt asks about
+HEIGHTENED_RISK_VECTORS = [
+    FileTransferRiskInfluencer.DATA_EXFILTRATION.value,
+    FileTransferRiskInfluencer.UNAUTHORIZED_SHARING.value,
+    FileTransferRiskInfluencer.SENSITIVE_INFORMATION_EXPOSURE.value,
+    FileTransferRiskInfluencer.COMPLIANCE_VIOLATION.value,
+    FileTransferRiskInfluencer.INTELLECTUAL_PROPERTY_LOSS.value,
+]
+
+
+def file_transfer_surrogate_input(file_transfer: Dict[str, Any]) -> str:
+    return (f"{file_transfer['activity_type']} {file_transfer['description']} "
+            f"from {file_transfer['location']['source']} to {file_transfer['location']['destination']} "
+            f"{file_transfer['sharing_status']}")
+
+
+def build_file_transfer_heightened_risk_prompt(file_transfer: Dict[str, Any]) -> str:
+    return f"""
     Analyze the following file transfer activity for potential heightened risks:
     Activity Type: {file_transfer['activity_type']}
     File Description: {file_transfer['description']}
@@ -33,18 +51,19 @@ def assess_file_transfer_heightened_risk(file_transfer: Dict[str, Any]) -> Dict[
         "intellectual_property_loss": {{ "level": "LOW" | "MEDIUM" | "HIGH", "explanation": "Brief explanation" }}
     }}
     """
-    try:
-        response = get_perplexity_response(prompt)
-    except Exception as e:
-        print(f"Error assessing heightened risk from  perplexity: {e}")
-        return {
-            FileTransferRiskInfluencer.DATA_EXFILTRATION: FileTransferRiskLevel.LOW,
-            FileTransferRiskInfluencer.UNAUTHORIZED_SHARING: FileTransferRiskLevel.LOW,
-            FileTransferRiskInfluencer.SENSITIVE_INFORMATION_EXPOSURE: FileTransferRiskLevel.LOW,
-            FileTransferRiskInfluencer.COMPLIANCE_VIOLATION: FileTransferRiskLevel.LOW,
-            FileTransferRiskInfluencer.INTELLECTUAL_PROPERTY_LOSS: FileTransferRiskLevel.LOW
-        }
 
+
+def default_file_transfer_heightened_risk() -> Dict[FileTransferRiskInfluencer, FileTransferRiskLevel]:
+    return {
+        FileTransferRiskInfluencer.DATA_EXFILTRATION: FileTransferRiskLevel.LOW,
+        FileTransferRiskInfluencer.UNAUTHORIZED_SHARING: FileTransferRiskLevel.LOW,
+        FileTransferRiskInfluencer.SENSITIVE_INFORMATION_EXPOSURE: FileTransferRiskLevel.LOW,
+        FileTransferRiskInfluencer.COMPLIANCE_VIOLATION: FileTransferRiskLevel.LOW,
+        FileTransferRiskInfluencer.INTELLECTUAL_PROPERTY_LOSS: FileTransferRiskLevel.LOW
+    }
+
+
+def parse_file_transfer_heightened_risk_response(response: Dict[str, Any]) -> Dict[FileTransferRiskInfluencer, FileTransferRiskLevel]:
     risk_assessment = {}
     for risk_vector in FileTransferRiskInfluencer:
         if risk_vector.value in response:
@@ -56,6 +75,46 @@ def assess_file_transfer_heightened_risk(file_transfer: Dict[str, Any]) -> Dict[
     return risk_assessment
 
 
+def _surrogate_heightened_risk_response(surrogate_labels: Dict[str, str]) -> Dict[str, Any]:
+    return {vector: {"level": level} for vector, level in surrogate_labels.items()}
+
+
+def assess_file_transfer_heightened_risk(file_transfer: Dict[str, Any]) -> Dict[FileTransferRiskInfluencer, FileTransferRiskLevel]:
+    surrogate_input = file_transfer_surrogate_input(file_transfer)
+    surrogate_labels, check_live = consult_surrogate(FILE_TRANSFER_HEIGHTENED_RISK, surrogate_input)
+    if not check_live:
+        return parse_file_transfer_heightened_risk_response(_surrogate_heightened_risk_response(surrogate_labels))
+
+    try:
+        response = get_perplexity_response(
+            build_file_transfer_heightened_risk_prompt(file_transfer), hedge=should_hedge('file_transfer_heightened_risk'))
+    except Exception as e:
+        print(f"Error assessing heightened risk from  perplexity: {e}")
+        return default_file_transfer_heightened_risk()
+
+    observe_live_verdict(FILE_TRANSFER_HEIGHTENED_RISK, surrogate_input,
+                         level_labels(response, HEIGHTENED_RISK_VECTORS), surrogate_labels)
+    return parse_file_transfer_heightened_risk_response(response)
+
+
+async def async_assess_file_transfer_heightened_risk(file_transfer: Dict[str, Any]) -> Dict[FileTransferRiskInfluencer, FileTransferRiskLevel]:
+    surrogate_input = file_transfer_surrogate_input(file_transfer)
+    surrogate_labels, check_live = consult_surrogate(FILE_TRANSFER_HEIGHTENED_RISK, surrogate_input)
+    if not check_live:
+        return parse_file_transfer_heightened_risk_response(_surrogate_heightened_risk_response(surrogate_labels))
+
+    try:
+        response = await async_get_perplexity_response(
+            build_file_transfer_heightened_risk_prompt(file_transfer), hedge=should_hedge('file_transfer_heightened_risk'))
+    except Exception as e:
+        print(f"Error assessing heightened risk from  perplexity: {e}")
+        return default_file_transfer_heightened_risk()
+
+    observe_live_verdict(FILE_TRANSFER_HEIGHTENED_RISK, surrogate_input,
+                         level_labels(response, HEIGHTENED_RISK_VECTORS), surrogate_labels)
+    return parse_file_transfer_heightened_risk_response(response)
+
+
 def get_file_transfer_additional_context(file_transfer: Dict[str, Any]) -> Dict[str, Any]:
     heightened_risks = assess_file_transfer_heightened_risk(file_transfer)
 
@@ -1,14 +1,19 @@
 import json
-import requests
+import logging
 from enum import Enum
-from typing import Dict, Any
+from typing import Dict, Any, Tuple
 
-from utils.ai_service import get_perplexity_response
+from utils.ai_service import async_get_perplexity_response, get_perplexity_response, should_hedge
 from models.secret_risk_models import RiskInfluencer, MitigationStatus, RiskLevel, string_to_risk_level
+from utils.surrogate_model import SECRET_HEIGHTENED_RISK, consult_surrogate, observe_live_verdict
+from utils.verdict_store import level_labels
 
 
-def assess_external_mitigation(secret: Dict[str, Any]) -> MitigationStatus:
-    prompt = f"""
+logger = logging.getLogger(__name__)
+
+
+def build_external_mitigation_prompt(secret: Dict[str, Any]) -> str:
+    return f"""
     Analyze the following secret and service for external mitigation measures:
     Secret Description: {secret['description']}
     Service: {secret['service']}
@@ -21,15 +26,42 @@ def assess_external_mitigation(secret: Dict[str, Any]) -> MitigationStatus:
         "explanation": "Brief explanation for the assessment"
     }}
     """
+
+
+def assess_external_mitigation(secret: Dict[str, Any]) -> MitigationStatus:
     try:
-        response = get_perplexity_response(prompt)
+        response = get_perplexity_response(
+            build_external_mitigation_prompt(secret), hedge=should_hedge('secret_external_mitigation'))
         return MitigationStatus(response["mitigation_status"].lower())
     except Exception as e:
         return MitigationStatus.ABSENT
 
 
-def assess_heightened_risk(secret: Dict[str, Any]) -> Dict[RiskInfluencer, RiskLevel]:
-    prompt = f"""
+async def async_assess_external_mitigation(secret: Dict[str, Any]) -> MitigationStatus:
+    try:
+        response = await async_get_perplexity_response(
+            build_external_mitigation_prompt(secret), hedge=should_hedge('secret_external_mitigation'))
+        return MitigationStatus(response["mitigation_status"].lower())
+    except Exception as e:
+        return MitigationStatus.ABSENT
+
+
+# The risk vectors the heightened risk prompt asks about
+HEIGHTENED_RISK_VECTORS = [
+    RiskInfluencer.DATA_EXFILTRATION.value,
+    RiskInfluencer.UNAUTHORIZED_ACCESS.value,
+    RiskInfluencer.SYSTEM_COMPROMISE.value,
+    RiskInfluencer.COMPLIANCE_VIOLATION.value,
+    RiskInfluencer.INTELLECTUAL_PROPERTY_THEFT.value,
+]
+
+
+def heightened_risk_surrogate_input(secret: Dict[str, Any]) -> str:
+    return f"{secret['description']} service: {secret['service']}"
+
+
+def build_heightened_risk_prompt(secret: Dict[str, Any]) -> str:
+    return f"""
     Analyze the following secret and service for potential heightened risks:
     Secret Description: {secret['description']}
     Service: {secret['service']}
@@ -52,8 +84,8 @@ def assess_heightened_risk(secret: Dict[str, Any]) -> Dict[RiskInfluencer, RiskL
     }}
     """
 
-    response = get_perplexity_response(prompt)
 
+def parse_heightened_risk_response(response: Dict[str, Any]) -> Dict[RiskInfluencer, RiskLevel]:
     risk_assessment = {}
     for risk_vector in RiskInfluencer:
         # Ensure the risk vector exists in the response
@@ -67,6 +99,50 @@ def assess_heightened_risk(secret: Dict[str, Any]) -> Dict[RiskInfluencer, RiskL
     return risk_assessment
 
 
+def default_heightened_risk() -> Dict[RiskInfluencer, RiskLevel]:
+    return {risk_vector: RiskLevel.LOW for risk_vector in RiskInfluencer}
+
+
+def _surrogate_heightened_risk_response(surrogate_labels: Dict[str, str]) -> Dict[str, Any]:
+    return {vector: {"level": level} for vector, level in surrogate_labels.items()}
+
+
+def assess_heightened_risk(secret: Dict[str, Any]) -> Dict[RiskInfluencer, RiskLevel]:
+    surrogate_input = heightened_risk_surrogate_input(secret)
+    surrogate_labels, check_live = consult_surrogate(SECRET_HEIGHTENED_RISK, surrogate_input)
+    if not check_live:
+        return parse_heightened_risk_response(_surrogate_heightened_risk_response(surrogate_labels))
+
+    try:
+        response = get_perplexity_response(
+            build_heightened_risk_prompt(secret), hedge=should_hedge('secret_heightened_risk'))
+    except Exception as e:
+        logger.warning(f"Error assessing heightened risk from perplexity: {e}")
+        return default_heightened_risk()
+
+    observe_live_verdict(SECRET_HEIGHTENED_RISK, surrogate_input,
+                         level_labels(response, HEIGHTENED_RISK_VECTORS), surrogate_labels)
+    return parse_heightened_risk_response(response)
+
+
+async def async_assess_heightened_risk(secret: Dict[str, Any]) -> Dict[RiskInfluencer, RiskLevel]:
+    surrogate_input = heightened_risk_surrogate_input(secret)
+    surrogate_labels, check_live = consult_surrogate(SECRET_HEIGHTENED_RISK, surrogate_input)
+    if not check_live:
+        return parse_heightened_risk_response(_surrogate_heightened_risk_response(surrogate_labels))
+
+    try:
+        response = await async_get_perplexity_response(
+            build_heightened_risk_prompt(secret), hedge=should_hedge('secret_heightened_risk'))
+    except Exception as e:
+        logger.warning(f"Error assessing heightened risk from perplexity: {e}")
+        return default_heightened_risk()
+
+    observe_live_verdict(SECRET_HEIGHTENED_RISK, surrogate_input,
+                         level_labels(response, HEIGHTENED_RISK_VECTORS), surrogate_labels)
+    return parse_heightened_risk_response(response)
+
+
 def get_additional_context_from_perplexity(secret: Dict[str, Any]) -> Dict[str, Any]:
     mitigation_status = assess_external_mitigation(secret)
     heightened_risks = assess_heightened_risk(secret)
@@ -75,3 +151,106 @@ def get_additional_context_from_perplexity(secret: Dict[str, Any]) -> Dict[str,
         "external_mitigation": mitigation_status,
         "heightened_risks": heightened_risks
     }
+
+
+def build_fused_enrichment_prompt(secret: Dict[str, Any]) -> str:
+    influencer_fields = ",\n".join(
+        f'            "{influencer.value}": {{ "level": "LOW" | "MEDIUM" | "HIGH" }}'
+        for influencer in RiskInfluencer)
+
+    return f"""
+    Analyze the following secret and service:
+    Secret Description: {secret['description']}
+    Service: {secret['service']}
+
+    Answer all three of the following in a single JSON object:
+    1. The data sensitivity of the information this secret protects, considering the type of data,
+       potential impact if exposed, and regulatory implications:
+       - HIGH: Highly sensitive data (e.g., customer personal information, payment details, trade secrets)
+       - MEDIUM: Moderately sensitive data (e.g., internal business processes, proprietary but non-critical information)
+       - LOW: Low sensitivity data (e.g., publicly available information, non-confidential internal data)
+    2. Whether, considering industry-standard security practices, this service likely has external
+       mitigation measures in place to protect against unauthorized access or misuse of this secret.
+    3. The risk level of each of the following risk vectors as LOW, MEDIUM, or HIGH.
+
+    Respond with a JSON object in the following format:
+    {{
+        "data_sensitivity": "LOW" | "MEDIUM" | "HIGH",
+        "mitigation_status": "PRESENT" | "PARTIAL" | "ABSENT",
+        "heightened_risks": {{
+{influencer_fields}
+        }}
+    }}
+    """
+
+
+def parse_fused_enrichment_response(response: Dict[str, Any]) -> Tuple[RiskLevel, MitigationStatus, Dict[RiskInfluencer, RiskLevel]]:
+    """
+    Validate a fused enrichment response against the risk enums.
+
+    Fields that are missing or not a valid enum member fall back to the defaults of the
+    separate assessments: MEDIUM sensitivity, ABSENT mitigation and LOW risk vectors.
+
+    Args:
+        response (Dict[str, Any]): The parsed JSON response.
+
+    Returns:
+        Tuple[RiskLevel, MitigationStatus, Dict[RiskInfluencer, RiskLevel]]: The data sensitivity,
+        external mitigation status and heightened risk levels.
+    """
+    if not isinstance(response, dict):
+        response = {}
+
+    sensitivity = response.get("data_sensitivity")
+    if isinstance(sensitivity, str) and sensitivity.upper() in RiskLevel.__members__:
+        data_sensitivity = RiskLevel[sensitivity.upper()]
+    else:
+        logger.warning(f"Invalid data sensitivity in fused response: {sensitivity}")
+        data_sensitivity = RiskLevel.MEDIUM
+
+    status = response.get("mitigation_status")
+    if isinstance(status, str) and status.upper() in MitigationStatus.__members__:
+        mitigation_status = MitigationStatus[status.upper()]
+    else:
+        logger.warning(f"Invalid mitigation status in fused response: {status}")
+        mitigation_status = MitigationStatus.ABSENT
+
+    heightened = response.get("heightened_risks")
+    if not isinstance(heightened, dict):
+        heightened = {}
+
+    heightened_risks = {}
+    for risk_vector in RiskInfluencer:
+        entry = heightened.get(risk_vector.value)
+        level = entry.get("level") if isinstance(entry, dict) else entry
+        if isinstance(level, str) and level.upper() in RiskLevel.__members__:
+            heightened_risks[risk_vector] = RiskLevel[level.upper()]
+        else:
+            heightened_risks[risk_vector] = RiskLevel.LOW
+
+    return data_sensitivity, mitigation_status, heightened_risks
+
+
+def assess_secret_enrichment_fused(secret: Dict[str, Any]) -> Tuple[RiskLevel, MitigationStatus, Dict[RiskInfluencer, RiskLevel]]:
+    """
+    Assess data sensitivity, external mitigation and heightened risks with one Perplexity request.
+    """
+    try:
+        response = get_perplexity_response(
+            build_fused_enrichment_prompt(secret), hedge=should_hedge('secret_fused_enrichment'))
+    except Exception as e:
+        logger.warning(f"Error assessing fused enrichment from perplexity: {e}")
+        response = {}
+
+    return parse_fused_enrichment_response(response)
+
+
+async def async_assess_secret_enrichment_fused(secret: Dict[str, Any]) -> Tuple[RiskLevel, MitigationStatus, Dict[RiskInfluencer, RiskLevel]]:
+    try:
+        response = await async_get_perplexity_response(
+            build_fused_enrichment_prompt(secret), hedge=should_hedge('secret_fused_enrichment'))
+    except Exception as e:
+        logger.warning(f"Error assessing fused enrichment from perplexity: {e}")
+        response = {}
+
+    return parse_fused_enrichment_response(response)
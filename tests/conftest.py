@@ -0,0 +1,67 @@
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+
+import pytest
+
+# The modules import each other as top-level packages (core, utils, models), as when run from the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+LEVELS = ['LOW', 'MEDIUM', 'HIGH']
+
+
+def _pick(options, *texts: str):
+    """A choice from `options` that only depends on `texts`, so every run gives the same verdicts."""
+    return options[int(hashlib.md5('|'.join(texts).encode()).hexdigest(), 16) % len(options)]
+
+
+@pytest.fixture
+def isolated_stores(tmp_path, monkeypatch):
+    """Keep the AI response cache, verdict store and item state store of a test in tmp_path."""
+    from utils import ai_service, item_state, verdict_store
+
+    monkeypatch.setattr(ai_service, 'ai_cache', ai_service.AIResponseCache(str(tmp_path / "ai_responses.sqlite3")))
+    monkeypatch.setattr(verdict_store, 'verdict_store', verdict_store.VerdictStore(str(tmp_path / "ai_verdicts.sqlite3")))
+    monkeypatch.setattr(item_state, 'item_state_store', item_state.ItemStateStore(str(tmp_path / "item_state.sqlite3")))
+    return tmp_path
+
+
+@pytest.fixture
+def fake_providers(isolated_stores, monkeypatch):
+    """
+    Answer every AI request with verdicts derived from the prompt, without network access.
+
+    Returns:
+        Dict[str, int]: The number of 'chat' and 'perplexity' requests made.
+    """
+    from utils import ai_service
+
+    calls = {'chat': 0, 'perplexity': 0}
+    lock = threading.Lock()
+
+    def chat(prompt, *args, **kwargs):
+        with lock:
+            calls['chat'] += 1
+        if '"verdicts"' in prompt:
+            items = json.loads(prompt.split('Items:')[1].split('Provide your assessment')[0])
+            return [{"verdicts": [{"id": item["id"], "risk_level": _pick(LEVELS, item["description"])} for item in items]}]
+        description = re.search(r'Description: "(.*)"', prompt)
+        return [{"risk_level": _pick(LEVELS, description.group(1) if description else prompt), "explanation": ""}]
+
+    def perplexity(prompt, *args, **kwargs):
+        with lock:
+            calls['perplexity'] += 1
+        vectors = re.findall(r'"(\w+)": \{\{? ?"level"', prompt)
+        return {
+            "data_sensitivity": _pick(LEVELS, prompt),
+            "mitigation_status": _pick(['PRESENT', 'PARTIAL', 'ABSENT'], prompt, 'mitigation'),
+            "heightened_risks": {vector: {"level": _pick(LEVELS, prompt, vector)} for vector in vectors},
+            **{vector: {"level": _pick(LEVELS, prompt, vector)} for vector in vectors},
+        }
+
+    monkeypatch.setattr(ai_service, '_get_ai_chat_response', chat)
+    monkeypatch.setattr(ai_service, '_get_perplexity_response', perplexity)
+    return calls
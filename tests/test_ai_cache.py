@@ -0,0 +1,122 @@
+"""
+Tests of the AI response cache (utils.ai_service.AIResponseCache): TTL expiry, LRU
+eviction at max_entries, and that empty or failed responses are never cached.
+"""
+
+import types
+
+import pytest
+
+from utils import ai_service
+from utils.ai_service import AIResponseCache, CircuitBreaker, _is_cacheable
+
+
+RESPONSE = {"risk_level": "HIGH", "explanation": "Production database credentials"}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """The cache's wall clock, moved by setting clock.now."""
+    clock = types.SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(ai_service, 'time', types.SimpleNamespace(
+        time=lambda: clock.now, monotonic=ai_service.time.monotonic, sleep=ai_service.time.sleep))
+    return clock
+
+
+def cache_at(tmp_path, **kwargs) -> AIResponseCache:
+    return AIResponseCache(str(tmp_path / "ai_responses.sqlite3"), **kwargs)
+
+
+def test_round_trip_and_persistence(tmp_path):
+    cache = cache_at(tmp_path)
+    assert cache.get("key") is None
+    cache.set("key", "openAI", "gpt-4o", RESPONSE)
+    assert cache.get("key") == RESPONSE
+
+    # Another process opening the same file sees the entry
+    assert cache_at(tmp_path).get("key") == RESPONSE
+    stats = cache.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"], stats["writes"]) == (1, 1, 1, 1)
+
+
+def test_entries_expire_after_the_ttl(tmp_path, clock):
+    cache = cache_at(tmp_path, ttl_seconds=60)
+    cache.set("key", "perplexity", "sonar", RESPONSE)
+
+    clock.now += 60
+    assert cache.get("key") == RESPONSE
+    clock.now += 1
+    assert cache.get("key") is None
+    stats = cache.stats()
+    assert (stats["entries"], stats["expirations"], stats["hits"], stats["misses"]) == (0, 1, 1, 1)
+
+    # A read does not extend the TTL, a new write does
+    cache.set("key", "perplexity", "sonar", RESPONSE)
+    clock.now += 30
+    assert cache.get("key") == RESPONSE
+    clock.now += 31
+    assert cache.get("key") is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    cache = cache_at(tmp_path, max_entries=3)
+    for key in ("a", "b", "c"):
+        clock.now += 1
+        cache.set(key, "gemini", None, {"key": key})
+    clock.now += 1
+    assert cache.get("a") == {"key": "a"}
+
+    clock.now += 1
+    cache.set("d", "gemini", None, {"key": "d"})
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in ("a", "c", "d")] == [{"key": "a"}, {"key": "c"}, {"key": "d"}]
+    assert (cache.stats()["entries"], cache.stats()["evictions"]) == (3, 1)
+
+    # Lowering max_entries evicts down to it on the next write
+    cache.max_entries = 1
+    clock.now += 1
+    cache.set("e", "gemini", None, {"key": "e"})
+    assert cache.stats()["entries"] == 1
+    assert cache.get("e") == {"key": "e"}
+    assert cache.stats()["evictions"] == 4
+
+
+@pytest.mark.parametrize("response, cacheable", [
+    (None, False), ({}, False), ([], False), ([{}], False), ([{}, None], False), ("", False),
+    (RESPONSE, True), ([RESPONSE], True), ([{}, RESPONSE], True), ("LOW", True),
+])
+def test_is_cacheable(response, cacheable):
+    assert _is_cacheable(response) is cacheable
+
+
+@pytest.fixture
+def cache_enabled(isolated_stores, monkeypatch):
+    monkeypatch.setattr(ai_service, 'AI_CACHE_ENABLED', True)
+    monkeypatch.setattr(ai_service, 'AI_CACHE_REFRESH', False)
+    monkeypatch.setitem(ai_service.circuit_breakers, 'perplexity', CircuitBreaker('perplexity'))
+    return ai_service.ai_cache
+
+
+@pytest.mark.parametrize("failed_response", [[], [{}], None])
+def test_failed_chat_responses_are_not_cached(cache_enabled, monkeypatch, failed_response):
+    responses = [failed_response, failed_response, [RESPONSE]]
+    monkeypatch.setattr(ai_service, '_get_ai_chat_response', lambda *args: responses.pop(0))
+
+    assert ai_service.get_ai_chat_response("prompt", response_format="json_object") == failed_response
+    assert ai_service.get_ai_chat_response("prompt", response_format="json_object") == failed_response
+    assert ai_service.get_ai_chat_response("prompt", response_format="json_object") == [RESPONSE]
+    # Served from the cache from now on
+    assert ai_service.get_ai_chat_response("prompt", response_format="json_object") == [RESPONSE]
+    assert responses == []
+    assert (cache_enabled.stats()["writes"], cache_enabled.stats()["entries"]) == (1, 1)
+
+
+def test_failed_perplexity_responses_are_not_cached(cache_enabled, monkeypatch):
+    responses = [{}, RESPONSE]
+    monkeypatch.setattr(ai_service, '_get_perplexity_response', lambda prompt: responses.pop(0))
+
+    assert ai_service.get_perplexity_response("prompt") == {}
+    assert ai_service.get_perplexity_response("prompt") == RESPONSE
+    assert ai_service.get_perplexity_response("prompt") == RESPONSE
+    assert responses == []
+    assert (cache_enabled.stats()["writes"], cache_enabled.stats()["hits"]) == (1, 1)
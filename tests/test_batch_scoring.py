@@ -0,0 +1,115 @@
+"""
+Tests of the vectorized base risk scoring (core.batch_scoring): the batch levels equal the
+scalar ones on and around every threshold, and dates strptime rejects are rejected too.
+"""
+
+import datetime
+import itertools
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from core.batch_scoring import assess_base_data_exfiltration_risk_batch, assess_base_persistent_access_risk_batch, parse_dates
+from core.file_transfer_evaluation import (DAYS_SINCE_HIGH_TRANSFER_RISK, DAYS_SINCE_MEDIUM_TRANSFER_RISK, HIGH_RISK_FILE_SIZE_MB,
+                                           MEDIUM_RISK_FILE_SIZE_MB, assess_base_data_exfiltration_risk,
+                                           calculate_days_since_activity)
+from core.secret_evaluation import (DAYS_SINCE_HIGH_ACCESS_RISK, DAYS_SINCE_MEDIUM_ACCESS_RISK, HIGH_ROTATION_THRESHOLD,
+                                    MID_ROTATION_THRESHOLD, assess_base_persistent_access_risk,
+                                    calculate_days_since_last_access, calculate_days_until_rotation)
+from utils.clock import frozen_today
+
+
+TODAY = datetime.date(2024, 9, 10)
+
+DESTINATIONS = ["Personal Google Drive", "Company SharePoint", "PERSONAL USB drive"]
+SHARING_STATUSES = ["Private", "Shared Externally", "Restricted", "External - Restricted", "Internal - Finance Team"]
+
+MALFORMED_DATES = ["", "2024-02-30", "2024-13-01", "20240901", "2024-09", "2024/09/01", "2024-09-1 ", " 2024-09-1",
+                   "-002024-01", "0000-01-01", "2024-W01-01", "NaT       ", "2024-09-01T00"]
+MALFORMED_TIMESTAMPS = ["", "2024-09-01", "2024-09-01T24:00:00Z", "2024-09-01T10:60:00Z", "2024-09-01 10:00:00Z",
+                        "2024-09-01T10:00:00", "2024-09-01T10:00:00+00", "2024-02-30T10:00:00Z", "2024-09-01T10:00:61Z",
+                        "NaT                Z", "-02024-09-01T10:00Z"]
+
+
+def around(*thresholds: int) -> list:
+    return sorted({threshold + offset for threshold in thresholds for offset in (-1, 0, 1)})
+
+
+def day(offset: int) -> datetime.date:
+    return TODAY + datetime.timedelta(days=offset)
+
+
+def scalar_secret_levels(secrets: list) -> list:
+    with frozen_today(TODAY):
+        return [assess_base_persistent_access_risk(
+            calculate_days_until_rotation(secret['next_rotation_date']),
+            calculate_days_since_last_access(secret['last_accessed'])).value for secret in secrets]
+
+
+def scalar_file_transfer_levels(file_transfers: list) -> list:
+    with frozen_today(TODAY):
+        return [assess_base_data_exfiltration_risk(
+            calculate_days_since_activity(file_transfer['timestamp']), file_transfer['size_mb'], file_transfer).value
+            for file_transfer in file_transfers]
+
+
+def secret(next_rotation_date, last_accessed: str) -> dict:
+    return {"next_rotation_date": next_rotation_date, "last_accessed": last_accessed}
+
+
+def file_transfer(timestamp: str, size_mb: float = 1, destination: str = "Company SharePoint", sharing_status: str = "Private") -> dict:
+    return {"timestamp": timestamp, "size_mb": size_mb,
+            "location": {"source": "Laptop", "destination": destination}, "sharing_status": sharing_status}
+
+
+def test_secret_levels_at_the_thresholds():
+    rotation_dates = [None, ""] + [day(days).isoformat() for days in around(0, MID_ROTATION_THRESHOLD, HIGH_ROTATION_THRESHOLD)]
+    last_accessed = [day(-days).isoformat() for days in around(0, DAYS_SINCE_HIGH_ACCESS_RISK, DAYS_SINCE_MEDIUM_ACCESS_RISK)]
+    secrets = [secret(*dates) for dates in itertools.product(rotation_dates, last_accessed)]
+
+    assert assess_base_persistent_access_risk_batch(secrets, TODAY).tolist() == scalar_secret_levels(secrets)
+
+
+def test_file_transfer_levels_at_the_thresholds():
+    # Late in the day, so that only the date part of the timestamp counts
+    timestamps = [day(-days).isoformat() + "T23:59:59Z" for days in around(DAYS_SINCE_HIGH_TRANSFER_RISK, DAYS_SINCE_MEDIUM_TRANSFER_RISK)]
+    sizes = [0, MEDIUM_RISK_FILE_SIZE_MB - 0.01, MEDIUM_RISK_FILE_SIZE_MB, HIGH_RISK_FILE_SIZE_MB - 0.01, HIGH_RISK_FILE_SIZE_MB]
+    file_transfers = [file_transfer(*fields) for fields in itertools.product(timestamps, sizes, DESTINATIONS, SHARING_STATUSES)]
+
+    assert assess_base_data_exfiltration_risk_batch(file_transfers, TODAY).tolist() == scalar_file_transfer_levels(file_transfers)
+
+
+def test_dates_strptime_accepts_but_numpy_does_not():
+    secrets = [secret("2024-9-1", "2024-09-1"), secret("2024-12-01", "2024-9-09")]
+    file_transfers = [file_transfer("2024-9-8T1:2:3Z"), file_transfer("2024-09-06T10:00:00Z", sharing_status="Restricted")]
+
+    assert assess_base_persistent_access_risk_batch(secrets, TODAY).tolist() == scalar_secret_levels(secrets)
+    assert assess_base_data_exfiltration_risk_batch(file_transfers, TODAY).tolist() == scalar_file_transfer_levels(file_transfers)
+
+
+@pytest.mark.parametrize("date", MALFORMED_DATES)
+def test_malformed_dates_are_rejected_like_strptime(date):
+    with pytest.raises(ValueError):
+        datetime.datetime.strptime(date, "%Y-%m-%d")
+    with pytest.raises(ValueError):
+        parse_dates([date])
+    # One malformed record fails the column, as it fails the scalar sweep
+    with pytest.raises(ValueError):
+        assess_base_persistent_access_risk_batch([secret("2024-12-01", "2024-09-01"), secret(date or "2024-1-1", date)], TODAY)
+    if date:
+        with pytest.raises(ValueError):
+            assess_base_persistent_access_risk_batch([secret(date, "2024-09-01")], TODAY)
+
+
+@pytest.mark.parametrize("timestamp", MALFORMED_TIMESTAMPS)
+def test_malformed_timestamps_are_rejected_like_strptime(timestamp):
+    with pytest.raises(ValueError):
+        datetime.datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%SZ")
+    with pytest.raises(ValueError):
+        assess_base_data_exfiltration_risk_batch([file_transfer("2024-09-01T10:00:00Z"), file_transfer(timestamp)], TODAY)
+
+
+def test_empty_columns():
+    assert assess_base_persistent_access_risk_batch([], TODAY).tolist() == []
+    assert assess_base_data_exfiltration_risk_batch([], TODAY).tolist() == []
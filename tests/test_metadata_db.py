@@ -0,0 +1,147 @@
+"""
+Tests of the SQLite metadata backend (utils.metadata_db): the records, recency filters and
+user lists read from the imported database are those of the JSON files, and stored
+evaluation results are read back by risk level.
+"""
+
+import datetime
+import json
+import os
+import sys
+
+import pytest
+
+from utils import metadata_db, metadata_store
+from utils.metadata_db import METADATA_TABLES, MetadataDatabase, MetadataTable
+from utils.metadata_store import (FILE_TRANSFER_METADATA_FILE, METADATA_FILES, MOCK_DATA_DIR, SECRET_METADATA_FILE,
+                                  get_metadata_item_ids, get_metadata_store, get_recent_metadata, metadata_database_path,
+                                  recently_active_user_ids)
+
+
+# Every day from before the oldest mock item to after the newest
+SINCE_DATES = [datetime.date(2024, 8, 14) + datetime.timedelta(days=days) for days in range(15)]
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """
+    A copy of the mock data with undated items and a repeated user added, imported into
+    its own database. Stores and databases are created afresh for the test.
+    """
+    for filename, kind in METADATA_FILES.items():
+        with open(os.path.join(MOCK_DATA_DIR, filename)) as f:
+            metadata = json.load(f)
+        first = metadata['employees'][0]
+        undated = {**first[kind][0], METADATA_TABLES[kind]['recency_field']: None,
+                   METADATA_TABLES[kind]['id_field']: "undated"}
+        metadata['employees'].append({"user_id": "emp00001", "department": "Sales", kind: [undated]})
+        metadata['employees'].append({"user_id": "emp00002", kind: []})
+        metadata['employees'].append({**first, "department": "repeated record"})
+        with open(tmp_path / filename, 'w') as f:
+            json.dump(metadata, f)
+
+    monkeypatch.setattr(metadata_store, 'METADATA_DB_PATH', None)
+    monkeypatch.setattr(metadata_store, 'METADATA_SNAPSHOT_ENABLED', False)
+    monkeypatch.setattr(metadata_store, '_stores', {})
+    monkeypatch.setattr(metadata_db, '_databases', {})
+    monkeypatch.setattr(sys, 'argv', ['metadata_db.py', 'import', str(tmp_path)])
+    assert metadata_db.main() == 0
+    return str(tmp_path)
+
+
+def use_backend(monkeypatch, backend: str):
+    monkeypatch.setattr(metadata_store, 'METADATA_BACKEND', backend)
+    monkeypatch.setattr(metadata_store, '_stores', {})
+
+
+def json_employees(data_dir: str, filename: str) -> dict:
+    """The first record of each user in a metadata file, read with json.load."""
+    with open(os.path.join(data_dir, filename)) as f:
+        employees = {}
+        for employee in json.load(f)['employees']:
+            employees.setdefault(employee['user_id'], employee)
+        return employees
+
+
+def filtered_by_hand(employee: dict, kind: str, since: datetime.date) -> dict:
+    recency_field = METADATA_TABLES[kind]['recency_field']
+    items = [item for item in employee[kind] if item[recency_field] is not None and item[recency_field] >= since.isoformat()]
+    return {**employee, kind: items}
+
+
+@pytest.mark.parametrize("filename", list(METADATA_FILES))
+def test_sqlite_records_match_the_json_file(data_dir, monkeypatch, filename):
+    kind = METADATA_FILES[filename]
+    employees = json_employees(data_dir, filename)
+    use_backend(monkeypatch, 'sqlite')
+    store = get_metadata_store(filename, data_dir)
+    assert isinstance(store, MetadataTable)
+
+    assert store.user_ids() == list(employees)
+    for user_id, employee in employees.items():
+        assert store.get(user_id) == employee
+        assert get_metadata_item_ids(filename, user_id, data_dir) == [
+            item[METADATA_TABLES[kind]['id_field']] for item in employee[kind]]
+    assert store.get("emp99999") is None
+    assert (store.stats()["hits"], store.stats()["misses"]) == (len(employees), 1)
+
+
+@pytest.mark.parametrize("filename", list(METADATA_FILES))
+@pytest.mark.parametrize("backend", ['sqlite', 'json'])
+def test_recent_metadata_matches_filtering_by_hand(data_dir, monkeypatch, filename, backend):
+    kind = METADATA_FILES[filename]
+    employees = json_employees(data_dir, filename)
+    use_backend(monkeypatch, backend)
+
+    for since in SINCE_DATES:
+        for user_id, employee in employees.items():
+            assert get_recent_metadata(filename, user_id, since, data_dir) == filtered_by_hand(employee, kind, since)
+        assert get_recent_metadata(filename, "emp99999", since, data_dir) is None
+
+
+def test_recently_active_users_match_between_backends(data_dir, monkeypatch):
+    secrets = json_employees(data_dir, SECRET_METADATA_FILE)
+    file_transfers = json_employees(data_dir, FILE_TRANSFER_METADATA_FILE)
+
+    for since in SINCE_DATES:
+        expected = {user_id for user_id, employee in secrets.items() if filtered_by_hand(employee, 'secrets', since)['secrets']}
+        expected |= {user_id for user_id, employee in file_transfers.items()
+                     if filtered_by_hand(employee, 'files_and_transfers', since)['files_and_transfers']}
+        for backend in ('sqlite', 'json'):
+            use_backend(monkeypatch, backend)
+            assert set(recently_active_user_ids(since, data_dir)) == expected
+    # The sweep covers both no user and every dated user being active
+    assert recently_active_user_ids(SINCE_DATES[-1], data_dir) == []
+    assert len(recently_active_user_ids(SINCE_DATES[0], data_dir)) == 5
+
+
+def test_reimport_replaces_the_employees(data_dir):
+    database = MetadataDatabase(metadata_database_path(data_dir))
+    with open(os.path.join(MOCK_DATA_DIR, SECRET_METADATA_FILE)) as f:
+        employees = json.load(f)['employees'][:2]
+
+    assert database.import_employees('secrets', employees) == 2
+    assert database.user_ids('secrets') == [employee['user_id'] for employee in employees]
+    assert database.get('secrets', "emp00001") is None
+    # The other kind is untouched
+    assert "emp00001" in database.user_ids('files_and_transfers')
+
+
+def risk_assessment(user_id: str, overall_risk_level, **fields) -> dict:
+    return {"user_id": user_id, "overall_risk_level": overall_risk_level, "secret_risk": {}, **fields}
+
+
+def test_results_are_read_back_by_risk_level(tmp_path):
+    database = MetadataDatabase(str(tmp_path / "metadata.sqlite3"))
+    evaluated_on = datetime.date(2024, 9, 10)
+    database.save_results([risk_assessment("emp3", "HIGH"), risk_assessment("emp1", "LOW"),
+                           risk_assessment("emp2", "HIGH", partial=True), risk_assessment("emp4", None, error="boom")],
+                          evaluated_on)
+    # A later run replaces a user's result
+    database.save_results([risk_assessment("emp1", "HIGH", partial=False)], evaluated_on + datetime.timedelta(days=1))
+
+    saved = [risk_assessment("emp1", "HIGH", partial=False), risk_assessment("emp2", "HIGH", partial=True),
+             risk_assessment("emp3", "HIGH"), risk_assessment("emp4", None, error="boom")]
+    assert database.results() == saved
+    for risk_level in ("HIGH", "MEDIUM", "LOW"):
+        assert database.results(risk_level) == [result for result in saved if result["overall_risk_level"] == risk_level]
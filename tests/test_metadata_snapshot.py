@@ -0,0 +1,131 @@
+"""
+Tests of the binary metadata snapshots (utils.metadata_snapshot): the encoding of every
+value tag, lookups at both ends of the user ID index, and the fallback to the JSON file
+once it changes.
+"""
+
+import json
+
+import pytest
+
+from utils.metadata_snapshot import SnapshotStore, _Encoder, snapshot_path_for, write_snapshot
+from utils.metadata_store import MetadataStore
+
+
+# In file order, which is not the order of the UTF-8 user ID index
+USER_IDS = ["emp3", "émp1", "emp10", "emp2", "東京"]
+
+VALUES = [
+    None, True, False,
+    0, 1, -1, 63, -64, 64, -65, 2 ** 31, -(2 ** 31) - 1, 2 ** 63, -(2 ** 70),
+    0.0, -0.0, 1.5, -2.25, 1e300, -1e-300,
+    "", "a", "Zoë", "東京", "🙂 emoji", "x" * 200,
+    [], {}, [None, [1, [2.5]], {"ключ": "значение"}],
+]
+
+
+def employee(user_id: str, **fields) -> dict:
+    return {
+        "user_id": user_id,
+        "secrets": [{
+            "secret_id": f"{user_id}-secret",
+            "service": "Production Database",
+            "next_rotation_date": "2024-12-01",
+            "last_accessed": "2024-09-01",
+        }],
+        **fields,
+    }
+
+
+def write_metadata(path, employees: list):
+    with open(path, 'w') as f:
+        json.dump({"employees": employees}, f)
+
+
+def snapshot_store(metadata_path) -> SnapshotStore:
+    write_snapshot(str(metadata_path))
+    return SnapshotStore(snapshot_path_for(str(metadata_path)), str(metadata_path), MetadataStore(str(metadata_path)))
+
+
+@pytest.fixture
+def metadata_path(tmp_path):
+    path = tmp_path / "secret_metadata.json"
+    write_metadata(path, [employee(user_id) for user_id in USER_IDS])
+    return path
+
+
+def test_snapshot_path_for():
+    assert snapshot_path_for("data/secret_metadata.json") == "data/secret_metadata.snapshot"
+    assert snapshot_path_for("data/secret_metadata.json.gz") == "data/secret_metadata.json.gz.snapshot"
+
+
+@pytest.mark.parametrize("value", VALUES, ids=repr)
+def test_every_tag_round_trips(tmp_path, value):
+    path = tmp_path / "secret_metadata.json"
+    # The second employee repeats the value, so that its strings are interned as well
+    employees = [employee("emp1", value=value, nested={"value": [value]}), employee("emp2", value=value)]
+    write_metadata(path, employees)
+    store = snapshot_store(path)
+
+    record = store.get("emp1")
+    assert record == employees[0]
+    assert type(record["value"]) is type(value)
+    if isinstance(value, float):
+        assert repr(record["value"]) == repr(value)
+
+
+def test_unencodable_values_are_rejected():
+    with pytest.raises(TypeError):
+        _Encoder([]).encode({1, 2}, bytearray())
+
+
+def test_lookups_at_both_ends_of_the_index(metadata_path):
+    store = snapshot_store(metadata_path)
+    index_order = sorted(USER_IDS, key=lambda user_id: user_id.encode('utf-8'))
+
+    for user_id in (index_order[0], index_order[-1], USER_IDS[0], USER_IDS[-1]):
+        assert store.get(user_id) == employee(user_id)
+    for user_id in ("", "emp0", "emp11", "emp9", "😀"):
+        assert store.get(user_id) is None
+    assert (store.stats()["hits"], store.stats()["misses"]) == (4, 5)
+    assert store.stats()["records"] == len(USER_IDS)
+
+
+def test_user_ids_are_in_file_order(metadata_path):
+    assert snapshot_store(metadata_path).user_ids() == USER_IDS
+
+
+def test_only_the_first_record_of_a_user_is_kept(tmp_path):
+    path = tmp_path / "secret_metadata.json"
+    write_metadata(path, [employee("emp1", copy=1), employee("emp2"), employee("emp1", copy=2)])
+    store = snapshot_store(path)
+    assert store.get("emp1")["copy"] == 1
+    assert store.user_ids() == ["emp1", "emp2"]
+
+
+def test_falls_back_to_the_json_file_once_it_changes(metadata_path):
+    store = snapshot_store(metadata_path)
+    assert store.get("emp3") == employee("emp3")
+    assert store.stats()["path"] == store.path
+
+    write_metadata(metadata_path, [employee("emp4"), employee("emp3", updated=True)])
+    assert store.get("emp3") == employee("emp3", updated=True)
+    assert store.get("emp4") == employee("emp4")
+    assert store.user_ids() == ["emp4", "emp3"]
+    assert store.stats()["path"] == str(metadata_path)
+
+    # A rebuilt snapshot is picked up again
+    write_snapshot(str(metadata_path))
+    assert store.get("emp3") == employee("emp3", updated=True)
+    assert store.get("emp10") is None
+    assert store.stats()["path"] == store.path
+
+
+def test_missing_or_corrupt_snapshot_falls_back(metadata_path, capsys):
+    store = SnapshotStore(snapshot_path_for(str(metadata_path)), str(metadata_path), MetadataStore(str(metadata_path)))
+    assert store.get("emp2") == employee("emp2")
+
+    with open(store.path, 'wb') as f:
+        f.write(b'not a snapshot' * 10)
+    assert store.get("emp2") == employee("emp2")
+    assert "Error reading metadata snapshot" in capsys.readouterr().out
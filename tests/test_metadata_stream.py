@@ -0,0 +1,105 @@
+"""
+Tests of the streaming metadata reader (utils.metadata_stream): values split across
+chunk boundaries, truncated files, and compressed exports.
+"""
+
+import gzip
+import io
+import json
+
+import pytest
+
+from utils.metadata_stream import _JsonReader, iter_employees, join_employees
+
+
+# Small enough that most numbers and strings are split across chunks
+CHUNK_SIZES = [1, 2, 3, 5, 7, 64]
+
+VALUES = [
+    0, 7, -12, 1234567890123456789, 1.5, -0.25, 1.5e3, -2E-10, 6.02e+23,
+    "", "plain", "Zoë → 東京 🙂", "quote \" backslash \\ slash / tab \t newline \n", "é🙂",
+    None, True, False, [], {}, [1, [2, [3.5, "x"]]], {"a": {"b": [None, -1e-5]}},
+]
+
+EMPLOYEES = [
+    {"user_id": "emp1", "secrets": [{"secret_id": "s1", "size": 12.75, "tags": ["a", "ü"]}]},
+    {"user_id": "emp2", "secrets": []},
+    {"user_id": "東京", "secrets": [{"secret_id": "s2", "count": -30000, "note": "line\nbreak"}]},
+]
+
+
+def reader(text: str, chunk_size: int) -> _JsonReader:
+    return _JsonReader(io.StringIO(text), chunk_size)
+
+
+def write_metadata(path, text: str):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return str(path)
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+@pytest.mark.parametrize("ensure_ascii", [True, False])
+def test_values_split_across_chunks(chunk_size, ensure_ascii):
+    # Whitespace between the values, so that numbers can end right at a chunk boundary
+    text = '  '.join(json.dumps(value, ensure_ascii=ensure_ascii) for value in VALUES)
+    json_reader = reader(text, chunk_size)
+    decoded = [json_reader.value() for _ in VALUES]
+    assert decoded == VALUES
+    assert [type(value) for value in decoded] == [type(value) for value in VALUES]
+    assert json_reader.peek() == ''
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+@pytest.mark.parametrize("number", ["1", "-1", "12345", "1.5e3", "-0.000125", "6E+23", "1234567890.0987654321"])
+def test_numbers_split_at_every_position(chunk_size, number):
+    for separator in ('', ',', ' ', ']'):
+        assert reader(number + separator, chunk_size).value() == json.loads(number)
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+@pytest.mark.parametrize("indent", [None, 2])
+def test_iter_employees_matches_json_load(tmp_path, chunk_size, indent):
+    text = json.dumps({"exported": "2024-09-10", "employees": EMPLOYEES, "count": 3}, indent=indent, ensure_ascii=False)
+    path = write_metadata(tmp_path / "secret_metadata.json", text)
+    assert list(iter_employees(path, chunk_size)) == EMPLOYEES
+
+
+@pytest.mark.parametrize("text", ['{}', '{"employees": []}', '{"other": [1, 2]}', ' { "employees" : [ ] } '])
+def test_iter_employees_without_employees(tmp_path, text):
+    assert list(iter_employees(write_metadata(tmp_path / "secret_metadata.json", text), 2)) == []
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+@pytest.mark.parametrize("cut", [1, 10, 20, 40, -30, -3, -2, -1])
+def test_truncated_file_raises(tmp_path, chunk_size, cut):
+    text = json.dumps({"employees": EMPLOYEES})
+    path = write_metadata(tmp_path / "secret_metadata.json", text[:cut])
+    with pytest.raises(ValueError):
+        list(iter_employees(path, chunk_size))
+
+
+@pytest.mark.parametrize("text", ['"unterminated', '[1, 2', '{"a": ', '-', 'tru'])
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+def test_truncated_value_raises(text, chunk_size):
+    with pytest.raises(ValueError, match="Truncated or malformed JSON"):
+        reader(text, chunk_size).value()
+
+
+def test_gzip_export(tmp_path):
+    path = tmp_path / "secret_metadata.json.gz"
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        json.dump({"employees": EMPLOYEES}, f)
+    assert list(iter_employees(str(path), 5)) == EMPLOYEES
+
+
+def test_join_employees_pairs_records_by_user(tmp_path):
+    secrets = write_metadata(tmp_path / "secret_metadata.json", json.dumps({"employees": [
+        {"user_id": "emp1", "secrets": []}, {"user_id": "emp2", "secrets": []}, {"user_id": "emp3", "secrets": []}]}))
+    file_transfers = write_metadata(tmp_path / "file_transfer_metadata.json", json.dumps({"employees": [
+        {"user_id": "emp3", "files_and_transfers": []}, {"user_id": "emp1", "files_and_transfers": []},
+        {"user_id": "emp4", "files_and_transfers": []}]}))
+
+    joined = [(user_id, secret is not None, file_transfer is not None)
+              for user_id, secret, file_transfer in join_employees(secrets, file_transfers, 3)]
+    assert joined == [("emp1", True, True), ("emp3", True, True), ("emp2", True, False), ("emp4", False, True)]
@@ -0,0 +1,127 @@
+"""
+Tests of the AI provider rate limiting (utils.ai_service): round-robin grants across
+tenants, and the Retry-After backoff of a request answered with HTTP 429.
+"""
+
+import threading
+import time
+
+import pytest
+
+from utils import ai_service
+from utils.ai_service import CircuitBreaker, LatencyTracker, RateLimitScheduler, _call_provider, ai_tenant
+
+
+PROVIDER = 'perplexity'
+
+
+class RateLimitError(Exception):
+    """A provider's HTTP 429 error, shaped like the SDK errors _rate_limit_retry_after reads."""
+
+    status_code = 429
+
+    def __init__(self, retry_after: str = None):
+        super().__init__("429 Too Many Requests")
+        self.response = type('Response', (), {'headers': {'retry-after': retry_after} if retry_after else {}})()
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    """A fresh, unlimited scheduler, breaker and latency tracker for PROVIDER."""
+    scheduler = RateLimitScheduler(PROVIDER)
+    monkeypatch.setitem(ai_service.rate_limiters, PROVIDER, scheduler)
+    monkeypatch.setitem(ai_service.circuit_breakers, PROVIDER, CircuitBreaker(PROVIDER))
+    monkeypatch.setitem(ai_service.latency_trackers, PROVIDER, LatencyTracker())
+    return scheduler
+
+
+def flaky_call(failures: list, calls: list):
+    """A provider call that raises the errors in `failures` in turn, then answers."""
+    def call():
+        calls.append(time.monotonic())
+        if failures:
+            raise failures.pop(0)
+        return {"answer": len(calls)}
+    return call
+
+
+def test_queued_requests_are_granted_round_robin_across_tenants():
+    # One request a minute: the first takes the only token and everything else queues
+    scheduler = RateLimitScheduler(PROVIDER, requests_per_minute=1)
+    scheduler.acquire()
+
+    granted = []
+    consume = scheduler._tokens.consume
+
+    def record_grant(amount, now):
+        # Called under the scheduler's lock, in grant order
+        granted.append(threading.current_thread().name)
+        consume(amount, now)
+
+    scheduler._tokens.consume = record_grant
+
+    def request(tenant: str):
+        with ai_tenant(tenant):
+            scheduler.acquire()
+
+    threads = []
+    for name in ["a1", "a2", "a3", "a4", "b1", "b2", "c1"]:
+        thread = threading.Thread(target=request, args=(name[0],), name=name)
+        thread.start()
+        threads.append(thread)
+        # Queue the requests in this exact order
+        while scheduler.stats()["queue_depth"] < len(threads):
+            time.sleep(0.001)
+
+    scheduler.configure(requests_per_minute=0)
+    for thread in threads:
+        thread.join(5)
+
+    assert granted == ["a1", "b1", "c1", "a2", "b2", "a3", "a4"]
+    stats = scheduler.stats()
+    assert (stats["granted"], stats["queue_depth"], stats["max_queue_depth"]) == (8, 0, 7)
+
+
+def test_a_429_waits_for_retry_after(scheduler):
+    calls = []
+    result = _call_provider(PROVIDER, flaky_call([RateLimitError("0.2"), RateLimitError("0.1")], calls))
+
+    assert result == {"answer": 3}
+    assert len(calls) == 3
+    assert calls[1] - calls[0] >= 0.2
+    assert calls[2] - calls[1] >= 0.1
+    stats = scheduler.stats()
+    assert (stats["rate_limited"], stats["retries"], stats["granted"]) == (2, 2, 3)
+    # Retried 429s are not provider failures
+    assert ai_service.circuit_breakers[PROVIDER].consecutive_failures == 0
+
+
+def test_a_429_without_retry_after_backs_off_exponentially(scheduler, monkeypatch):
+    monkeypatch.setattr(ai_service, 'RATE_LIMIT_BACKOFF_SECONDS', 0.05)
+    calls = []
+    _call_provider(PROVIDER, flaky_call([RateLimitError(), RateLimitError()], calls))
+
+    assert len(calls) == 3
+    assert calls[1] - calls[0] >= 0.05
+    assert calls[2] - calls[1] >= 0.1
+    assert (scheduler.stats()["rate_limited"], scheduler.stats()["retries"]) == (2, 2)
+
+
+def test_a_429_that_outlasts_the_retries_is_a_failure(scheduler, monkeypatch):
+    monkeypatch.setattr(ai_service, 'RATE_LIMIT_MAX_RETRIES', 1)
+    calls = []
+    with pytest.raises(RateLimitError):
+        _call_provider(PROVIDER, flaky_call([RateLimitError("0.01"), RateLimitError("0.01"), RateLimitError("0.01")], calls))
+
+    assert len(calls) == 2
+    assert (scheduler.stats()["rate_limited"], scheduler.stats()["retries"]) == (1, 1)
+    assert ai_service.circuit_breakers[PROVIDER].consecutive_failures == 1
+
+
+def test_other_errors_are_not_retried(scheduler):
+    calls = []
+    with pytest.raises(ValueError):
+        _call_provider(PROVIDER, flaky_call([ValueError("bad request")], calls))
+
+    assert len(calls) == 1
+    assert (scheduler.stats()["rate_limited"], scheduler.stats()["retries"]) == (0, 0)
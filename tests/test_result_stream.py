@@ -0,0 +1,115 @@
+"""
+Tests of the streaming result writer (utils.result_stream): resuming after an
+interrupted write, and merging the NDJSON results into the JSON array of a normal run.
+"""
+
+import json
+
+import pytest
+
+from utils.result_stream import ResultStream, _truncate_incomplete_line, iter_results, merge_results, read_checkpoint
+
+
+def assessment(user_id: str, **fields) -> dict:
+    return {
+        "user_id": user_id,
+        "overall_risk_level": "HIGH",
+        "secrets": {"risk_level": "MEDIUM", "items": [{"secret_id": f"{user_id}-s1", "risk_factors": {}}]},
+        "file_transfers": {"risk_level": "LOW", "items": []},
+        "notes": "Zoë → 東京\nsecond line",
+        "score": 0.125,
+        **fields,
+    }
+
+
+def read_bytes(path) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def write_results(path, risk_assessments: list, resume: bool = False):
+    with ResultStream(str(path), resume=resume) as stream:
+        for risk_assessment in risk_assessments:
+            stream.write(risk_assessment)
+    return stream
+
+
+@pytest.mark.parametrize("content, expected", [
+    (b'', b''),
+    (b'{"a":1}\n', b'{"a":1}\n'),
+    (b'{"a":1}\n{"b":', b'{"a":1}\n'),
+    (b'{"a":1}\n{"b":2}\n' + b'x' * 10000, b'{"a":1}\n{"b":2}\n'),
+    (b'torn', b''),
+    (b'y' * 10000, b''),
+    (b'{"a":1}\n' + b'z' * 4095, b'{"a":1}\n'),
+])
+def test_truncate_incomplete_line(tmp_path, content, expected):
+    path = tmp_path / "departure_risks.ndjson"
+    path.write_bytes(content)
+    _truncate_incomplete_line(str(path))
+    assert read_bytes(path) == expected
+
+
+def test_resume_drops_a_torn_last_line(tmp_path):
+    path = tmp_path / "departure_risks.ndjson"
+    write_results(path, [assessment("emp1"), assessment("emp2")])
+    # A crash in the middle of emp3's result and checkpoint entry
+    with open(path, 'a') as f:
+        f.write(json.dumps(assessment("emp3"))[:40])
+    with open(str(path) + '.checkpoint', 'a') as f:
+        f.write("emp")
+
+    assert read_checkpoint(str(path) + '.checkpoint') == {"emp1", "emp2"}
+    stream = write_results(path, [assessment("emp3")], resume=True)
+    assert stream.completed == {"emp1", "emp2", "emp3"}
+    assert [risk_assessment["user_id"] for risk_assessment in iter_results(str(path))] == ["emp1", "emp2", "emp3"]
+    assert all(line.endswith(b'}') for line in read_bytes(path).split(b'\n')[:-1])
+    assert read_bytes(str(path) + '.checkpoint') == b'emp1\nemp2\nemp3\n'
+
+
+def test_without_resume_the_files_are_started_afresh(tmp_path):
+    path = tmp_path / "departure_risks.ndjson"
+    write_results(path, [assessment("emp1")])
+    stream = write_results(path, [assessment("emp2")])
+    assert stream.completed == {"emp2"}
+    assert [risk_assessment["user_id"] for risk_assessment in iter_results(str(path))] == ["emp2"]
+
+
+def test_merge_matches_json_dump(tmp_path):
+    risk_assessments = [assessment("emp1"), assessment("東京", partial=True, errors=[]), assessment("emp3", nested={})]
+    path = tmp_path / "departure_risks.ndjson"
+    write_results(path, risk_assessments)
+
+    expected_path = tmp_path / "expected.json"
+    with open(expected_path, 'w') as f:
+        json.dump(risk_assessments, f, indent=2)
+    assert merge_results(str(path), str(tmp_path / "merged.json")) == 3
+    assert read_bytes(tmp_path / "merged.json") == read_bytes(expected_path)
+
+
+def test_merge_of_no_results_matches_json_dump(tmp_path):
+    path = tmp_path / "departure_risks.ndjson"
+    write_results(path, [])
+    assert merge_results(str(path), str(tmp_path / "merged.json")) == 0
+    assert read_bytes(tmp_path / "merged.json") == json.dumps([], indent=2).encode()
+
+
+def test_merge_keeps_the_last_result_in_the_first_position(tmp_path):
+    path = tmp_path / "departure_risks.ndjson"
+    write_results(path, [assessment("emp1"), assessment("emp2", overall_risk_level="LOW"), assessment("emp3")])
+    # The resumed run writes emp2 again, after a crash before its checkpoint entry
+    write_results(path, [assessment("emp4"), assessment("emp2", overall_risk_level="MEDIUM")], resume=True)
+
+    expected = [assessment("emp1"), assessment("emp2", overall_risk_level="MEDIUM"), assessment("emp3"), assessment("emp4")]
+    with open(tmp_path / "expected.json", 'w') as f:
+        json.dump(expected, f, indent=2)
+    assert merge_results(str(path), str(tmp_path / "merged.json")) == 4
+    assert read_bytes(tmp_path / "merged.json") == read_bytes(tmp_path / "expected.json")
+
+
+def test_failed_evaluations_are_not_checkpointed(tmp_path):
+    path = tmp_path / "departure_risks.ndjson"
+    stream = write_results(path, [assessment("emp1"), {"user_id": "emp2", "error": "RuntimeError: boom"}])
+    assert stream.completed == {"emp1"}
+    assert read_checkpoint(str(path) + '.checkpoint') == {"emp1"}
+    assert [risk_assessment["user_id"] for risk_assessment in iter_results(str(path))] == ["emp1", "emp2"]
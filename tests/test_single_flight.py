@@ -0,0 +1,163 @@
+"""
+Tests of the request coalescing (utils.ai_service.SingleFlight): concurrent identical
+calls share one provider call from threads and from coroutines, followers get their own
+copy of the result, and the leader's exception reaches every follower.
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from utils.ai_service import SingleFlight
+
+
+FOLLOWERS = 5
+
+
+class ProviderError(Exception):
+    pass
+
+
+def wait_for_followers(single_flight: SingleFlight, followers: int = FOLLOWERS):
+    while single_flight.stats()["coalesced"] < followers:
+        time.sleep(0.001)
+
+
+def run_threads(single_flight: SingleFlight, key: str, call) -> list:
+    """Call single_flight.do from a leader and FOLLOWERS threads; each entry is a result or an exception."""
+    outcomes = [None] * (FOLLOWERS + 1)
+
+    def caller(index: int):
+        try:
+            outcomes[index] = single_flight.do(key, call)
+        except Exception as e:
+            outcomes[index] = e
+
+    leader = threading.Thread(target=caller, args=(0,))
+    leader.start()
+    while single_flight.stats()["in_flight"] == 0:
+        time.sleep(0.001)
+    followers = [threading.Thread(target=caller, args=(index,)) for index in range(1, FOLLOWERS + 1)]
+    for thread in followers:
+        thread.start()
+    for thread in [leader] + followers:
+        thread.join(5)
+    return outcomes
+
+
+def blocking_provider(single_flight: SingleFlight, calls: list, error: Exception = None):
+    """A provider call that only answers once every follower is waiting on it."""
+    def call():
+        calls.append(threading.current_thread().name)
+        wait_for_followers(single_flight)
+        if error is not None:
+            raise error
+        return {"risk_level": "HIGH", "factors": ["rotation"]}
+    return call
+
+
+def test_threads_share_one_call():
+    single_flight, calls = SingleFlight(), []
+    outcomes = run_threads(single_flight, "prompt", blocking_provider(single_flight, calls))
+
+    assert len(calls) == 1
+    assert all(outcome == {"risk_level": "HIGH", "factors": ["rotation"]} for outcome in outcomes)
+    # Every follower can change its result without touching the others'
+    assert len({id(outcome) for outcome in outcomes}) == len(outcomes)
+    assert len({id(outcome["factors"]) for outcome in outcomes}) == len(outcomes)
+    assert single_flight.stats() == {"leaders": 1, "coalesced": FOLLOWERS, "in_flight": 0}
+
+
+def test_threads_get_the_leaders_exception():
+    single_flight, calls = SingleFlight(), []
+    error = ProviderError("provider down")
+    outcomes = run_threads(single_flight, "prompt", blocking_provider(single_flight, calls, error))
+
+    assert len(calls) == 1
+    assert all(outcome is error for outcome in outcomes)
+    assert single_flight.stats() == {"leaders": 1, "coalesced": FOLLOWERS, "in_flight": 0}
+
+    # The failed call is not remembered: the next one is sent again
+    assert single_flight.do("prompt", lambda: "answer") == "answer"
+    assert single_flight.stats()["leaders"] == 2
+
+
+def test_different_keys_are_not_coalesced():
+    single_flight = SingleFlight()
+    results = [single_flight.do(key, lambda key=key: key.upper()) for key in ("a", "b", "a")]
+    assert results == ["A", "B", "A"]
+    assert single_flight.stats() == {"leaders": 3, "coalesced": 0, "in_flight": 0}
+
+
+def test_a_leaders_nested_call_does_not_wait_on_itself():
+    single_flight = SingleFlight()
+    assert single_flight.do("prompt", lambda: single_flight.do("prompt", lambda: "inner")) == "inner"
+    assert single_flight.stats() == {"leaders": 1, "coalesced": 0, "in_flight": 0}
+
+
+def async_provider(single_flight: SingleFlight, calls: list, error: Exception = None):
+    async def call():
+        calls.append(1)
+        while single_flight.stats()["coalesced"] < FOLLOWERS:
+            await asyncio.sleep(0.001)
+        if error is not None:
+            raise error
+        return {"risk_level": "MEDIUM", "factors": ["access"]}
+    return call
+
+
+def test_coroutines_share_one_call():
+    single_flight, calls = SingleFlight(), []
+    call = async_provider(single_flight, calls)
+
+    async def main():
+        return await asyncio.gather(*(single_flight.async_do("prompt", call) for _ in range(FOLLOWERS + 1)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert all(result == {"risk_level": "MEDIUM", "factors": ["access"]} for result in results)
+    assert len({id(result["factors"]) for result in results}) == len(results)
+    assert single_flight.stats() == {"leaders": 1, "coalesced": FOLLOWERS, "in_flight": 0}
+
+
+def test_coroutines_get_the_leaders_exception():
+    single_flight, calls = SingleFlight(), []
+    error = ProviderError("provider down")
+    call = async_provider(single_flight, calls, error)
+
+    async def main():
+        return await asyncio.gather(*(single_flight.async_do("prompt", call) for _ in range(FOLLOWERS + 1)),
+                                    return_exceptions=True)
+
+    outcomes = asyncio.run(main())
+    assert len(calls) == 1
+    assert all(outcome is error for outcome in outcomes)
+    assert single_flight.stats() == {"leaders": 1, "coalesced": FOLLOWERS, "in_flight": 0}
+
+
+def test_threads_wait_for_a_coroutine_leader():
+    single_flight, calls = SingleFlight(), []
+    call = async_provider(single_flight, calls)
+    outcomes = []
+
+    def follower():
+        outcomes.append(single_flight.do("prompt", lambda: pytest.fail("a follower sent its own request")))
+
+    async def main():
+        threads = [threading.Thread(target=follower) for _ in range(FOLLOWERS)]
+        leader = asyncio.ensure_future(single_flight.async_do("prompt", call))
+        while not calls:
+            await asyncio.sleep(0.001)
+        for thread in threads:
+            thread.start()
+        result = await leader
+        for thread in threads:
+            thread.join(5)
+        return result
+
+    result = asyncio.run(main())
+    assert len(calls) == 1
+    assert outcomes == [result] * FOLLOWERS
+    assert single_flight.stats() == {"leaders": 1, "coalesced": FOLLOWERS, "in_flight": 0}
@@ -0,0 +1,84 @@
+"""
+Tests of top_k_departure_risks (departure_risk): with the AI providers stubbed, the top K
+users and their order, ties included, are those of sorting a full evaluation.
+"""
+
+import datetime
+import json
+import os
+import random
+
+import pytest
+
+pytest.importorskip("numpy")
+
+import departure_risk
+from utils import metadata_store
+from utils.metadata_store import FILE_TRANSFER_METADATA_FILE, MOCK_DATA_DIR, SECRET_METADATA_FILE, MetadataStore
+
+
+TODAY = datetime.date(2024, 9, 10)
+
+
+def load_mock_items(filename: str, items_field: str) -> list:
+    with open(os.path.join(MOCK_DATA_DIR, filename)) as f:
+        return [item for employee in json.load(f)['employees'] for item in employee[items_field]]
+
+
+@pytest.fixture
+def user_ids(tmp_path, monkeypatch, fake_providers):
+    """
+    Users made of random picks of the mock items. Every profile is given to one to three
+    users, whose scores are then tied.
+    """
+    rng = random.Random(5)
+    secrets = load_mock_items(SECRET_METADATA_FILE, 'secrets')
+    file_transfers = load_mock_items(FILE_TRANSFER_METADATA_FILE, 'files_and_transfers')
+    secret_employees, file_transfer_employees = [], []
+    for profile in range(8):
+        profile_secrets = rng.sample(secrets, rng.randint(0, 3))
+        profile_file_transfers = rng.sample(file_transfers, rng.randint(0, 3))
+        for copy in range(rng.randint(1, 3)):
+            user_id = f"emp{profile}{copy}"
+            secret_employees.append({"user_id": user_id, "secrets": profile_secrets})
+            file_transfer_employees.append({"user_id": user_id, "files_and_transfers": profile_file_transfers})
+    rng.shuffle(secret_employees)
+
+    stores = {}
+    for filename, employees in ((SECRET_METADATA_FILE, secret_employees), (FILE_TRANSFER_METADATA_FILE, file_transfer_employees)):
+        path = tmp_path / filename
+        with open(path, 'w') as f:
+            json.dump({"employees": employees}, f)
+        stores[os.path.normpath(os.path.join(MOCK_DATA_DIR, filename))] = MetadataStore(str(path))
+    monkeypatch.setattr(metadata_store, '_stores', stores)
+    return [employee['user_id'] for employee in secret_employees]
+
+
+def full_ranking(user_ids: list) -> list:
+    scored = [(departure_risk.calculate_risk_score(risk_assessment['secret_risk'], risk_assessment['file_transfer_risk']),
+               index, risk_assessment['user_id'])
+              for index, risk_assessment in enumerate(departure_risk.iter_departure_risks(user_ids, today=TODAY))]
+    return [(user_id, score) for score, _, user_id in sorted(scored, key=lambda entry: (-entry[0], entry[1]))]
+
+
+def test_bounds_hold_the_exact_scores(user_ids):
+    lower, upper = departure_risk.risk_score_bounds(user_ids, TODAY)
+    scores = dict(full_ranking(user_ids))
+    for index, user_id in enumerate(user_ids):
+        assert lower[index] <= scores[user_id] <= upper[index]
+
+
+def test_top_k_matches_sorting_a_full_evaluation(user_ids):
+    ranking = full_ranking(user_ids)
+    scores = [score for _, score in ranking]
+    # Ties at the k-th score are what the bounds pruning could get wrong
+    assert any(scores[k - 1] == scores[k] for k in range(1, len(scores)))
+
+    for k in range(1, len(user_ids) + 2):
+        top = departure_risk.top_k_departure_risks(k, user_ids, concurrency=3, today=TODAY)
+        assert [(risk_assessment['user_id'], risk_assessment['risk_score']) for risk_assessment in top] == ranking[:k]
+
+
+def test_top_k_of_nothing(user_ids):
+    assert departure_risk.top_k_departure_risks(0, user_ids, today=TODAY) == []
+    assert departure_risk.top_k_departure_risks(3, [], today=TODAY) == []
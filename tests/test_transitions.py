@@ -0,0 +1,243 @@
+"""
+Tests of the next transition dates (utils.clock, core.secret_evaluation,
+core.file_transfer_evaluation) and of the daily sweep that relies on them
+(core.transition_sweep). The clock is frozen on either side of every threshold.
+"""
+
+import datetime
+import random
+
+import pytest
+
+from core import transition_sweep
+from core.file_transfer_evaluation import (DAYS_SINCE_HIGH_TRANSFER_RISK, DAYS_SINCE_MEDIUM_TRANSFER_RISK, FILE_TRANSFER_STATE_KIND,
+                                           assess_file_transfer_risk_factors, file_transfer_fingerprint,
+                                           file_transfer_transition_dates, next_file_transfer_transition)
+from core.secret_evaluation import (DAYS_SINCE_HIGH_ACCESS_RISK, DAYS_SINCE_MEDIUM_ACCESS_RISK, HIGH_ROTATION_THRESHOLD,
+                                    MID_ROTATION_THRESHOLD, SECRET_STATE_KIND, assess_base_persistent_access_risk,
+                                    assess_secret_risk_factors, calculate_days_since_last_access, calculate_days_until_rotation,
+                                    enum_to_str, next_secret_transition, secret_fingerprint, secret_transition_dates)
+from models.file_transfer_risk_models import FileTransferRiskLevel
+from models.secret_risk_models import MitigationStatus, RiskLevel
+from utils import item_state
+from utils.clock import evaluation_date, frozen_today, next_transition
+from utils.risk_adjustment_tables import FILE_TRANSFER_HEIGHTENED_VECTORS, SECRET_HEIGHTENED_VECTORS
+
+
+# The day just before which each threshold below is crossed
+CROSSING = datetime.date(2024, 9, 10)
+
+# Complete enrichments, so that only the passing days can change an item's risk
+SECRET_ENRICHMENT = {
+    "data_sensitivity": RiskLevel.LOW,
+    "additional_context": {
+        "external_mitigation": MitigationStatus.PRESENT,
+        "heightened_risks": {vector: RiskLevel.LOW for vector in SECRET_HEIGHTENED_VECTORS},
+    },
+}
+FILE_TRANSFER_ENRICHMENT = {
+    "data_sensitivity": FileTransferRiskLevel.LOW,
+    "additional_context": {
+        "heightened_risks": {vector: FileTransferRiskLevel.LOW for vector in FILE_TRANSFER_HEIGHTENED_VECTORS},
+    },
+}
+
+
+def days(count: int) -> datetime.timedelta:
+    return datetime.timedelta(days=count)
+
+
+def secret(secret_id: str, next_rotation_date, last_accessed: datetime.date) -> dict:
+    return {
+        "secret_id": secret_id,
+        "name": secret_id,
+        "type": "API Key",
+        "description": "Used by the internal wiki",
+        "next_rotation_date": next_rotation_date.isoformat() if next_rotation_date else None,
+        "last_accessed": last_accessed.isoformat(),
+        "service": "Internal Wiki",
+    }
+
+
+def file_transfer(activity_id: str, transferred_on: datetime.date, destination: str, sharing_status: str) -> dict:
+    return {
+        "activity_id": activity_id,
+        "activity_type": "File Access",
+        "name": activity_id,
+        "file_type": "Document",
+        "description": "Meeting notes",
+        # Late in the day, so that only the date part may count
+        "timestamp": f"{transferred_on.isoformat()}T23:59:59Z",
+        "size_mb": 1,
+        "location": {"source": "Google Drive", "destination": destination},
+        "sharing_status": sharing_status,
+        "action": "Downloaded",
+        "actor": "emp1",
+        "device": destination,
+    }
+
+
+def base_secret_level(item: dict) -> RiskLevel:
+    return assess_base_persistent_access_risk(calculate_days_until_rotation(item['next_rotation_date']),
+                                              calculate_days_since_last_access(item['last_accessed']))
+
+
+def first_change(state_at, start: datetime.date, horizon: int = 400):
+    """The first day after `start` on which state_at() differs from its value on `start`, day by day."""
+    with frozen_today(start):
+        current = state_at()
+    for offset in range(1, horizon):
+        with frozen_today(start + days(offset)):
+            if state_at() != current:
+                return start + days(offset)
+    return None
+
+
+# Each secret's base level changes on CROSSING because of one threshold only
+SECRET_CROSSINGS = {
+    "rotation_high": secret("rotation_high", CROSSING + days(HIGH_ROTATION_THRESHOLD), CROSSING - days(1)),
+    "rotation_medium": secret("rotation_medium", CROSSING + days(MID_ROTATION_THRESHOLD), CROSSING - days(40)),
+    "access_high": secret("access_high", CROSSING + days(200), CROSSING - days(DAYS_SINCE_HIGH_ACCESS_RISK)),
+    "access_medium": secret("access_medium", CROSSING + days(10), CROSSING - days(DAYS_SINCE_MEDIUM_ACCESS_RISK)),
+}
+
+# Each transfer's base level changes on CROSSING: the days since the transfer exceed the threshold
+FILE_TRANSFER_CROSSINGS = {
+    "high": file_transfer("high", CROSSING - days(DAYS_SINCE_HIGH_TRANSFER_RISK + 1), "Personal Laptop", "Internal"),
+    "medium": file_transfer("medium", CROSSING - days(DAYS_SINCE_MEDIUM_TRANSFER_RISK + 1), "Company Server", "Restricted"),
+}
+
+
+def test_frozen_today_pins_and_restores_the_clock():
+    before = evaluation_date()
+    with frozen_today(CROSSING):
+        assert evaluation_date() == CROSSING
+        with frozen_today(None):
+            assert evaluation_date() == CROSSING
+    assert evaluation_date() == before
+
+
+def test_next_transition_skips_candidates_that_change_nothing():
+    state_at = lambda: evaluation_date() >= CROSSING
+    candidates = [CROSSING - days(5), CROSSING, CROSSING + days(5)]
+    assert next_transition(candidates, state_at, CROSSING - days(10)) == CROSSING
+    assert next_transition(candidates, state_at, CROSSING) is None
+
+
+@pytest.mark.parametrize("name", sorted(SECRET_CROSSINGS))
+def test_secret_level_changes_on_its_transition_date(name):
+    item = SECRET_CROSSINGS[name]
+    assert CROSSING in secret_transition_dates(item)
+    with frozen_today(CROSSING - days(1)):
+        level_before = base_secret_level(item)
+    with frozen_today(CROSSING):
+        level_on = base_secret_level(item)
+    assert level_before != level_on
+
+    state_at = lambda: assess_secret_risk_factors(item, SECRET_ENRICHMENT)
+    for start in (CROSSING - days(2), CROSSING - days(1), CROSSING, CROSSING + days(1)):
+        with frozen_today(start):
+            assert next_secret_transition(item, SECRET_ENRICHMENT, True) == first_change(state_at, start)
+
+
+@pytest.mark.parametrize("name", sorted(FILE_TRANSFER_CROSSINGS))
+def test_file_transfer_level_changes_on_its_transition_date(name):
+    item = FILE_TRANSFER_CROSSINGS[name]
+    assert CROSSING in file_transfer_transition_dates(item)
+    state_at = lambda: assess_file_transfer_risk_factors(item, FILE_TRANSFER_ENRICHMENT)
+    with frozen_today(CROSSING - days(1)):
+        level_before = state_at()
+    with frozen_today(CROSSING):
+        level_on = state_at()
+    assert level_before != level_on
+
+    for start in (CROSSING - days(2), CROSSING - days(1), CROSSING, CROSSING + days(1)):
+        with frozen_today(start):
+            assert next_file_transfer_transition(item, FILE_TRANSFER_ENRICHMENT, True) == first_change(state_at, start)
+
+
+def test_next_transitions_match_a_day_by_day_search():
+    rng = random.Random(7)
+    for index in range(150):
+        start = CROSSING + days(rng.randrange(-60, 60))
+        rotation = CROSSING + days(rng.randrange(-30, 150)) if rng.random() < 0.8 else None
+        item = secret(f"s{index}", rotation, CROSSING - days(rng.randrange(0, 60)))
+        with frozen_today(start):
+            assert next_secret_transition(item, SECRET_ENRICHMENT, True) == first_change(
+                lambda: assess_secret_risk_factors(item, SECRET_ENRICHMENT), start), item
+
+        item = file_transfer(f"f{index}", CROSSING - days(rng.randrange(0, 20)),
+                             rng.choice(["Personal Laptop", "Company Server"]), rng.choice(["Internal", "Restricted"]))
+        with frozen_today(start):
+            assert next_file_transfer_transition(item, FILE_TRANSFER_ENRICHMENT, True) == first_change(
+                lambda: assess_file_transfer_risk_factors(item, FILE_TRANSFER_ENRICHMENT), start), item
+
+
+@pytest.fixture
+def item_state_store(tmp_path):
+    previous_path, previous_enabled = item_state.get_item_state_store().path, item_state.item_state_enabled()
+    item_state.configure_item_state(enabled=True, path=str(tmp_path / "item_state.sqlite3"))
+    yield item_state.get_item_state_store()
+    item_state.configure_item_state(enabled=previous_enabled, path=previous_path)
+
+
+def record_evaluation(kind: str, user_id: str, items: list, id_field: str, fingerprint, enrichment, next_item_transition,
+                      risk_factors, evaluated_on: datetime.date):
+    """Store the items' enrichment and transitions as an evaluation on `evaluated_on` would."""
+    with frozen_today(evaluated_on):
+        item_state.store_enrichments(kind, user_id, items, id_field, [fingerprint(item) for item in items],
+                                     {index: enum_to_str(enrichment) for index in range(len(items))}, {
+                                         index: (max(risk_factors(item, enrichment).values(), key=lambda x: x.value).name,
+                                                 next_item_transition(item, enrichment, True))
+                                         for index, item in enumerate(items)})
+
+
+def test_sweep_rescores_only_the_items_that_are_due(item_state_store, monkeypatch):
+    secrets = [SECRET_CROSSINGS["access_high"], secret("later", CROSSING + days(200), CROSSING + days(10))]
+    file_transfers = [FILE_TRANSFER_CROSSINGS["medium"]]
+    metadata = {
+        SECRET_STATE_KIND: {"user_id": "emp1", "secrets": secrets},
+        FILE_TRANSFER_STATE_KIND: {"user_id": "emp1", "files_and_transfers": file_transfers},
+    }
+    for kind in metadata:
+        monkeypatch.setitem(transition_sweep.ITEM_KINDS[kind], "load",
+                            lambda user_id, kind=kind: metadata[kind] if user_id == "emp1" else None)
+        monkeypatch.setitem(transition_sweep.ITEM_KINDS[kind], "evaluate",
+                            lambda *args, **kwargs: pytest.fail("a due item with a reusable enrichment was re-evaluated"))
+
+    evaluated_on = CROSSING - days(3)
+    record_evaluation(SECRET_STATE_KIND, "emp1", secrets, 'secret_id', secret_fingerprint, SECRET_ENRICHMENT,
+                      next_secret_transition, assess_secret_risk_factors, evaluated_on)
+    record_evaluation(FILE_TRANSFER_STATE_KIND, "emp1", file_transfers, 'activity_id', file_transfer_fingerprint,
+                      FILE_TRANSFER_ENRICHMENT, next_file_transfer_transition, assess_file_transfer_risk_factors, evaluated_on)
+    scheduled = {kind: item_state_store.transitions(kind, "emp1") for kind in metadata}
+    assert scheduled[SECRET_STATE_KIND]["access_high"][1] == CROSSING
+    assert scheduled[FILE_TRANSFER_STATE_KIND]["medium"][1] == CROSSING
+    assert scheduled[SECRET_STATE_KIND]["later"][1] > CROSSING
+
+    report = transition_sweep.sweep_transitions(CROSSING - days(1), full_enrichment=True)
+    assert (report["due"], report["rescored"], report["changes"]) == (0, 0, [])
+
+    report = transition_sweep.sweep_transitions(CROSSING, full_enrichment=True)
+    assert (report["due"], report["rescored"], report["re_evaluated"], report["removed"]) == (2, 2, 0, 0)
+    assert sorted((change["kind"], change["item_id"]) for change in report["changes"]) == [
+        (FILE_TRANSFER_STATE_KIND, "medium"), (SECRET_STATE_KIND, "access_high")]
+    for change in report["changes"]:
+        assert change["previous_level"] != change["risk_level"]
+
+    # The item that was not due keeps its schedule; the due ones move on to their next date
+    assert item_state_store.transitions(SECRET_STATE_KIND, "emp1")["later"] == scheduled[SECRET_STATE_KIND]["later"]
+    for kind, item_id in ((SECRET_STATE_KIND, "access_high"), (FILE_TRANSFER_STATE_KIND, "medium")):
+        risk_level, next_date = item_state_store.transitions(kind, "emp1")[item_id]
+        assert next_date is None or next_date > CROSSING
+    assert transition_sweep.sweep_transitions(CROSSING, full_enrichment=True)["due"] == 0
+
+
+def test_sweep_forgets_users_no_longer_in_the_metadata(item_state_store, monkeypatch):
+    monkeypatch.setitem(transition_sweep.ITEM_KINDS[SECRET_STATE_KIND], "load", lambda user_id: None)
+    record_evaluation(SECRET_STATE_KIND, "emp2", [SECRET_CROSSINGS["access_high"]], 'secret_id', secret_fingerprint,
+                      SECRET_ENRICHMENT, next_secret_transition, assess_secret_risk_factors, CROSSING - days(1))
+
+    report = transition_sweep.sweep_transitions(CROSSING, full_enrichment=True)
+    assert (report["due"], report["removed"]) == (1, 1)
+    assert item_state_store.transitions(SECRET_STATE_KIND, "emp2") == {}
@@ -1,17 +1,22 @@
+import asyncio
+import collections
+import contextlib
+import contextvars
+import copy
+import email.utils
+import functools
+import hashlib
 import json
 import re
-import requests
-from openai import OpenAI
+import sqlite3
+import threading
+import weakref
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 import os
 
-import google.generativeai as genai
-from google.api_core.exceptions import InternalServerError
-from IPython.display import Markdown
 import textwrap
 import time
 import logging
-from flask import Flask
-import anthropic
 from typing import Any, Dict, List, Union
 
 OPEN_AI_KEY = os.environ.get("OPENAI_API_KEY")
@@ -27,113 +32,1139 @@ ANTHROPIC_AI_API_KEY = os.environ.get("ANTHROPIC_API_KEY")
 ANTHROPIC_AI_CHAT_MODEL = "claude-3-5-sonnet-20240620"
 
 PERPLEXITY_API_KEY = os.environ.get("PERPLEXITY_API_KEY")
+PERPLEXITY_CHAT_MODEL = "llama-3.1-sonar-small-128k-online"
+PERPLEXITY_API_URL = "https://api.perplexity.ai/chat/completions"
 
-# Initialize OpenAI
-open_AI_client = OpenAI(
-    api_key=OPEN_AI_KEY,
-)
+# Connection pooling and timeouts for provider HTTP requests
+AI_HTTP_POOL_SIZE = int(os.environ.get("AI_HTTP_POOL_SIZE", 10))
+AI_HTTP_CONNECT_TIMEOUT = float(os.environ.get("AI_HTTP_CONNECT_TIMEOUT", 5))
+AI_HTTP_READ_TIMEOUT = float(os.environ.get("AI_HTTP_READ_TIMEOUT", 60))
 
-# Initialize Anthropics
-anthropic_client = anthropic.Anthropic(
-    # defaults to os.environ.get("ANTHROPIC_API_KEY")
-    api_key=ANTHROPIC_AI_API_KEY
-)
+# Persistent cache for parsed AI responses
+AI_CACHE_ENABLED = os.environ.get("AI_CACHE_ENABLED", "1") != "0"
+AI_CACHE_REFRESH = os.environ.get("AI_CACHE_REFRESH", "0") == "1"
+AI_CACHE_PATH = os.environ.get("AI_CACHE_PATH", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '.cache', 'ai_responses.sqlite3'))
+AI_CACHE_TTL_SECONDS = int(os.environ.get(
+    "AI_CACHE_TTL_SECONDS", 7 * 24 * 60 * 60))
+AI_CACHE_MAX_ENTRIES = int(os.environ.get("AI_CACHE_MAX_ENTRIES", 50000))
 
+# Circuit breakers: a provider is skipped for CIRCUIT_RESET_SECONDS after this many
+# consecutive failures, where a call slower than the latency threshold counts as a failure
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", 5))
+CIRCUIT_LATENCY_THRESHOLD_SECONDS = float(
+    os.environ.get("CIRCUIT_LATENCY_THRESHOLD_SECONDS", 30))
+CIRCUIT_RESET_SECONDS = float(os.environ.get("CIRCUIT_RESET_SECONDS", 30))
+
+# Hedged requests: a backup request is sent when the primary has not answered within the
+# provider's p95 latency (or the default delay until enough latencies were observed)
+HEDGED_CALL_SITES = set(
+    filter(None, os.environ.get("AI_HEDGED_CALL_SITES", "").split(',')))
+HEDGE_DEFAULT_DELAY_SECONDS = float(
+    os.environ.get("HEDGE_DEFAULT_DELAY_SECONDS", 2))
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW_SIZE = 200
+
+GEMINI_MAX_RETRIES = 1
+
+# Order in which chat providers are tried when one fails
+AI_CHAT_FALLBACK_CHAIN = ['gemini', 'openAI', 'claude']
+
+# Maximum number of in-flight requests per provider for the async client layer
+PROVIDER_CONCURRENCY = {
+    'gemini': int(os.environ.get("GEMINI_MAX_CONCURRENCY", 8)),
+    'openAI': int(os.environ.get("OPENAI_MAX_CONCURRENCY", 8)),
+    'claude': int(os.environ.get("ANTHROPIC_MAX_CONCURRENCY", 4)),
+    'perplexity': int(os.environ.get("PERPLEXITY_MAX_CONCURRENCY", 4)),
+}
+
+# Client-side quotas per provider, enforced with token buckets; 0 disables a limit.
+# Set these to the account's actual quotas to run at the highest throughput they allow.
+PROVIDER_RATE_LIMITS = {
+    'gemini': {
+        "requests_per_minute": int(os.environ.get("GEMINI_REQUESTS_PER_MINUTE", 2000)),
+        "tokens_per_minute": int(os.environ.get("GEMINI_TOKENS_PER_MINUTE", 4000000)),
+    },
+    'openAI': {
+        "requests_per_minute": int(os.environ.get("OPENAI_REQUESTS_PER_MINUTE", 3500)),
+        "tokens_per_minute": int(os.environ.get("OPENAI_TOKENS_PER_MINUTE", 200000)),
+    },
+    'claude': {
+        "requests_per_minute": int(os.environ.get("ANTHROPIC_REQUESTS_PER_MINUTE", 50)),
+        "tokens_per_minute": int(os.environ.get("ANTHROPIC_TOKENS_PER_MINUTE", 40000)),
+    },
+    'perplexity': {
+        "requests_per_minute": int(os.environ.get("PERPLEXITY_REQUESTS_PER_MINUTE", 50)),
+        "tokens_per_minute": int(os.environ.get("PERPLEXITY_TOKENS_PER_MINUTE", 0)),
+    },
+}
+
+# Retries of a request answered with HTTP 429, waiting for Retry-After when the provider
+# sends it and for an exponential backoff otherwise
+RATE_LIMIT_MAX_RETRIES = int(os.environ.get("RATE_LIMIT_MAX_RETRIES", 3))
+RATE_LIMIT_BACKOFF_SECONDS = 1.0
+RATE_LIMIT_MAX_BACKOFF_SECONDS = 60.0
+
+# Rough prompt size in tokens, and the completion budget assumed for Perplexity requests
+CHARS_PER_TOKEN = 4
+PERPLEXITY_ESTIMATED_COMPLETION_TOKENS = 500
 
 # Set up logging
-app = Flask(__name__)
-app.logger.setLevel(logging.INFO)
-
-# Initialize Google Generative AI
-genai.configure(api_key=GOOGLE_AI_API_KEY)
-
-
-def get_ai_chat_response(prompt, ai_engine='gemini', ai_model=OPEN_AI_CHAT_MODEL, response_format="text", max_tokens=500, num_of_choices=1):
-    if ai_engine == 'gemini':
-        result = []
-        while num_of_choices > 0:
-            ai_response = get_gemini_response(
-                prompt, response_format, max_tokens, num_of_choices)
-            # if ai_response and is a dict, it means it's a json object
-            if ai_response:
-                result.extend(ai_response)
-                num_of_choices -= len(ai_response)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+# Provider SDKs are imported and their clients built on first use, so importing this
+# module stays cheap for runs and workers that only talk to some of the providers.
+def _create_open_ai_client():
+    from openai import OpenAI
+    return OpenAI(
+        api_key=OPEN_AI_KEY,
+        timeout=AI_HTTP_READ_TIMEOUT,
+    )
+
+
+def _create_anthropic_client():
+    import anthropic
+    return anthropic.Anthropic(
+        # defaults to os.environ.get("ANTHROPIC_API_KEY")
+        api_key=ANTHROPIC_AI_API_KEY,
+        timeout=AI_HTTP_READ_TIMEOUT,
+    )
+
+
+def _create_gemini_client():
+    import google.generativeai as genai
+    genai.configure(api_key=GOOGLE_AI_API_KEY)
+    return genai
+
+
+PROVIDER_CLIENT_FACTORIES = {
+    'openAI': _create_open_ai_client,
+    'claude': _create_anthropic_client,
+    'gemini': _create_gemini_client,
+}
+
+_provider_clients = {}
+_provider_clients_lock = threading.Lock()
+
+
+def get_provider_client(provider: str):
+    """
+    Return the client for a provider, importing its SDK and building the client on first use.
+
+    Args:
+        provider (str): One of the keys of PROVIDER_CLIENT_FACTORIES.
+
+    Returns:
+        The OpenAI client, the Anthropic client, or the configured google.generativeai module.
+    """
+    with _provider_clients_lock:
+        if provider not in _provider_clients:
+            _provider_clients[provider] = PROVIDER_CLIENT_FACTORIES[provider]()
+        return _provider_clients[provider]
+
+
+def get_loaded_providers() -> List[str]:
+    with _provider_clients_lock:
+        return list(_provider_clients)
+
+
+def __getattr__(name: str):
+    # Keep the old module-level client names working without building them at import
+    if name == 'open_AI_client':
+        return get_provider_client('openAI')
+    if name == 'anthropic_client':
+        return get_provider_client('claude')
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class AIResponseCache:
+    """
+    SQLite-backed cache of parsed AI responses, keyed by a content hash of the request.
+
+    Entries expire after `ttl_seconds` and the least recently used entries are
+    evicted once the cache grows beyond `max_entries`.
+    """
+
+    def __init__(self, path: str, ttl_seconds: int = AI_CACHE_TTL_SECONDS, max_entries: int = AI_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = None
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if self.path != ':memory:':
+                os.makedirs(os.path.dirname(
+                    os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS ai_cache (
+                    key TEXT PRIMARY KEY,
+                    provider TEXT NOT NULL,
+                    model TEXT,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_accessed REAL NOT NULL
+                )""")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_ai_cache_last_accessed ON ai_cache (last_accessed)")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT response, created_at FROM ai_cache WHERE key = ?", (key,)).fetchone()
+            now = time.time()
+            if row is None:
+                self.misses += 1
+                return None
+            if now - row[1] > self.ttl_seconds:
+                conn.execute("DELETE FROM ai_cache WHERE key = ?", (key,))
+                conn.commit()
+                self.expirations += 1
+                self.misses += 1
+                return None
+            conn.execute(
+                "UPDATE ai_cache SET last_accessed = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def set(self, key: str, provider: str, model: str, response: Any):
+        with self._lock:
+            conn = self._connection()
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO ai_cache (key, provider, model, response, created_at, last_accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, provider, model, json.dumps(response), now, now))
+            self.writes += 1
+
+            count = conn.execute("SELECT COUNT(*) FROM ai_cache").fetchone()[0]
+            if count > self.max_entries:
+                overflow = count - self.max_entries
+                conn.execute(
+                    "DELETE FROM ai_cache WHERE key IN (SELECT key FROM ai_cache ORDER BY last_accessed ASC LIMIT ?)", (overflow,))
+                self.evictions += overflow
+            conn.commit()
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM ai_cache")
+            conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._connection().execute(
+                "SELECT COUNT(*) FROM ai_cache").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "writes": self.writes,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+        }
+
+
+ai_cache = AIResponseCache(AI_CACHE_PATH)
+
+
+class ProviderSessionManager:
+    """
+    Holds the long-lived connections and model objects used to talk to AI providers.
+
+    HTTP requests go through one pooled keep-alive requests session, so repeated calls
+    to the same provider reuse TLS connections instead of opening a new one per request.
+    Gemini model and generation config objects are built once per model and format.
+    """
+
+    def __init__(self, pool_size: int = AI_HTTP_POOL_SIZE, connect_timeout: float = AI_HTTP_CONNECT_TIMEOUT, read_timeout: float = AI_HTTP_READ_TIMEOUT):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._lock = threading.Lock()
+        self._session = None
+        self._adapter = None
+        self._gemini_models = {}
+        self._gemini_generation_configs = {}
+        self.model_cache_hits = 0
+        self.model_cache_misses = 0
+
+    @property
+    def timeout(self):
+        return (self.connect_timeout, self.read_timeout)
+
+    def http_session(self):
+        with self._lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                adapter = HTTPAdapter(
+                    pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                session = requests.Session()
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._adapter = adapter
+                self._session = session
+            return self._session
+
+    def post(self, url: str, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return self.http_session().post(url, **kwargs)
+
+    def gemini_model(self, model_name: str = GEMINI_AI_CHAT_MODEL):
+        with self._lock:
+            if model_name in self._gemini_models:
+                self.model_cache_hits += 1
             else:
-                app.logger.info(
-                    f"Unable to get response from Gemini AI chat, will try OpenAI.")
-                return get_open_ai_response(prompt, ai_model, response_format, max_tokens, num_of_choices)
-        return result
+                self.model_cache_misses += 1
+                self._gemini_models[model_name] = get_provider_client(
+                    'gemini').GenerativeModel(model_name)
+            return self._gemini_models[model_name]
+
+    def gemini_generation_config(self, response_format: str = "text"):
+        with self._lock:
+            if response_format not in self._gemini_generation_configs:
+                self._gemini_generation_configs[response_format] = get_provider_client('gemini').types.GenerationConfig(
+                    candidate_count=1,
+                    temperature=0,
+                    top_k=1,
+                    response_mime_type='application/json' if response_format == "json_object" else 'text/plain',
+                )
+            return self._gemini_generation_configs[response_format]
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = None
+            self._adapter = None
+
+    def connection_stats(self) -> Dict[str, Any]:
+        """
+        Report how often pooled HTTP connections were reused.
+
+        Returns:
+            Dict[str, Any]: Requests sent, connections opened and reused, and the reuse rate,
+            plus Gemini model cache hits and misses.
+        """
+        requests_sent = 0
+        connections_opened = 0
+        with self._lock:
+            if self._adapter is not None:
+                pools = self._adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools.get(key)
+                    if pool is not None:
+                        requests_sent += pool.num_requests
+                        connections_opened += pool.num_connections
+        connections_reused = max(requests_sent - connections_opened, 0)
+        return {
+            "requests": requests_sent,
+            "connections_opened": connections_opened,
+            "connections_reused": connections_reused,
+            "reuse_rate": connections_reused / requests_sent if requests_sent else 0.0,
+            "model_cache_hits": self.model_cache_hits,
+            "model_cache_misses": self.model_cache_misses,
+        }
+
+
+session_manager = ProviderSessionManager()
+
+
+def configure_provider_sessions(pool_size: int = None, connect_timeout: float = None, read_timeout: float = None):
+    """
+    Replace the provider session manager with one using the given pool size and timeouts.
+    """
+    global session_manager
+    session_manager.close()
+    session_manager = ProviderSessionManager(
+        pool_size if pool_size is not None else session_manager.pool_size,
+        connect_timeout if connect_timeout is not None else session_manager.connect_timeout,
+        read_timeout if read_timeout is not None else session_manager.read_timeout)
+
+
+def get_provider_connection_stats() -> Dict[str, Any]:
+    return session_manager.connection_stats()
+
+
+class ProviderUnavailableError(RuntimeError):
+    """Raised when a provider's circuit breaker is open and the request was not sent."""
+
+
+class LatencyTracker:
+    """Sliding window of a provider's recent successful request latencies."""
+
+    def __init__(self, window_size: int = LATENCY_WINDOW_SIZE):
+        self._lock = threading.Lock()
+        self._latencies = collections.deque(maxlen=window_size)
+
+    def record(self, latency: float):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def percentile(self, percent: float) -> Union[float, None]:
+        with self._lock:
+            if not self._latencies:
+                return None
+            ordered = sorted(self._latencies)
+        index = min(int(len(ordered) * percent / 100), len(ordered) - 1)
+        return ordered[index]
+
+    def __len__(self):
+        return len(self._latencies)
+
+
+class CircuitBreaker:
+    """
+    Per-provider circuit breaker.
+
+    Closed: requests flow normally. After `failure_threshold` consecutive failures the
+    breaker opens and requests are skipped for `reset_seconds`, after which a single
+    probe request is let through (half-open); its outcome closes or re-opens the breaker.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, provider: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 latency_threshold: float = CIRCUIT_LATENCY_THRESHOLD_SECONDS, reset_seconds: float = CIRCUIT_RESET_SECONDS):
+        self.provider = provider
+        self.failure_threshold = failure_threshold
+        self.latency_threshold = latency_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self.times_opened = 0
+        self.skipped_requests = 0
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.skipped_requests += 1
+            return False
+
+    def record_success(self, latency: float):
+        if latency > self.latency_threshold:
+            # A latency spike counts against the provider even though it answered
+            self.record_failure()
+            return
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "skipped_requests": self.skipped_requests,
+        }
+
+
+circuit_breakers = {provider: CircuitBreaker(provider)
+                    for provider in AI_CHAT_FALLBACK_CHAIN + ['perplexity']}
+latency_trackers = {provider: LatencyTracker()
+                    for provider in AI_CHAT_FALLBACK_CHAIN + ['perplexity']}
+hedge_stats = {"hedged_requests": 0, "backup_requests": 0, "backup_wins": 0}
+_hedge_stats_lock = threading.Lock()
+_hedge_executor = None
+
+
+_ai_tenant = contextvars.ContextVar('ai_tenant', default='default')
+
+
+@contextlib.contextmanager
+def ai_tenant(tenant: str):
+    """
+    Attribute the AI requests made inside the block to `tenant`, e.g. an employee's user ID.
+
+    When a provider's quota is saturated, queued requests are granted round-robin across
+    tenants so one large employee cannot starve the others.
+    """
+    token = _ai_tenant.set(tenant)
+    try:
+        yield
+    finally:
+        _ai_tenant.reset(token)
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `rate_per_minute`, holding at most one minute's worth.
+
+    Not thread-safe on its own; RateLimitScheduler uses it under its lock.
+    A rate of 0 means unlimited.
+    """
+
+    def __init__(self, rate_per_minute: int):
+        self.capacity = float(rate_per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens +
+                          (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    def time_until_available(self, amount: float, now: float) -> float:
+        if self.capacity <= 0:
+            return 0.0
+        self._refill(now)
+        # A request larger than the whole bucket waits for a full bucket instead of forever
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) * 60 / self.capacity
+
+    def consume(self, amount: float, now: float):
+        if self.capacity <= 0:
+            return
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+
+
+class RateLimitScheduler:
+    """
+    Per-provider admission control for AI requests.
+
+    A request is sent once both the requests/min and tokens/min buckets can cover it and
+    no Retry-After backoff is pending. Waiting requests are queued per tenant (see
+    ai_tenant) and granted round-robin across tenants, first-in first-out within one.
+    """
+
+    def __init__(self, provider: str, requests_per_minute: int = 0, tokens_per_minute: int = 0):
+        self.provider = provider
+        self._condition = threading.Condition()
+        self._queues = collections.OrderedDict()
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self._blocked_until = 0.0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.granted = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.rate_limited = 0
+        self.retries = 0
+
+    def configure(self, requests_per_minute: int = None, tokens_per_minute: int = None):
+        with self._condition:
+            if requests_per_minute is not None:
+                self._requests = TokenBucket(requests_per_minute)
+            if tokens_per_minute is not None:
+                self._tokens = TokenBucket(tokens_per_minute)
+            self._condition.notify_all()
+
+    def acquire(self, tokens: int = 0) -> float:
+        """
+        Block until the request may be sent and take its share of the quotas.
+
+        Args:
+            tokens (int): The estimated prompt plus completion tokens of the request.
+
+        Returns:
+            float: The seconds spent waiting.
+        """
+        tenant = _ai_tenant.get()
+        ticket = object()
+        start = time.monotonic()
+        with self._condition:
+            self._queues.setdefault(tenant, collections.deque()).append(ticket)
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+            while True:
+                head_tenant = next(iter(self._queues))
+                if self._queues[head_tenant][0] is not ticket:
+                    self._condition.wait()
+                    continue
+                now = time.monotonic()
+                delay = max(self._blocked_until - now,
+                            self._requests.time_until_available(1, now),
+                            self._tokens.time_until_available(tokens, now))
+                if delay <= 0:
+                    break
+                self._condition.wait(delay)
+
+            self._requests.consume(1, now)
+            self._tokens.consume(tokens, now)
+            # Move the tenant to the back of the rotation if it still has requests waiting
+            queue = self._queues.pop(tenant)
+            queue.popleft()
+            if queue:
+                self._queues[tenant] = queue
+            self.queue_depth -= 1
+
+            waited = now - start
+            self.granted += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            self._condition.notify_all()
+        return waited
+
+    def backoff(self, seconds: float):
+        """Hold every request to this provider for `seconds` after a 429 response."""
+        with self._condition:
+            self.rate_limited += 1
+            self._blocked_until = max(
+                self._blocked_until, time.monotonic() + seconds)
+            self._condition.notify_all()
+
+    def limits(self) -> Dict[str, int]:
+        """The current requests/min and tokens/min quotas; 0 means unlimited."""
+        with self._condition:
+            return {"requests_per_minute": int(self._requests.capacity), "tokens_per_minute": int(self._tokens.capacity)}
+
+    def record_retry(self):
+        """Count a request sent again after a 429 response."""
+        with self._condition:
+            self.retries += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                "queue_depth": self.queue_depth,
+                "max_queue_depth": self.max_queue_depth,
+                "granted": self.granted,
+                "avg_wait_seconds": self.total_wait / self.granted if self.granted else 0.0,
+                "max_wait_seconds": self.max_wait,
+                "rate_limited": self.rate_limited,
+                "retries": self.retries,
+            }
+
+
+rate_limiters = {provider: RateLimitScheduler(provider, **limits)
+                 for provider, limits in PROVIDER_RATE_LIMITS.items()}
+
+
+def configure_rate_limits(provider: str, requests_per_minute: int = None, tokens_per_minute: int = None):
+    """Change a provider's client-side quotas; 0 disables a limit."""
+    rate_limiters[provider].configure(requests_per_minute, tokens_per_minute)
+
+
+def get_rate_limits() -> Dict[str, Dict[str, int]]:
+    """Every provider's current quotas, as keyword arguments of configure_rate_limits."""
+    return {provider: scheduler.limits() for provider, scheduler in rate_limiters.items()}
+
+
+def share_rate_limits(rate_limits: Dict[str, Dict[str, int]], processes: int):
+    """
+    Configure this process with its share of quotas split between `processes` processes.
+
+    Each process enforces its quotas on its own, so worker processes would together send
+    up to `processes` times the quotas; a process pool runs this as its initializer instead.
+    A limit is never split below 1, since 0 would disable it.
+
+    Args:
+        rate_limits (Dict[str, Dict[str, int]]): The quotas to split, from get_rate_limits() in the parent.
+        processes (int): The number of processes sharing them.
+    """
+    for provider, limits in rate_limits.items():
+        configure_rate_limits(provider, **{name: max(limit // processes, 1) if limit > 0 else 0
+                                           for name, limit in limits.items()})
+
+
+def get_rate_limit_stats() -> Dict[str, Dict[str, Any]]:
+    return {provider: scheduler.stats() for provider, scheduler in rate_limiters.items()}
+
+
+def estimate_tokens(prompt: str, max_tokens: int = 0) -> int:
+    """Rough token cost of a request for the tokens/min quota: the prompt plus the completion budget."""
+    return len(prompt) // CHARS_PER_TOKEN + max_tokens
+
+
+def _parse_retry_after(value: Any) -> Union[float, None]:
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0.0)
+
+
+def _rate_limit_retry_after(error: Exception) -> Union[float, None]:
+    """
+    Recognise a provider's HTTP 429 error.
+
+    The OpenAI and Anthropic SDKs expose `status_code`, requests' HTTPError its `response`,
+    and Google API errors a `code`.
+
+    Returns:
+        Union[float, None]: None if the error is not a 429, otherwise the Retry-After delay
+        in seconds, or 0.0 when the provider did not send one.
+    """
+    response = getattr(error, 'response', None)
+    status = getattr(error, 'status_code', None) or getattr(
+        response, 'status_code', None) or getattr(error, 'code', None)
+    if status != 429:
+        return None
+    headers = getattr(response, 'headers', None) or {}
+    retry_after = _parse_retry_after(headers.get('retry-after'))
+    return 0.0 if retry_after is None else retry_after
+
+
+def get_circuit_breaker_stats() -> Dict[str, Dict[str, Any]]:
+    stats = {}
+    for provider, breaker in circuit_breakers.items():
+        stats[provider] = breaker.stats()
+        stats[provider]["p95_latency"] = latency_trackers[provider].percentile(95)
+    return stats
+
+
+def get_hedge_stats() -> Dict[str, int]:
+    with _hedge_stats_lock:
+        return dict(hedge_stats)
+
+
+def should_hedge(call_site: str) -> bool:
+    """Whether requests from the named call site should be hedged (see AI_HEDGED_CALL_SITES)."""
+    return call_site in HEDGED_CALL_SITES
+
+
+def _count_hedge(key: str):
+    with _hedge_stats_lock:
+        hedge_stats[key] += 1
+
+
+def _call_provider(provider: str, call, is_failure=lambda result: False, tokens: int = 0):
+    """
+    Send one request to a provider through its circuit breaker and rate limiter.
+
+    Raises ProviderUnavailableError without calling the provider when its breaker is open.
+    The request waits for the provider's quotas (see RateLimitScheduler); a 429 response is
+    retried up to RATE_LIMIT_MAX_RETRIES times after the provider's Retry-After delay.
+    Other exceptions raised by `call`, a 429 that outlasts the retries, and results for
+    which `is_failure` is true count as failures.
+    """
+    breaker = circuit_breakers[provider]
+    if not breaker.allow_request():
+        raise ProviderUnavailableError(
+            f"Circuit breaker for {provider} is open, skipping request")
+
+    scheduler = rate_limiters[provider]
+    attempt = 0
+    while True:
+        scheduler.acquire(tokens)
+        start = time.monotonic()
+        try:
+            result = call()
+            break
+        except Exception as e:
+            retry_after = _rate_limit_retry_after(e)
+            if retry_after is not None and attempt < RATE_LIMIT_MAX_RETRIES:
+                delay = retry_after or min(
+                    RATE_LIMIT_BACKOFF_SECONDS * 2 ** attempt, RATE_LIMIT_MAX_BACKOFF_SECONDS)
+                logger.warning(
+                    f"Rate limited by {provider}, retrying in {delay:.1f}s")
+                scheduler.backoff(delay)
+                scheduler.record_retry()
+                attempt += 1
+                continue
+            breaker.record_failure()
+            raise
+
+    if is_failure(result):
+        breaker.record_failure()
     else:
-        return get_open_ai_response(prompt, ai_model, response_format, max_tokens, num_of_choices)
+        latency = time.monotonic() - start
+        breaker.record_success(latency)
+        latency_trackers[provider].record(latency)
+    return result
 
 
-def get_open_ai_response(prompt, ai_model=OPEN_AI_CHAT_MODEL, response_format="text", max_tokens=500, num_of_choices=1) -> Union[List[str], List[dict]]:
+def _hedge_delay(provider: str) -> float:
+    tracker = latency_trackers[provider]
+    if len(tracker) < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_DELAY_SECONDS
+    return tracker.percentile(95)
+
+
+def _get_hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_executor
+    with _ai_executor_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(
+                max_workers=32, thread_name_prefix='ai-hedge')
+        return _hedge_executor
+
+
+def _hedged_call(provider: str, primary, backup, is_valid):
+    """
+    Run `primary`, and if it has not returned a valid result within the provider's p95
+    latency, also run `backup`; return the first valid result.
+
+    The slower request is not cancelled, its result is discarded. If neither produces a
+    valid result, the primary's result (or exception) is returned.
+    """
+    executor = _get_hedge_executor()
+    _count_hedge("hedged_requests")
+    primary_future = executor.submit(contextvars.copy_context().run, primary)
+    done, _ = wait([primary_future], timeout=_hedge_delay(provider))
+    if done and primary_future.exception() is None and is_valid(primary_future.result()):
+        return primary_future.result()
+
+    _count_hedge("backup_requests")
+    backup_future = executor.submit(contextvars.copy_context().run, backup)
+    pending = {primary_future, backup_future}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None and is_valid(future.result()):
+                if future is backup_future:
+                    _count_hedge("backup_wins")
+                return future.result()
+
+    return primary_future.result()
+
+
+def configure_ai_cache(enabled: bool = None, refresh: bool = None, path: str = None, ttl_seconds: int = None, max_entries: int = None):
+    """
+    Change the AI response cache settings for the rest of the run.
+
+    Args:
+        enabled (bool): Whether cached responses are read and written at all.
+        refresh (bool): Skip cache reads but still store fresh responses.
+        path (str): Location of the SQLite cache file.
+        ttl_seconds (int): Age after which cached responses are ignored.
+        max_entries (int): Maximum number of entries kept before LRU eviction.
+    """
+    global AI_CACHE_ENABLED, AI_CACHE_REFRESH, ai_cache
+    if enabled is not None:
+        AI_CACHE_ENABLED = enabled
+    if refresh is not None:
+        AI_CACHE_REFRESH = refresh
+    if path is not None and path != ai_cache.path:
+        ai_cache = AIResponseCache(
+            path, ai_cache.ttl_seconds, ai_cache.max_entries)
+    if ttl_seconds is not None:
+        ai_cache.ttl_seconds = ttl_seconds
+    if max_entries is not None:
+        ai_cache.max_entries = max_entries
+
+
+def get_ai_cache_stats() -> Dict[str, Any]:
+    return ai_cache.stats()
+
+
+def make_cache_key(provider: str, model: str, prompt: str, response_format: str, **params) -> str:
+    key_material = json.dumps(
+        [provider, model, prompt, response_format, params], sort_keys=True)
+    return hashlib.sha256(key_material.encode('utf-8')).hexdigest()
+
+
+def _is_cacheable(response: Any) -> bool:
+    # Empty results are what the providers return on failure, never cache those
+    if not response:
+        return False
+    if isinstance(response, list):
+        return any(item for item in response)
+    return True
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent identical requests.
+
+    The first caller for a key (the leader) runs the request; callers arriving with the
+    same key while it is in flight wait for the leader's result, or exception, instead of
+    sending their own. Thread and asyncio callers share the same in-flight registry.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, Future] = {}
+        # Keys the current context is already leading, so the leader's own nested calls
+        # (an async leader runs the sync call on the executor) do not wait on themselves
+        self._leading = contextvars.ContextVar('single_flight_leading', default=frozenset())
+        self.leaders = 0
+        self.coalesced = 0
+
+    def _join_or_lead(self, key: str):
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = Future()
+            self._in_flight[key] = future
+            self.leaders += 1
+            return future, True
+
+    def _finish(self, key: str, future: Future, result: Any = None, error: BaseException = None):
+        with self._lock:
+            del self._in_flight[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key: str, call):
+        """Run `call`, or wait for the identical in-flight call, and return its result."""
+        if key in self._leading.get():
+            return call()
+        future, leader = self._join_or_lead(key)
+        if not leader:
+            return copy.deepcopy(future.result())
+
+        token = self._leading.set(self._leading.get() | {key})
+        try:
+            result = call()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        finally:
+            self._leading.reset(token)
+        self._finish(key, future, result)
+        return result
+
+    async def async_do(self, key: str, call):
+        """Async variant of do; `call` is a coroutine function."""
+        if key in self._leading.get():
+            return await call()
+        future, leader = self._join_or_lead(key)
+        if not leader:
+            return copy.deepcopy(await asyncio.wrap_future(future))
+
+        token = self._leading.set(self._leading.get() | {key})
+        try:
+            result = await call()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        finally:
+            self._leading.reset(token)
+        self._finish(key, future, result)
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self._in_flight)}
+
+
+single_flight = SingleFlight()
+
+
+def get_single_flight_stats() -> Dict[str, int]:
+    return single_flight.stats()
+
+
+def _chat_cache_key(prompt, ai_engine, ai_model, response_format, max_tokens, num_of_choices) -> str:
+    return make_cache_key(ai_engine, ai_model, prompt, response_format,
+                          max_tokens=max_tokens, num_of_choices=num_of_choices)
+
+
+def _perplexity_cache_key(prompt: str) -> str:
+    return make_cache_key('perplexity', PERPLEXITY_CHAT_MODEL, prompt, "json_object")
+
+
+def _cached_call(provider: str, model: str, prompt: str, response_format: str, params: Dict[str, Any], use_cache: bool, refresh_cache: bool, call):
+    """
+    Serve a provider call from the AI response cache, coalescing identical calls in flight.
+
+    With `use_cache` False the call is always sent on its own.
+    """
+    if not use_cache:
+        return call()
+
+    key = make_cache_key(provider, model, prompt, response_format, **params)
+    return single_flight.do(key, lambda: _read_through_cache(key, provider, model, refresh_cache, call))
+
+
+def _read_through_cache(key: str, provider: str, model: str, refresh_cache: bool, call):
+    if not AI_CACHE_ENABLED:
+        return call()
+
+    if not (refresh_cache or AI_CACHE_REFRESH):
+        try:
+            cached = ai_cache.get(key)
+        except sqlite3.Error as e:
+            logger.warning(f"Unable to read AI response cache. error:{e}")
+            cached = None
+        if cached is not None:
+            return cached
+
+    response = call()
+    if _is_cacheable(response):
+        try:
+            ai_cache.set(key, provider, model, response)
+        except sqlite3.Error as e:
+            logger.warning(f"Unable to write AI response cache. error:{e}")
+    return response
+
+
+def get_ai_chat_response(prompt, ai_engine='gemini', ai_model=OPEN_AI_CHAT_MODEL, response_format="text", max_tokens=500, num_of_choices=1, use_cache=True, refresh_cache=False, hedge=False):
+    """
+    Get a chat completion, falling back Gemini -> OpenAI -> Claude when a provider fails.
+
+    Providers whose circuit breaker is open are skipped. With `hedge`, a backup request
+    to the next provider in the chain is sent if the first one is slower than its p95
+    latency, and the first valid answer wins.
+    """
+    return _cached_call(
+        ai_engine, ai_model, prompt, response_format,
+        {"max_tokens": max_tokens, "num_of_choices": num_of_choices},
+        use_cache, refresh_cache,
+        lambda: _get_ai_chat_response(prompt, ai_engine, ai_model, response_format, max_tokens, num_of_choices, hedge))
+
+
+def _get_ai_chat_response(prompt, ai_engine='gemini', ai_model=OPEN_AI_CHAT_MODEL, response_format="text", max_tokens=500, num_of_choices=1, hedge=False):
+    primary = ai_engine if ai_engine == 'gemini' else 'openAI'
+
+    def run_chain(provider):
+        if provider == 'gemini':
+            return _get_gemini_chat_response(prompt, ai_model, response_format, max_tokens, num_of_choices)
+        if provider == 'openAI':
+            return get_open_ai_response(prompt, ai_model, response_format, max_tokens, num_of_choices)
+        return get_claude_response(prompt, response_format, max_tokens, num_of_choices)
+
+    if not hedge:
+        return run_chain(primary)
+
+    backup = AI_CHAT_FALLBACK_CHAIN[AI_CHAT_FALLBACK_CHAIN.index(primary) + 1]
+    return _hedged_call(primary, lambda: run_chain(primary), lambda: run_chain(backup), _is_cacheable)
+
+
+def _get_gemini_chat_response(prompt, ai_model=OPEN_AI_CHAT_MODEL, response_format="text", max_tokens=500, num_of_choices=1):
     result = []
+    while num_of_choices > 0:
+        try:
+            ai_response = _call_provider('gemini', lambda: get_gemini_response(
+                prompt, response_format, max_tokens, num_of_choices), lambda response: not response,
+                estimate_tokens(prompt, max_tokens))
+        except Exception as e:
+            # An open breaker, or a 429 that outlasted the retries
+            logger.info(str(e))
+            ai_response = []
+        # if ai_response and is a dict, it means it's a json object
+        if ai_response:
+            result.extend(ai_response)
+            num_of_choices -= len(ai_response)
+        else:
+            logger.info(
+                f"Unable to get response from Gemini AI chat, will try OpenAI.")
+            return get_open_ai_response(prompt, ai_model, response_format, max_tokens, num_of_choices)
+    return result
+
+
+def get_open_ai_response(prompt, ai_model=OPEN_AI_CHAT_MODEL, response_format="text", max_tokens=500, num_of_choices=1) -> Union[List[str], List[dict]]:
     try:
-        ai_response = open_AI_client.chat.completions.create(
-            model=ai_model,
-            messages=[{
-                "role": "user",
-                "content": prompt,
-            }],
-            response_format={"type": response_format},
-            max_tokens=max_tokens,
-            n=num_of_choices,
-        )
-        for choice in ai_response.choices:
-            ai_response_text = choice.message.content
-            if response_format == "json_object":
-                ai_response_json = json.loads(ai_response_text)
-                if isinstance(ai_response_json, dict):
-                    result.append(ai_response_json)
-            else:
-                result.append(ai_response_text)
-        return result if result else [{}]
+        return _call_provider('openAI', lambda: _get_open_ai_completion(
+            prompt, ai_model, response_format, max_tokens, num_of_choices),
+            tokens=estimate_tokens(prompt, max_tokens * num_of_choices))
     except Exception as e:
-        app.logger.error(
+        logger.error(
             f"Unable to get response from OpenAI chat will try Claude. error:{e}")
         return get_claude_response(prompt, response_format, max_tokens, num_of_choices)
 
 
-def get_claude_response(prompt, response_format="text", max_tokens=500, num_of_choices=1) -> Union[List[str], List[dict]]:
-    try:
-        message = anthropic_client.messages.create(
-            model=ANTHROPIC_AI_CHAT_MODEL,
-            max_tokens=max_tokens,
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
-        )
+def _get_open_ai_completion(prompt, ai_model=OPEN_AI_CHAT_MODEL, response_format="text", max_tokens=500, num_of_choices=1) -> Union[List[str], List[dict]]:
+    result = []
+    ai_response = get_provider_client('openAI').chat.completions.create(
+        model=ai_model,
+        messages=[{
+            "role": "user",
+            "content": prompt,
+        }],
+        response_format={"type": response_format},
+        max_tokens=max_tokens,
+        n=num_of_choices,
+    )
+    for choice in ai_response.choices:
+        ai_response_text = choice.message.content
         if response_format == "json_object":
-            response = json.loads(message.content[0].text)
-            if isinstance(response, dict):
-                return [response]
+            ai_response_json = json.loads(ai_response_text)
+            if isinstance(ai_response_json, dict):
+                result.append(ai_response_json)
         else:
-            response = message.content[0].text
-            return [response]
+            result.append(ai_response_text)
+    return result if result else [{}]
+
+
+def get_claude_response(prompt, response_format="text", max_tokens=500, num_of_choices=1) -> Union[List[str], List[dict]]:
+    try:
+        response = _call_provider('claude', lambda: _get_claude_completion(
+            prompt, response_format, max_tokens), tokens=estimate_tokens(prompt, max_tokens))
+        if response is not None:
+            return response
     except Exception as e:
-        app.logger.error(
+        logger.error(
             f"Unable to get response from Anthropics chat. error:{e}")
     return [{}]
 
 
+def _get_claude_completion(prompt, response_format="text", max_tokens=500) -> Union[List[str], List[dict], None]:
+    message = get_provider_client('claude').messages.create(
+        model=ANTHROPIC_AI_CHAT_MODEL,
+        max_tokens=max_tokens,
+        messages=[
+            {"role": "user", "content": prompt}
+        ],
+    )
+    if response_format == "json_object":
+        response = json.loads(message.content[0].text)
+        if isinstance(response, dict):
+            return [response]
+        return None
+    return [message.content[0].text]
+
+
 def get_gemini_response(prompt, response_format="text", max_tokens=500, num_of_choices=1) -> Union[List[str], List[dict]]:
     result = []
-    model = genai.GenerativeModel(GEMINI_AI_CHAT_MODEL)
-    generation_config = genai.types.GenerationConfig(
-        candidate_count=1,
-        temperature=0,
-        top_k=1,
-        response_mime_type='application/json' if response_format == "json_object" else 'text/plain',
-    )
+    model = session_manager.gemini_model(GEMINI_AI_CHAT_MODEL)
+    generation_config = session_manager.gemini_generation_config(
+        response_format)
+    from google.api_core.exceptions import InternalServerError
     retries = 0
     ai_response = None
-    while retries < 1:
+    ai_response_text = None
+    while retries < GEMINI_MAX_RETRIES:
         try:
             ai_response = model.generate_content(
-                prompt, generation_config=generation_config)
+                prompt, generation_config=generation_config,
+                request_options={"timeout": session_manager.read_timeout})
             ai_response_candidates = [
-                to_markdown(candidate.content.parts[0].text).data for candidate in ai_response.candidates
+                _quote_gemini_text(candidate.content.parts[0].text) for candidate in ai_response.candidates
             ]
             for ai_response_text in ai_response_candidates:
                 ai_response_text = ai_response_text.replace('\n', '').replace(
@@ -143,41 +1174,63 @@ def get_gemini_response(prompt, response_format="text", max_tokens=500, num_of_c
                     if isinstance(ai_response_json, dict):
                         result.append(ai_response_json)
                     else:
-                        app.logger.info(
+                        logger.info(
                             f"Unable to parse json from Gemini AI response. response:{ai_response_json}")
                         continue
                 else:
                     result.append(ai_response_text)
             return result
         except json.JSONDecodeError as e:
-            app.logger.warning(
+            logger.warning(
                 f"Unable to parse json from Gemini AI response will retry. response:{ai_response_text}, error:{e}")
+            retries += 1
         except Exception as e:
+            if _rate_limit_retry_after(e) is not None:
+                # Quota errors are retried by _call_provider after the provider's backoff
+                raise
             if type(e) == InternalServerError and e.code >= 500:
-                app.logger.error(
+                logger.error(
                     f"Server error: Unable to generate content with Gemini AI, will retry. error:{e}")
-                retries += 1
-                time.sleep(2 ** retries)
             else:
-                app.logger.error(
+                logger.error(
                     f"Client error: Unable to generate content with Gemini AI. error:{e}, response:{ai_response}, prompt: {prompt}")
-                retries += 1
+            retries += 1
+            # Only back off when another attempt follows; the caller falls back to the next provider otherwise
+            if retries < GEMINI_MAX_RETRIES:
                 time.sleep(2 ** retries)
     return []
 
 
-def get_perplexity_response(prompt: str) -> Dict[str, Any]:
+def get_perplexity_response(prompt: str, use_cache: bool = True, refresh_cache: bool = False, hedge: bool = False) -> Dict[str, Any]:
     """
     Send a prompt to Perplexity AI and get the response as a JSON object.
 
+    Parsed responses are served from the AI response cache when the same prompt
+    was answered before, unless `use_cache` is False or `refresh_cache` is True.
+
     Args:
         prompt (str): The prompt to send to Perplexity AI.
+        use_cache (bool): Whether to read and write the AI response cache.
+        refresh_cache (bool): Ignore any cached response but store the new one.
+        hedge (bool): Send a duplicate request if the first is slower than Perplexity's p95 latency.
 
     Returns:
         Dict[str, Any]: The parsed JSON response from Perplexity AI.
+
+    Raises:
+        ProviderUnavailableError: If Perplexity's circuit breaker is open.
     """
-    PERPLEXITY_API_URL = "https://api.perplexity.ai/chat/completions"
+    def call():
+        return _call_provider('perplexity', lambda: _get_perplexity_response(prompt),
+                              tokens=estimate_tokens(prompt, PERPLEXITY_ESTIMATED_COMPLETION_TOKENS))
+
+    return _cached_call(
+        'perplexity', PERPLEXITY_CHAT_MODEL, prompt, "json_object", {},
+        use_cache, refresh_cache,
+        (lambda: _hedged_call('perplexity', call, call, _is_cacheable)) if hedge else call)
+
 
+def _get_perplexity_response(prompt: str) -> Dict[str, Any]:
     headers = {
         "accept": "application/json",
         "content-type": "application/json",
@@ -185,7 +1238,7 @@ def get_perplexity_response(prompt: str) -> Dict[str, Any]:
     }
 
     payload = {
-        "model": "llama-3.1-sonar-small-128k-online",
+        "model": PERPLEXITY_CHAT_MODEL,
         "messages": [
             {
                 "role": "system",
@@ -198,7 +1251,8 @@ def get_perplexity_response(prompt: str) -> Dict[str, Any]:
         ]
     }
 
-    response = requests.post(PERPLEXITY_API_URL, json=payload, headers=headers)
+    response = session_manager.post(
+        PERPLEXITY_API_URL, json=payload, headers=headers)
     response.raise_for_status()
     response_data = response.json()
     # Parse the content as JSON
@@ -218,6 +1272,220 @@ def get_perplexity_response(prompt: str) -> Dict[str, Any]:
         return {}
 
 
-def to_markdown(text):
+_provider_semaphores = weakref.WeakKeyDictionary()
+_ai_executor = None
+_ai_executor_lock = threading.Lock()
+
+
+def set_provider_concurrency(provider: str, limit: int):
+    """
+    Change how many requests the async client layer keeps in flight for a provider.
+
+    Takes effect for event loops that have not used the provider yet.
+    """
+    global _ai_executor
+    PROVIDER_CONCURRENCY[provider] = limit
+    with _ai_executor_lock:
+        if _ai_executor is not None:
+            _ai_executor.shutdown(wait=False)
+            _ai_executor = None
+
+
+def _provider_semaphore(provider: str) -> asyncio.Semaphore:
+    # Semaphores belong to an event loop, so keep one set per running loop
+    loop = asyncio.get_running_loop()
+    semaphores = _provider_semaphores.setdefault(loop, {})
+    if provider not in semaphores:
+        semaphores[provider] = asyncio.Semaphore(
+            PROVIDER_CONCURRENCY.get(provider, 4))
+    return semaphores[provider]
+
+
+def _get_ai_executor() -> ThreadPoolExecutor:
+    global _ai_executor
+    with _ai_executor_lock:
+        if _ai_executor is None:
+            _ai_executor = ThreadPoolExecutor(
+                max_workers=sum(PROVIDER_CONCURRENCY.values()), thread_name_prefix='ai-client')
+        return _ai_executor
+
+
+async def _run_provider_call(provider: str, func, *args, **kwargs):
+    async with _provider_semaphore(provider):
+        ctx = contextvars.copy_context()
+        call = functools.partial(ctx.run, func, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(_get_ai_executor(), call)
+
+
+# time.monotonic() by which the async AI requests of the current evaluation must have answered
+_ai_deadline = contextvars.ContextVar('ai_deadline', default=None)
+# List the requests cut short by the deadline or failed are appended to, see track_deadline
+_expired_requests = contextvars.ContextVar('ai_expired_requests', default=None)
+deadline_stats: Dict[str, int] = {}
+# Async AI requests inside track_deadline that raised and fell back to defaults, by provider
+failed_request_stats: Dict[str, int] = {}
+_deadline_stats_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def ai_deadline(seconds: Union[float, None]):
+    """
+    Bound the async AI requests made inside the block to `seconds` from now.
+
+    A request that has not answered by then returns what the provider returns on failure
+    ({} from Perplexity, [{}] from the chat providers), so callers fall back to their
+    defaults. The request itself keeps running in the background and its answer still
+    reaches the cache and any coalesced callers. None leaves the requests unbounded; a
+    deadline nested in another keeps the earlier of the two.
+    """
+    if seconds is None:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    outer_deadline = _ai_deadline.get()
+    if outer_deadline is not None:
+        deadline = min(deadline, outer_deadline)
+    token = _ai_deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _ai_deadline.reset(token)
+
+
+async def track_deadline(awaitable) -> Any:
+    """
+    Await `awaitable` and report whether any AI request it made was cut short by the deadline.
+
+    A request that raises, e.g. with every provider's circuit open, is treated the same: it
+    returns its fallback instead of raising and counts as cut short.
+
+    Returns:
+        Tuple[Any, bool]: The result and whether it rests on fallback values.
+    """
+    expired = []
+    token = _expired_requests.set(expired)
+    try:
+        result = await awaitable
+    finally:
+        _expired_requests.reset(token)
+    return result, bool(expired)
+
+
+def _record_expired(provider: str):
+    with _deadline_stats_lock:
+        deadline_stats[provider] = deadline_stats.get(provider, 0) + 1
+    expired = _expired_requests.get()
+    if expired is not None:
+        expired.append(provider)
+
+
+def _consume_result(task: asyncio.Future):
+    # Abandoned requests may fail after nobody awaits them any more
+    if not task.cancelled():
+        task.exception()
+
+
+async def _within_deadline(provider: str, call, fallback: Any) -> Any:
+    try:
+        return await _call_within_deadline(provider, call, fallback)
+    except Exception as e:
+        expired = _expired_requests.get()
+        if expired is None:
+            raise
+        # Inside track_deadline a failed request degrades like an expired one
+        logger.warning(f"{provider} request failed, falling back to defaults: {e}")
+        with _deadline_stats_lock:
+            failed_request_stats[provider] = failed_request_stats.get(provider, 0) + 1
+        expired.append(provider)
+        return fallback
+
+
+async def _call_within_deadline(provider: str, call, fallback: Any) -> Any:
+    deadline = _ai_deadline.get()
+    if deadline is None:
+        return await call()
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        _record_expired(provider)
+        return fallback
+
+    task = asyncio.ensure_future(call())
+    try:
+        # Shielded, so a request other evaluations may be coalesced on is not cancelled
+        return await asyncio.wait_for(asyncio.shield(task), remaining)
+    except asyncio.TimeoutError:
+        task.add_done_callback(_consume_result)
+        _record_expired(provider)
+        return fallback
+
+
+def get_deadline_stats() -> Dict[str, int]:
+    """Number of async AI requests cut short by a deadline, by provider."""
+    with _deadline_stats_lock:
+        return dict(deadline_stats)
+
+
+def get_failed_request_stats() -> Dict[str, int]:
+    """Number of async AI requests that raised and fell back to defaults, by provider."""
+    with _deadline_stats_lock:
+        return dict(failed_request_stats)
+
+
+async def async_get_ai_chat_response(prompt, ai_engine='gemini', ai_model=OPEN_AI_CHAT_MODEL, response_format="text", max_tokens=500, num_of_choices=1, use_cache=True, refresh_cache=False, hedge=False):
+    """
+    Async variant of get_ai_chat_response, bounded by the provider's concurrency limit
+    and by the deadline set with ai_deadline.
+
+    Identical requests already in flight are awaited rather than queued for the provider.
+    """
+    def call():
+        return _run_provider_call(
+            ai_engine, get_ai_chat_response, prompt, ai_engine, ai_model,
+            response_format, max_tokens, num_of_choices, use_cache, refresh_cache, hedge)
+
+    if not use_cache:
+        return await _within_deadline(ai_engine, call, [{}])
+    return await _within_deadline(ai_engine, lambda: single_flight.async_do(
+        _chat_cache_key(prompt, ai_engine, ai_model, response_format, max_tokens, num_of_choices), call), [{}])
+
+
+async def async_get_open_ai_response(prompt, ai_model=OPEN_AI_CHAT_MODEL, response_format="text", max_tokens=500, num_of_choices=1) -> Union[List[str], List[dict]]:
+    return await _within_deadline('openAI', lambda: _run_provider_call(
+        'openAI', get_open_ai_response, prompt, ai_model, response_format, max_tokens, num_of_choices), [{}])
+
+
+async def async_get_claude_response(prompt, response_format="text", max_tokens=500, num_of_choices=1) -> Union[List[str], List[dict]]:
+    return await _within_deadline('claude', lambda: _run_provider_call(
+        'claude', get_claude_response, prompt, response_format, max_tokens, num_of_choices), [{}])
+
+
+async def async_get_gemini_response(prompt, response_format="text", max_tokens=500, num_of_choices=1) -> Union[List[str], List[dict]]:
+    return await _within_deadline('gemini', lambda: _run_provider_call(
+        'gemini', get_gemini_response, prompt, response_format, max_tokens, num_of_choices), [])
+
+
+async def async_get_perplexity_response(prompt: str, use_cache: bool = True, refresh_cache: bool = False, hedge: bool = False) -> Dict[str, Any]:
+    """
+    Async variant of get_perplexity_response, bounded by the provider's concurrency limit
+    and by the deadline set with ai_deadline.
+
+    Identical requests already in flight are awaited rather than queued for the provider.
+    """
+    def call():
+        return _run_provider_call(
+            'perplexity', get_perplexity_response, prompt, use_cache, refresh_cache, hedge)
+
+    if not use_cache:
+        return await _within_deadline('perplexity', call, {})
+    return await _within_deadline('perplexity', lambda: single_flight.async_do(_perplexity_cache_key(prompt), call), {})
+
+
+def _quote_gemini_text(text: str) -> str:
+    # Same text to_markdown(text).data produces, without building an IPython object
     text = text.replace('•', '  *')
-    return Markdown(textwrap.indent(text, '> ', predicate=lambda _: True))
+    return textwrap.indent(text, '> ', predicate=lambda _: True)
+
+
+def to_markdown(text):
+    from IPython.display import Markdown
+    return Markdown(_quote_gemini_text(text))
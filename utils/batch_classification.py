@@ -0,0 +1,261 @@
+"""
+Departure Shield: Batched Data Sensitivity Classification
+
+This module packs several descriptions into a single JSON-mode prompt so that data
+sensitivity can be classified with one AI request per batch instead of one per item.
+Descriptions the local classifier or the surrogate model decide confidently are not sent
+at all, near-duplicate descriptions are sent once per cluster, and items missing from, or
+malformed in, a batch response are classified individually.
+"""
+
+import asyncio
+import json
+import os
+from typing import Any, Callable, Dict, List, Set, Tuple
+
+from utils.ai_service import async_get_ai_chat_response, get_ai_chat_response, should_hedge, track_deadline
+from utils.near_duplicates import NEAR_DUPLICATE_DESCRIPTION_THRESHOLD, cluster_representatives
+from utils.sensitivity_classifier import split_confident
+from utils.surrogate_model import consult_surrogate, observe_live_verdict
+
+
+SENSITIVITY_BATCH_SIZE = int(os.environ.get("SENSITIVITY_BATCH_SIZE", 10))
+
+# Output token budget for a batch response: a fixed overhead plus a short verdict per item
+BATCH_BASE_MAX_TOKENS = 100
+BATCH_ITEM_MAX_TOKENS = 30
+
+VALID_LEVELS = ("LOW", "MEDIUM", "HIGH")
+
+
+def build_batch_sensitivity_prompt(subject: str, guidelines: str, descriptions: List[str]) -> str:
+    """
+    Build a prompt asking for the data sensitivity of several descriptions at once.
+
+    Args:
+        subject (str): What the descriptions describe, e.g. "a secret or sensitive information".
+        guidelines (str): The HIGH/MEDIUM/LOW guidelines of the single-item prompt.
+        descriptions (List[str]): The descriptions to classify.
+
+    Returns:
+        str: The batch prompt. Items are identified by their index as a string.
+    """
+    items = json.dumps([
+        {"id": str(index), "description": description}
+        for index, description in enumerate(descriptions)
+    ], indent=2)
+
+    return f"""
+    Analyze each of the following descriptions of {subject} and assess its data sensitivity level.
+    Consider factors such as the type of data, potential impact if exposed, and regulatory implications.
+
+    Items:
+    {items}
+
+    Provide your assessment as a JSON object with the following structure, with one verdict per item:
+    {{
+        "verdicts": [
+            {{ "id": "<item id>", "risk_level": "LOW" | "MEDIUM" | "HIGH" }}
+        ]
+    }}
+
+    Base your assessment on these guidelines:
+{guidelines}
+
+    Respond only with the JSON object, no additional text.
+    """
+
+
+def parse_batch_sensitivity_response(response: Any, batch_size: int) -> Dict[int, str]:
+    """
+    Extract the valid verdicts from a batch response.
+
+    Args:
+        response (Any): The response returned by get_ai_chat_response.
+        batch_size (int): The number of items in the batch.
+
+    Returns:
+        Dict[int, str]: Upper-cased risk levels by item index. Missing or invalid items are left out.
+    """
+    verdicts = {}
+    if not (response and isinstance(response, list) and isinstance(response[0], dict)):
+        return verdicts
+
+    entries = response[0].get('verdicts')
+    if not isinstance(entries, list):
+        return verdicts
+
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        try:
+            index = int(entry.get('id'))
+        except (TypeError, ValueError):
+            continue
+        level = entry.get('risk_level')
+        if 0 <= index < batch_size and isinstance(level, str) and level.upper() in VALID_LEVELS:
+            verdicts.setdefault(index, level.upper())
+
+    return verdicts
+
+
+def _batch_max_tokens(batch_size: int) -> int:
+    return BATCH_BASE_MAX_TOKENS + BATCH_ITEM_MAX_TOKENS * batch_size
+
+
+def _unique_batches(descriptions: List[str], batch_size: int) -> List[List[str]]:
+    unique_descriptions = list(dict.fromkeys(descriptions))
+    return [unique_descriptions[start:start + batch_size]
+            for start in range(0, len(unique_descriptions), batch_size)]
+
+
+def _near_duplicate_groups(descriptions: List[str]) -> Dict[str, List[str]]:
+    """Group descriptions by the representative of their near-duplicate cluster."""
+    representatives = cluster_representatives(
+        descriptions, NEAR_DUPLICATE_DESCRIPTION_THRESHOLD, "descriptions")
+    groups = {}
+    for description, representative in zip(descriptions, representatives):
+        groups.setdefault(descriptions[representative], []).append(description)
+    return groups
+
+
+def _fan_out(levels: Dict[str, Any], groups: Dict[str, List[str]]):
+    for representative, members in groups.items():
+        for description in members:
+            levels[description] = levels[representative]
+
+
+def _split_by_surrogate(descriptions: List[str], task: str, to_level: Callable[[str], Any],
+                        levels: Dict[str, Any]) -> Tuple[List[str], Dict[str, Dict[str, str]]]:
+    """
+    Fill `levels` with the surrogate's confident verdicts.
+
+    Returns:
+        Tuple[List[str], Dict[str, Dict[str, str]]]: The descriptions still to send to the AI
+        provider, and the surrogate verdicts among them sampled for a drift check.
+    """
+    if task is None:
+        return descriptions, {}
+
+    remaining = []
+    drift_checks = {}
+    for description in descriptions:
+        surrogate_labels, check_live = consult_surrogate(task, description)
+        if not check_live:
+            levels[description] = to_level(surrogate_labels['data_sensitivity'])
+            continue
+        remaining.append(description)
+        if surrogate_labels is not None:
+            drift_checks[description] = surrogate_labels
+    return remaining, drift_checks
+
+
+def _observe_batch_verdicts(task: str, batch: List[str], verdicts: Dict[int, str],
+                            drift_checks: Dict[str, Dict[str, str]]):
+    if task is None:
+        return
+    for index, level in verdicts.items():
+        observe_live_verdict(task, batch[index], {"data_sensitivity": level},
+                             drift_checks.get(batch[index]))
+
+
+def classify_in_batches(descriptions: List[str], subject: str, guidelines: str,
+                        to_level: Callable[[str], Any], classify_one: Callable[[str], Any],
+                        batch_size: int = SENSITIVITY_BATCH_SIZE, task: str = None) -> Dict[str, Any]:
+    """
+    Classify the data sensitivity of descriptions in batches of up to `batch_size`.
+
+    Duplicate descriptions are classified once, and those the local classifier or, for a
+    surrogate `task`, the surrogate model is confident about are not sent to the AI provider.
+    Of each cluster of near-duplicate descriptions only the first is sent, and its verdict
+    applies to the whole cluster. A batch of one item, and any item the batch response does
+    not answer validly, is classified with `classify_one`.
+
+    Args:
+        descriptions (List[str]): The descriptions to classify.
+        subject (str): What the descriptions describe, used in the prompt.
+        guidelines (str): The HIGH/MEDIUM/LOW guidelines used in the prompt.
+        to_level (Callable[[str], Any]): Converts an upper-cased level name to the caller's enum.
+        classify_one (Callable[[str], Any]): The single-item AI classifier used as a fallback.
+        batch_size (int): The maximum number of descriptions per request.
+        task (str): The surrogate task the verdicts are recorded under, if any.
+
+    Returns:
+        Dict[str, Any]: The sensitivity level for each distinct description.
+    """
+    decided, escalated = split_confident(descriptions)
+    levels = {description: to_level(level) for description, level in decided.items()}
+    escalated, drift_checks = _split_by_surrogate(escalated, task, to_level, levels)
+    groups = _near_duplicate_groups(escalated)
+    for batch in _unique_batches(list(groups), max(batch_size, 1)):
+        if len(batch) == 1:
+            levels[batch[0]] = classify_one(batch[0])
+            continue
+
+        response = get_ai_chat_response(
+            build_batch_sensitivity_prompt(subject, guidelines, batch), ai_engine='openAI',
+            response_format="json_object", max_tokens=_batch_max_tokens(len(batch)),
+            hedge=should_hedge('data_sensitivity_batch'))
+        verdicts = parse_batch_sensitivity_response(response, len(batch))
+        _observe_batch_verdicts(task, batch, verdicts, drift_checks)
+
+        for index, description in enumerate(batch):
+            if index in verdicts:
+                levels[description] = to_level(verdicts[index])
+            else:
+                levels[description] = classify_one(description)
+
+    _fan_out(levels, groups)
+    return levels
+
+
+async def async_classify_in_batches(descriptions: List[str], subject: str, guidelines: str,
+                                    to_level: Callable[[str], Any], classify_one,
+                                    batch_size: int = SENSITIVITY_BATCH_SIZE, task: str = None,
+                                    expired: Set[str] = None) -> Dict[str, Any]:
+    """
+    Async variant of classify_in_batches; all batches are sent concurrently.
+
+    `classify_one` must be a coroutine function. Descriptions whose level is the fallback
+    of a request cut short by the AI deadline, or of a failed request, are added to
+    `expired`, if given.
+    """
+    async def classify_fallback(description: str) -> Any:
+        # A batch request cut short answers nothing, so every expired verdict ends up here
+        level, cut_short = await track_deadline(classify_one(description))
+        if cut_short and expired is not None:
+            expired.add(description)
+        return level
+
+    async def classify_batch(batch: List[str]) -> Dict[str, Any]:
+        if len(batch) == 1:
+            return {batch[0]: await classify_fallback(batch[0])}
+
+        # A failed batch request answers nothing either, and its items are classified one by one
+        response, _ = await track_deadline(async_get_ai_chat_response(
+            build_batch_sensitivity_prompt(subject, guidelines, batch), ai_engine='openAI',
+            response_format="json_object", max_tokens=_batch_max_tokens(len(batch)),
+            hedge=should_hedge('data_sensitivity_batch')))
+        verdicts = parse_batch_sensitivity_response(response, len(batch))
+        _observe_batch_verdicts(task, batch, verdicts, drift_checks)
+
+        batch_levels = {}
+        for index, description in enumerate(batch):
+            if index in verdicts:
+                batch_levels[description] = to_level(verdicts[index])
+            else:
+                batch_levels[description] = await classify_fallback(description)
+        return batch_levels
+
+    decided, escalated = split_confident(descriptions)
+    levels = {description: to_level(level) for description, level in decided.items()}
+    escalated, drift_checks = _split_by_surrogate(escalated, task, to_level, levels)
+    groups = _near_duplicate_groups(escalated)
+    for batch_levels in await asyncio.gather(
+            *(classify_batch(batch) for batch in _unique_batches(list(groups), max(batch_size, 1)))):
+        levels.update(batch_levels)
+    _fan_out(levels, groups)
+    if expired:
+        expired.update(description for representative, members in groups.items()
+                       if representative in expired for description in members)
+    return levels
@@ -0,0 +1,66 @@
+"""
+Departure Shield: Evaluation Clock
+
+The date-based risk levels (days until rotation, days since access or transfer) are
+computed against evaluation_date(), the system date unless pinned with frozen_today. The
+transition sweep and tests use it to evaluate as of another day.
+
+Those levels only change when a day count crosses one of the thresholds, so an item's
+next level change can be computed in advance with next_transition.
+"""
+
+import contextlib
+import contextvars
+import datetime
+from typing import Any, Callable, Iterable, Optional
+
+
+# The date the current evaluation runs as of; None for the system date
+_frozen_today = contextvars.ContextVar('frozen_today', default=None)
+
+
+def evaluation_date() -> datetime.date:
+    """The date of the current evaluation."""
+    return _frozen_today.get() or datetime.date.today()
+
+
+@contextlib.contextmanager
+def frozen_today(date: Optional[datetime.date]):
+    """
+    Evaluate as of `date` inside the block, including in coroutines and AI provider calls
+    started from it. None leaves the clock unchanged.
+    """
+    if date is None:
+        yield
+        return
+    token = _frozen_today.set(date)
+    try:
+        yield
+    finally:
+        _frozen_today.reset(token)
+
+
+def next_transition(candidates: Iterable[datetime.date], state_at: Callable[[], Any],
+                    after: datetime.date = None) -> Optional[datetime.date]:
+    """
+    The first date after `after` on which an item's date-based state differs from its state then.
+
+    Args:
+        candidates (Iterable[datetime.date]): The dates a threshold is crossed on. The state
+            must be constant between them.
+        state_at (Callable[[], Any]): Computes the state as of evaluation_date().
+        after (datetime.date): The starting date, today by default.
+
+    Returns:
+        Optional[datetime.date]: The transition date, or None if the state never changes again.
+    """
+    after = after or evaluation_date()
+    with frozen_today(after):
+        current = state_at()
+    for candidate in sorted(set(candidates)):
+        if candidate <= after:
+            continue
+        with frozen_today(candidate):
+            if state_at() != current:
+                return candidate
+    return None
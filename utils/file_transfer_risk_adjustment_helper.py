@@ -86,3 +86,8 @@ def adjust_file_transfer_risk_by_file_size(risk_factors: Dict[FileTransferRiskFa
     # Ensure no risk level exceeds HIGH
     risk_factors[FileTransferRiskFactor.DATA_EXFILTRATION] = min(
         risk_factors[FileTransferRiskFactor.DATA_EXFILTRATION], FileTransferRiskLevel.HIGH)
+
+
+def additional_context_can_change_file_transfer_risk(risk_factors: Dict[FileTransferRiskFactor, FileTransferRiskLevel]) -> bool:
+    # The additional context only raises levels to HIGH
+    return any(level != FileTransferRiskLevel.HIGH for level in risk_factors.values())
@@ -0,0 +1,280 @@
+"""
+Departure Shield: Item State Store
+
+Persists, per secret and file transfer, a fingerprint of the input fields its AI
+enrichment depends on together with that enrichment, so a re-run only enriches items
+that are new or whose inputs changed. Scoring is cheap and depends on today's date
+(days until rotation, days since access or transfer), so reused items are always
+re-scored; their date fields are left out of the fingerprint for the same reason.
+
+Next to it, the transition index keeps each item's highest risk level and the date that
+level can next change on, indexed by that date, so core.transition_sweep can find the
+items due for re-scoring without visiting the others.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+ITEM_STATE_ENABLED = os.environ.get("ITEM_STATE_ENABLED", "1") != "0"
+ITEM_STATE_PATH = os.environ.get("ITEM_STATE_PATH", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '.cache', 'item_state.sqlite3'))
+# Age after which a stored enrichment is recomputed even though its inputs did not change,
+# the same default as the AI response cache
+ITEM_STATE_TTL_SECONDS = int(os.environ.get(
+    "ITEM_STATE_TTL_SECONDS", 7 * 24 * 60 * 60))
+
+logger = logging.getLogger(__name__)
+
+# Item counts by kind ('secrets', 'file_transfers') and outcome: 'new' and 'changed' items
+# were enriched, 'stale' ones too because their stored enrichment expired or lacks an
+# assessment that can now change their risk, and 'reused' ones were not
+item_state_stats: Dict[str, Dict[str, int]] = {}
+_item_state_stats_lock = threading.Lock()
+
+
+def fingerprint(record: Dict[str, Any], exclude: Iterable[str] = (), **settings: Any) -> str:
+    """
+    Content hash of a record without its `exclude` fields, and of the settings that shape its enrichment.
+    """
+    excluded = set(exclude)
+    material = json.dumps([{field: value for field, value in record.items() if field not in excluded}, settings],
+                          sort_keys=True, default=str)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class ItemStateStore:
+    """SQLite table of (kind, user ID, item ID) -> the fingerprint and enrichment last computed for the item."""
+
+    def __init__(self, path: str, ttl_seconds: int = ITEM_STATE_TTL_SECONDS):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if self.path != ':memory:':
+                os.makedirs(os.path.dirname(
+                    os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS item_state (
+                    kind TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    item_id TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    enrichment TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (kind, user_id, item_id)
+                )""")
+            # next_transition is an ISO date, NULL for an item whose level never changes again
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS item_transition (
+                    kind TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    item_id TEXT NOT NULL,
+                    risk_level TEXT NOT NULL,
+                    next_transition TEXT,
+                    PRIMARY KEY (kind, user_id, item_id)
+                )""")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS item_transition_due ON item_transition (next_transition)")
+            self._conn.commit()
+        return self._conn
+
+    def load(self, kind: str, user_id: str) -> Dict[str, Tuple[str, Any, bool]]:
+        """
+        The stored states of a user's items.
+
+        Returns:
+            Dict[str, Tuple[str, Any, bool]]: By item ID, the fingerprint, the enrichment and
+            whether it has expired.
+        """
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT item_id, fingerprint, enrichment, updated_at FROM item_state WHERE kind = ? AND user_id = ?",
+                (kind, user_id)).fetchall()
+        now = time.time()
+        return {item_id: (item_fingerprint, json.loads(enrichment), now - updated_at > self.ttl_seconds)
+                for item_id, item_fingerprint, enrichment, updated_at in rows}
+
+    def save(self, kind: str, user_id: str, states: Dict[str, Tuple[str, Any]], item_ids: List[str],
+             transitions: Dict[str, Tuple[str, Optional[datetime.date]]] = None):
+        """
+        Store the states of freshly enriched items and forget items the user no longer has.
+
+        Args:
+            kind (str): 'secrets' or 'file_transfers'.
+            user_id (str): The user the items belong to.
+            states (Dict[str, Tuple[str, Any]]): By item ID, the fingerprint and the JSON-serializable enrichment.
+            item_ids (List[str]): All of the user's current item IDs.
+            transitions (Dict[str, Tuple[str, Optional[datetime.date]]]): By item ID, the highest
+                risk level and the next transition date to record in the transition index.
+        """
+        with self._lock:
+            conn = self._connection()
+            now = time.time()
+            conn.executemany(
+                "INSERT OR REPLACE INTO item_state (kind, user_id, item_id, fingerprint, enrichment, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(kind, user_id, item_id, item_fingerprint, json.dumps(enrichment), now)
+                 for item_id, (item_fingerprint, enrichment) in states.items()])
+            self._upsert_transitions(conn, kind, user_id, transitions or {})
+            current = set(item_ids)
+            for table in ('item_state', 'item_transition'):
+                removed = [item_id for (item_id,) in conn.execute(
+                    f"SELECT item_id FROM {table} WHERE kind = ? AND user_id = ?", (kind, user_id))
+                    if item_id not in current]
+                conn.executemany(f"DELETE FROM {table} WHERE kind = ? AND user_id = ? AND item_id = ?",
+                                 [(kind, user_id, item_id) for item_id in removed])
+            conn.commit()
+
+    @staticmethod
+    def _upsert_transitions(conn: sqlite3.Connection, kind: str, user_id: str,
+                            transitions: Dict[str, Tuple[str, Optional[datetime.date]]]):
+        conn.executemany(
+            "INSERT OR REPLACE INTO item_transition (kind, user_id, item_id, risk_level, next_transition) VALUES (?, ?, ?, ?, ?)",
+            [(kind, user_id, item_id, risk_level, next_transition.isoformat() if next_transition else None)
+             for item_id, (risk_level, next_transition) in transitions.items()])
+
+    def schedule(self, kind: str, user_id: str, transitions: Dict[str, Tuple[str, Optional[datetime.date]]]):
+        """Record the highest risk level and next transition date of re-scored items."""
+        with self._lock:
+            conn = self._connection()
+            self._upsert_transitions(conn, kind, user_id, transitions)
+            conn.commit()
+
+    def due(self, date: datetime.date) -> List[Tuple[str, str, str, str]]:
+        """
+        The items whose next transition is on or before `date`, earliest first.
+
+        Returns:
+            List[Tuple[str, str, str, str]]: The kind, user ID, item ID and recorded risk level of each item.
+        """
+        with self._lock:
+            return self._connection().execute(
+                "SELECT kind, user_id, item_id, risk_level FROM item_transition WHERE next_transition <= ? "
+                "ORDER BY next_transition, kind, user_id, item_id", (date.isoformat(),)).fetchall()
+
+    def transitions(self, kind: str, user_id: str) -> Dict[str, Tuple[str, Optional[datetime.date]]]:
+        """The recorded risk level and next transition date of a user's items, by item ID."""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT item_id, risk_level, next_transition FROM item_transition WHERE kind = ? AND user_id = ?",
+                (kind, user_id)).fetchall()
+        return {item_id: (risk_level, datetime.date.fromisoformat(next_transition) if next_transition else None)
+                for item_id, risk_level, next_transition in rows}
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM item_state")
+            conn.execute("DELETE FROM item_transition")
+            conn.commit()
+
+
+item_state_store = ItemStateStore(ITEM_STATE_PATH)
+
+
+def get_item_state_store() -> ItemStateStore:
+    return item_state_store
+
+
+def configure_item_state(enabled: bool = None, path: str = None, ttl_seconds: int = None):
+    global ITEM_STATE_ENABLED, item_state_store
+    if enabled is not None:
+        ITEM_STATE_ENABLED = enabled
+    if path is not None and path != item_state_store.path:
+        item_state_store = ItemStateStore(path, item_state_store.ttl_seconds)
+    if ttl_seconds is not None:
+        item_state_store.ttl_seconds = ttl_seconds
+
+
+def item_state_enabled() -> bool:
+    return ITEM_STATE_ENABLED
+
+
+def reuse_enrichments(kind: str, user_id: str, items: List[Dict[str, Any]], id_field: str, fingerprints: List[str],
+                      reuse: Callable[[Dict[str, Any], Any], Optional[Dict[str, Any]]]) -> List[Optional[Dict[str, Any]]]:
+    """
+    The stored enrichments that can stand in for enriching a user's items again.
+
+    Args:
+        kind (str): 'secrets' or 'file_transfers'.
+        user_id (str): The user the items belong to.
+        items (List[Dict[str, Any]]): The items' metadata.
+        id_field (str): The field holding an item's ID, e.g. 'secret_id'.
+        fingerprints (List[str]): The current fingerprint of each item.
+        reuse (Callable): Decodes an unexpired stored enrichment with an unchanged fingerprint,
+            returning None when it is no longer enough to score the item.
+
+    Returns:
+        List[Optional[Dict[str, Any]]]: For each item, the enrichment to reuse, or None if it must be enriched.
+    """
+    if not ITEM_STATE_ENABLED:
+        return [None] * len(items)
+    try:
+        states = item_state_store.load(kind, user_id)
+    except (sqlite3.Error, ValueError) as e:
+        logger.warning(f"Error reading item state: {e}")
+        states = {}
+
+    enrichments, outcomes = [], []
+    for item, item_fingerprint in zip(items, fingerprints):
+        state = states.get(item[id_field])
+        enrichment = None
+        if state is None:
+            outcomes.append("new")
+        elif state[0] != item_fingerprint:
+            outcomes.append("changed")
+        else:
+            if not state[2]:
+                enrichment = reuse(item, state[1])
+            outcomes.append("stale" if enrichment is None else "reused")
+        enrichments.append(enrichment)
+    record_item_states(kind, outcomes)
+    return enrichments
+
+
+def store_enrichments(kind: str, user_id: str, items: List[Dict[str, Any]], id_field: str, fingerprints: List[str],
+                      enrichments: Dict[int, Any], transitions: Dict[int, Tuple[str, Optional[datetime.date]]] = None,
+                      item_ids: List[str] = None):
+    """
+    Store the enrichments of freshly enriched items and forget the items the user no longer has.
+
+    Args:
+        enrichments (Dict[int, Any]): JSON-serializable enrichments, by index in `items`.
+        transitions (Dict[int, Tuple[str, Optional[datetime.date]]]): The highest risk level and
+            next transition date of scored items, by index in `items`.
+        item_ids (List[str]): All of the user's current item IDs, those of `items` by default.
+            Pass them when `items` is a date-filtered subset, so the other items are not forgotten.
+    """
+    if not ITEM_STATE_ENABLED:
+        return
+    try:
+        item_state_store.save(kind, user_id, {
+            items[index][id_field]: (fingerprints[index], enrichment) for index, enrichment in enrichments.items()
+        }, item_ids if item_ids is not None else [item[id_field] for item in items], {
+            items[index][id_field]: transition for index, transition in (transitions or {}).items()
+        })
+    except sqlite3.Error as e:
+        logger.warning(f"Error writing item state: {e}")
+
+
+def record_item_states(kind: str, outcomes: List[str]):
+    with _item_state_stats_lock:
+        stats = item_state_stats.setdefault(kind, {"new": 0, "changed": 0, "stale": 0, "reused": 0})
+        for outcome in outcomes:
+            stats[outcome] += 1
+
+
+def get_item_state_stats() -> Dict[str, Dict[str, int]]:
+    with _item_state_stats_lock:
+        return {kind: dict(stats) for kind, stats in item_state_stats.items()}
@@ -0,0 +1,36 @@
+"""
+Departure Shield: Lazy Enrichment
+
+The risk adjustments only ever move levels in one direction per input: data sensitivity
+and heightened risks raise levels, external mitigation lowers them. The evaluators use
+this to skip AI assessments whose answer cannot change an item's final risk level, e.g.
+the heightened risk assessment of a file transfer whose influencers already made it HIGH.
+
+Skipped assessments are missing from the justifications and the additional context
+(reported as null or empty), so FULL_ENRICHMENT=1 runs every assessment when those are
+needed in full.
+"""
+
+import os
+import threading
+from typing import Dict
+
+
+FULL_ENRICHMENT = os.environ.get("FULL_ENRICHMENT", "0") == "1"
+
+# Number of assessments skipped, by assessment, e.g. 'secret_external_mitigation'
+skipped_assessments: Dict[str, int] = {}
+_skipped_assessments_lock = threading.Lock()
+
+
+def record_skipped(assessment: str, count: int = 1):
+    if count <= 0:
+        return
+    with _skipped_assessments_lock:
+        skipped_assessments[assessment] = skipped_assessments.get(
+            assessment, 0) + count
+
+
+def get_lazy_enrichment_stats() -> Dict[str, int]:
+    with _skipped_assessments_lock:
+        return dict(skipped_assessments)
@@ -0,0 +1,301 @@
+"""
+Departure Shield: SQLite Metadata Database
+
+An optional backend for the employee metadata (METADATA_BACKEND=sqlite) that keeps each
+secret and file transfer in its own row, indexed by user ID and by the dates the risk
+levels depend on, next to a table of evaluation results indexed by risk level. Questions
+such as "file transfers in the last 7 days for these users" become index range scans
+instead of loads of whole JSON files. SQLite runs in-process; no database server is needed.
+
+Each item row keeps the item's full JSON next to the indexed columns, so records read from
+the database are the ones in the JSON files.
+
+Usage:
+    python -m utils.metadata_db import [data_dir]
+"""
+
+import datetime
+import json
+import os
+import sqlite3
+import sys
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+from utils.metadata_stream import iter_employees
+
+
+METADATA_DB_FILE = 'metadata.sqlite3'
+# Employees buffered per insert batch by a bulk import, which is one transaction
+IMPORT_BATCH_SIZE = int(os.environ.get("METADATA_IMPORT_BATCH_SIZE", 1000))
+
+# Per metadata items field: its table, the item ID field, the item fields copied into
+# indexed columns, and the date field a recency filter applies to
+METADATA_TABLES = {
+    'secrets': {
+        "table": 'secret',
+        "id_field": 'secret_id',
+        "columns": ('secret_id', 'service', 'next_rotation_date', 'last_accessed'),
+        "indexes": {'secret_next_rotation': 'next_rotation_date', 'secret_last_accessed': 'last_accessed'},
+        "recency_field": 'last_accessed',
+    },
+    'files_and_transfers': {
+        "table": 'file_transfer',
+        "id_field": 'activity_id',
+        "columns": ('activity_id', 'activity_type', 'timestamp'),
+        "indexes": {'file_transfer_timestamp': 'timestamp'},
+        "recency_field": 'timestamp',
+    },
+}
+
+
+def is_recent(item: Dict[str, Any], recency_field: str, since: datetime.date) -> bool:
+    """
+    Whether an item is dated on or after `since`, compared as ISO strings the way the
+    database compares them; items without a date are not recent.
+    """
+    value = item.get(recency_field)
+    return isinstance(value, str) and value >= since.isoformat()
+
+
+class MetadataDatabase:
+    """SQLite tables of employees, their secrets and file transfers, and evaluation results."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # A connection must not be used across fork, so worker processes open their own
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._pid = os.getpid()
+            # fields is the employee record without its items, as JSON
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS employee (
+                    kind TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    fields TEXT NOT NULL,
+                    PRIMARY KEY (kind, user_id)
+                )""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS employee_order ON employee (kind, position)")
+            for spec in METADATA_TABLES.values():
+                # The primary key doubles as the user ID index
+                self._conn.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {spec['table']} (
+                        user_id TEXT NOT NULL,
+                        position INTEGER NOT NULL,
+                        {', '.join(f'{column} TEXT' for column in spec['columns'])},
+                        record TEXT NOT NULL,
+                        PRIMARY KEY (user_id, position)
+                    )""")
+                for index, column in spec['indexes'].items():
+                    self._conn.execute(f"CREATE INDEX IF NOT EXISTS {index} ON {spec['table']} ({column}, user_id)")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS evaluation_result (
+                    user_id TEXT PRIMARY KEY,
+                    overall_risk_level TEXT,
+                    partial INTEGER NOT NULL,
+                    evaluated_on TEXT NOT NULL,
+                    result TEXT NOT NULL
+                )""")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS evaluation_result_risk_level ON evaluation_result (overall_risk_level)")
+            self._conn.commit()
+        return self._conn
+
+    def import_employees(self, kind: str, employees: Iterable[Dict[str, Any]]) -> int:
+        """
+        Replace the employees of one kind with `employees`, in batches of IMPORT_BATCH_SIZE.
+
+        Only the first record of a user is kept, as in the metadata store.
+
+        Args:
+            kind (str): The items field, 'secrets' or 'files_and_transfers'.
+            employees (Iterable[Dict[str, Any]]): The employee records, e.g. from utils.metadata_stream.
+
+        Returns:
+            int: The number of employees imported.
+        """
+        spec = METADATA_TABLES[kind]
+        columns = ('user_id', 'position') + spec['columns'] + ('record',)
+        insert_item = (f"INSERT INTO {spec['table']} ({', '.join(columns)}) "
+                       f"VALUES ({', '.join('?' * len(columns))})")
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM employee WHERE kind = ?", (kind,))
+            conn.execute(f"DELETE FROM {spec['table']}")
+            seen = set()
+            employee_rows, item_rows = [], []
+
+            def flush():
+                conn.executemany("INSERT INTO employee (kind, user_id, position, fields) VALUES (?, ?, ?, ?)",
+                                 employee_rows)
+                conn.executemany(insert_item, item_rows)
+                employee_rows.clear()
+                item_rows.clear()
+
+            for employee in employees:
+                user_id = employee['user_id']
+                if user_id in seen:
+                    continue
+                seen.add(user_id)
+                fields = {field: value for field, value in employee.items() if field != kind}
+                employee_rows.append((kind, user_id, len(seen), json.dumps(fields)))
+                item_rows += [(user_id, position) + tuple(item.get(column) for column in spec['columns'])
+                              + (json.dumps(item),) for position, item in enumerate(employee.get(kind) or [])]
+                if len(employee_rows) >= IMPORT_BATCH_SIZE:
+                    flush()
+            flush()
+            conn.commit()
+        return len(seen)
+
+    def get(self, kind: str, user_id: str, since: datetime.date = None) -> Optional[Dict[str, Any]]:
+        """
+        The employee record of a user, with only the items dated on or after `since` if given.
+
+        Returns:
+            Optional[Dict[str, Any]]: The record, or None if the user is not found.
+        """
+        spec = METADATA_TABLES[kind]
+        query = f"SELECT record FROM {spec['table']} WHERE user_id = ?"
+        parameters = (user_id,)
+        if since is not None:
+            query += f" AND {spec['recency_field']} >= ?"
+            parameters += (since.isoformat(),)
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT fields FROM employee WHERE kind = ? AND user_id = ?", (kind, user_id)).fetchone()
+            if row is None:
+                return None
+            items = conn.execute(query + " ORDER BY position", parameters).fetchall()
+        record = json.loads(row[0])
+        record[kind] = [json.loads(item) for (item,) in items]
+        return record
+
+    def item_ids(self, kind: str, user_id: str) -> List[str]:
+        """The IDs of all of a user's items of one kind, without reading the items."""
+        spec = METADATA_TABLES[kind]
+        with self._lock:
+            return [item_id for (item_id,) in self._connection().execute(
+                f"SELECT {spec['id_field']} FROM {spec['table']} WHERE user_id = ? ORDER BY position", (user_id,))]
+
+    def user_ids(self, kind: str) -> List[str]:
+        """Every user ID of one kind, in import order."""
+        with self._lock:
+            return [user_id for (user_id,) in self._connection().execute(
+                "SELECT user_id FROM employee WHERE kind = ? ORDER BY position", (kind,))]
+
+    def recent_user_ids(self, kind: str, since: datetime.date) -> List[str]:
+        """The users with an item of one kind dated on or after `since`."""
+        spec = METADATA_TABLES[kind]
+        # Without DISTINCT, a range scan of the covering (date, user_id) index answers it
+        with self._lock:
+            return list(dict.fromkeys(user_id for (user_id,) in self._connection().execute(
+                f"SELECT user_id FROM {spec['table']} WHERE {spec['recency_field']} >= ?", (since.isoformat(),))))
+
+    def save_results(self, risk_assessments: List[Dict[str, Any]], evaluated_on: datetime.date):
+        """Store risk assessments, replacing earlier results of the same users."""
+        with self._lock:
+            conn = self._connection()
+            conn.executemany(
+                "INSERT OR REPLACE INTO evaluation_result (user_id, overall_risk_level, partial, evaluated_on, result) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(risk_assessment['user_id'], risk_assessment.get('overall_risk_level'),
+                  int(bool(risk_assessment.get('partial'))), evaluated_on.isoformat(), json.dumps(risk_assessment))
+                 for risk_assessment in risk_assessments])
+            conn.commit()
+
+    def results(self, risk_level: str = None) -> List[Dict[str, Any]]:
+        """The stored risk assessments, only those with an overall `risk_level` if given."""
+        query, parameters = "SELECT result FROM evaluation_result", ()
+        if risk_level is not None:
+            query, parameters = query + " WHERE overall_risk_level = ?", (risk_level,)
+        with self._lock:
+            rows = self._connection().execute(query + " ORDER BY user_id", parameters).fetchall()
+        return [json.loads(result) for (result,) in rows]
+
+
+class MetadataTable:
+    """
+    The employees of one kind in a MetadataDatabase, with the interface of
+    utils.metadata_store.MetadataStore.
+    """
+
+    def __init__(self, database: MetadataDatabase, kind: str):
+        self.database = database
+        self.kind = kind
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: str, since: datetime.date = None) -> Optional[Dict[str, Any]]:
+        """
+        Look up the metadata record for a user.
+
+        Args:
+            user_id (str): The ID of the user to look up.
+            since (datetime.date): If given, only keep the items dated on or after it.
+
+        Returns:
+            Optional[Dict[str, Any]]: The employee record, or None if the user is not found.
+        """
+        record = self.database.get(self.kind, user_id, since)
+        if record is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return record
+
+    def user_ids(self) -> List[str]:
+        """Return every user ID, in the order of the imported file."""
+        return self.database.user_ids(self.kind)
+
+    def recent_user_ids(self, since: datetime.date) -> List[str]:
+        return self.database.recent_user_ids(self.kind, since)
+
+    def item_ids(self, user_id: str) -> List[str]:
+        return self.database.item_ids(self.kind, user_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": f"{self.database.path} ({METADATA_TABLES[self.kind]['table']})",
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": 0,
+        }
+
+
+_databases: Dict[str, MetadataDatabase] = {}
+_databases_lock = threading.Lock()
+
+
+def get_metadata_database(path: str) -> MetadataDatabase:
+    """Return the shared database at `path`, creating it on first use."""
+    path = os.path.normpath(path)
+    with _databases_lock:
+        if path not in _databases:
+            _databases[path] = MetadataDatabase(path)
+        return _databases[path]
+
+
+def main() -> int:
+    from utils.metadata_store import METADATA_FILES, MOCK_DATA_DIR, metadata_database_path
+
+    if len(sys.argv) not in (2, 3) or sys.argv[1] != 'import':
+        print("Usage: python -m utils.metadata_db import [data_dir]")
+        return 2
+    data_dir = sys.argv[2] if len(sys.argv) == 3 else MOCK_DATA_DIR
+    database = get_metadata_database(metadata_database_path(data_dir))
+    for filename, kind in METADATA_FILES.items():
+        metadata_path = os.path.normpath(os.path.join(data_dir, filename))
+        count = database.import_employees(kind, iter_employees(metadata_path))
+        print(f"Imported {count} employees from {metadata_path} into {database.path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,388 @@
+"""
+Departure Shield: Binary Metadata Snapshots
+
+A single-user lookup in a JSON metadata file still pays for parsing the whole file once
+per process. write_snapshot converts a file into a compact binary snapshot that a
+SnapshotStore memory-maps and decodes one employee at a time: a lookup is a binary search
+of the user ID index and the decoding of that employee's record only, and the pages of
+the file that are never looked up are never read.
+
+Layout, all integers little-endian:
+
+    header    magic, then the offsets of the string table, the user ID blob and the
+              index, the string and user counts, and the (mtime_ns, size) of the JSON
+              file the snapshot was built from
+    records   each employee as a u32 length followed by its encoded record, in file order
+    strings   u64 offsets of the interned strings, then their UTF-8 bytes
+    user IDs  the UTF-8 bytes of every user ID
+    index     per user, sorted by UTF-8 user ID: the user ID's offset and length in the
+              user ID blob, and the record's offset and length
+
+Records are encoded as tagged values. Object keys and the string values that occur more
+than once in the file (services, locations, activity types, sharing statuses, dates) are
+interned and written as their index in the string table; unique strings such as item IDs
+stay inline.
+
+Usage:
+    python -m utils.metadata_snapshot build [data_dir]
+"""
+
+import mmap
+import os
+import struct
+import sys
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.metadata_stream import iter_employees
+
+
+SNAPSHOT_SUFFIX = '.snapshot'
+SNAPSHOT_MAGIC = b'DSSNAP01'
+# Strings longer than this are never interned; the long tail is free text
+INTERN_MAX_LENGTH = int(os.environ.get("SNAPSHOT_INTERN_MAX_LENGTH", 64))
+
+_HEADER = struct.Struct('<8sQQQIIqq')
+_LENGTH = struct.Struct('<I')
+_OFFSET = struct.Struct('<Q')
+_INDEX_ENTRY = struct.Struct('<QIQI')
+_FLOAT = struct.Struct('<d')
+
+(_NULL, _FALSE, _TRUE, _INT, _FLOAT_TAG, _STRING, _STRING_REF, _LIST, _OBJECT) = range(9)
+
+
+def snapshot_path_for(metadata_path: str) -> str:
+    """The snapshot file of a JSON metadata file, e.g. secret_metadata.snapshot."""
+    root, extension = os.path.splitext(metadata_path)
+    return (root if extension == '.json' else metadata_path) + SNAPSHOT_SUFFIX
+
+
+def _write_varint(out: bytearray, value: int):
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, position: int) -> Tuple[int, int]:
+    byte = data[position]
+    if byte < 0x80:
+        return byte, position + 1
+    value, shift = byte & 0x7f, 7
+    while True:
+        position += 1
+        byte = data[position]
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, position + 1
+        shift += 7
+
+
+class _Encoder:
+    """Encodes records as tagged values, interning the strings it is given."""
+
+    def __init__(self, interned: List[str]):
+        self.strings = {string: index for index, string in enumerate(interned)}
+
+    def encode(self, value: Any, out: bytearray):
+        if value is None:
+            out.append(_NULL)
+        elif value is True:
+            out.append(_TRUE)
+        elif value is False:
+            out.append(_FALSE)
+        elif isinstance(value, int):
+            out.append(_INT)
+            # Zigzag, so small negative numbers stay short
+            _write_varint(out, value * 2 if value >= 0 else -value * 2 - 1)
+        elif isinstance(value, float):
+            out.append(_FLOAT_TAG)
+            out += _FLOAT.pack(value)
+        elif isinstance(value, str):
+            index = self.strings.get(value)
+            if index is not None:
+                out.append(_STRING_REF)
+                _write_varint(out, index)
+            else:
+                data = value.encode('utf-8')
+                out.append(_STRING)
+                _write_varint(out, len(data))
+                out += data
+        elif isinstance(value, list):
+            out.append(_LIST)
+            _write_varint(out, len(value))
+            for element in value:
+                self.encode(element, out)
+        elif isinstance(value, dict):
+            out.append(_OBJECT)
+            _write_varint(out, len(value))
+            for key, element in value.items():
+                _write_varint(out, self.strings[key])
+                self.encode(element, out)
+        else:
+            raise TypeError(f"Cannot encode {type(value).__name__} in a metadata snapshot")
+
+
+def _count_strings(value: Any, keys: set, counts: Counter):
+    if isinstance(value, dict):
+        for key, element in value.items():
+            keys.add(key)
+            _count_strings(element, keys, counts)
+    elif isinstance(value, list):
+        for element in value:
+            _count_strings(element, keys, counts)
+    elif isinstance(value, str) and len(value) <= INTERN_MAX_LENGTH:
+        counts[value] += 1
+
+
+def write_snapshot(metadata_path: str, snapshot_path: str = None) -> int:
+    """
+    Convert a JSON metadata file into a binary snapshot.
+
+    The file is streamed twice, once to find the strings worth interning and once to write
+    the records, so it need not fit in memory; it may be gzip or zstd compressed. Only the
+    first record of a user is kept, as in the metadata store.
+
+    Args:
+        metadata_path (str): The {"employees": [...]} JSON file.
+        snapshot_path (str): Where to write the snapshot, snapshot_path_for(metadata_path) by default.
+
+    Returns:
+        int: The number of employees written.
+    """
+    snapshot_path = snapshot_path or snapshot_path_for(metadata_path)
+    stat = os.stat(metadata_path)
+
+    keys, counts = set(), Counter()
+    for employee in iter_employees(metadata_path):
+        _count_strings(employee, keys, counts)
+    interned = sorted(keys | {string for string, count in counts.items() if count > 1})
+    del counts
+    encoder = _Encoder(interned)
+
+    index: Dict[str, Tuple[int, int]] = {}
+    temporary_path = snapshot_path + '.tmp'
+    with open(temporary_path, 'wb') as f:
+        f.write(b'\0' * _HEADER.size)
+        offset = _HEADER.size
+        for employee in iter_employees(metadata_path):
+            if employee['user_id'] in index:
+                continue
+            record = bytearray()
+            encoder.encode(employee, record)
+            f.write(_LENGTH.pack(len(record)))
+            f.write(record)
+            index[employee['user_id']] = (offset + _LENGTH.size, len(record))
+            offset += _LENGTH.size + len(record)
+
+        strings_offset = offset
+        encoded_strings = [string.encode('utf-8') for string in interned]
+        string_offset = 0
+        for data in encoded_strings:
+            f.write(_OFFSET.pack(string_offset))
+            string_offset += len(data)
+        f.write(_OFFSET.pack(string_offset))
+        for data in encoded_strings:
+            f.write(data)
+        offset += _OFFSET.size * (len(interned) + 1) + string_offset
+
+        user_ids_offset = offset
+        entries = sorted((user_id.encode('utf-8'), location) for user_id, location in index.items())
+        user_id_offset = 0
+        for user_id, _ in entries:
+            f.write(user_id)
+        offset += sum(len(user_id) for user_id, _ in entries)
+
+        index_offset = offset
+        for user_id, (record_offset, record_length) in entries:
+            f.write(_INDEX_ENTRY.pack(user_id_offset, len(user_id), record_offset, record_length))
+            user_id_offset += len(user_id)
+
+        f.seek(0)
+        f.write(_HEADER.pack(SNAPSHOT_MAGIC, strings_offset, user_ids_offset, index_offset,
+                             len(interned), len(entries), stat.st_mtime_ns, stat.st_size))
+    os.replace(temporary_path, snapshot_path)
+    return len(entries)
+
+
+class SnapshotStore:
+    """
+    Memory-mapped, user_id-indexed view of one metadata snapshot, with the interface of
+    utils.metadata_store.MetadataStore.
+
+    While the JSON file the snapshot was built from is on disk and has changed since, the
+    snapshot is stale and lookups go to `fallback`, a store reading the JSON file.
+    """
+
+    def __init__(self, path: str, source_path: str, fallback):
+        self.path = path
+        self.source_path = source_path
+        self.fallback = fallback
+        self._lock = threading.Lock()
+        self._signature = None
+        # Whether the snapshot was up to date at the last lookup
+        self._current = False
+        self._file = None
+        self._map = None
+        self._strings: Dict[int, str] = {}
+        self._user_ids: Optional[List[str]] = None
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def _ensure_mapped(self) -> bool:
+        """Map the snapshot if it changed on disk; False if it is stale or unreadable."""
+        self._current = self._check_snapshot()
+        return self._current
+
+    def _check_snapshot(self) -> bool:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature != self._signature:
+            self._close()
+            try:
+                self._file = open(self.path, 'rb')
+                self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+                (magic, self._strings_offset, self._user_ids_offset, self._index_offset, self._string_count,
+                 self._user_count, source_mtime_ns, source_size) = _HEADER.unpack_from(self._map, 0)
+                if magic != SNAPSHOT_MAGIC:
+                    raise ValueError("not a metadata snapshot")
+            except (OSError, ValueError, struct.error) as e:
+                print(f"Error reading metadata snapshot {self.path}: {e}")
+                self._close()
+                return False
+            self._source_signature = (source_mtime_ns, source_size)
+            self._signature = signature
+            self.reloads += 1
+        try:
+            stat = os.stat(self.source_path)
+        except OSError:
+            return True
+        return (stat.st_mtime_ns, stat.st_size) == self._source_signature
+
+    def _close(self):
+        if self._map is not None:
+            self._map.close()
+        if self._file is not None:
+            self._file.close()
+        self._signature = self._file = self._map = None
+        self._strings = {}
+        self._user_ids = None
+
+    def _string(self, index: int) -> str:
+        string = self._strings.get(index)
+        if string is None:
+            start, end = struct.unpack_from('<QQ', self._map, self._strings_offset + index * _OFFSET.size)
+            base = self._strings_offset + (self._string_count + 1) * _OFFSET.size
+            string = self._strings[index] = self._map[base + start:base + end].decode('utf-8')
+        return string
+
+    def _decode(self, data: bytes, position: int) -> Tuple[Any, int]:
+        tag = data[position]
+        position += 1
+        if tag == _OBJECT or tag == _LIST or tag == _INT or tag == _STRING or tag == _STRING_REF:
+            number, position = _read_varint(data, position)
+            if tag == _STRING_REF:
+                return self._string(number), position
+            if tag == _STRING:
+                return data[position:position + number].decode('utf-8'), position + number
+            if tag == _INT:
+                return (number >> 1) ^ -(number & 1), position
+            if tag == _LIST:
+                values = []
+                for _ in range(number):
+                    value, position = self._decode(data, position)
+                    values.append(value)
+                return values, position
+            record = {}
+            for _ in range(number):
+                key, position = _read_varint(data, position)
+                record[self._string(key)], position = self._decode(data, position)
+            return record, position
+        if tag == _FLOAT_TAG:
+            return _FLOAT.unpack_from(data, position)[0], position + _FLOAT.size
+        return (None, False, True)[tag], position
+
+    def _index_entry(self, position: int) -> Tuple[bytes, int, int]:
+        user_id_offset, user_id_length, record_offset, record_length = _INDEX_ENTRY.unpack_from(
+            self._map, self._index_offset + position * _INDEX_ENTRY.size)
+        start = self._user_ids_offset + user_id_offset
+        return self._map[start:start + user_id_length], record_offset, record_length
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up the metadata record for a user.
+
+        Args:
+            user_id (str): The ID of the user to look up.
+
+        Returns:
+            Optional[Dict[str, Any]]: The employee record, or None if the user is not found.
+        """
+        with self._lock:
+            if self._ensure_mapped():
+                return self._lookup(user_id)
+        return self.fallback.get(user_id)
+
+    def _lookup(self, user_id: str) -> Optional[Dict[str, Any]]:
+        key = user_id.encode('utf-8')
+        low, high = 0, self._user_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._index_entry(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._user_count:
+            found, record_offset, record_length = self._index_entry(low)
+            if found == key:
+                self.hits += 1
+                return self._decode(self._map[record_offset:record_offset + record_length], 0)[0]
+        self.misses += 1
+        return None
+
+    def user_ids(self) -> List[str]:
+        """Return every user ID in the file, in file order."""
+        with self._lock:
+            if self._ensure_mapped():
+                if self._user_ids is None:
+                    # Records are laid out in file order
+                    entries = sorted((record_offset, user_id) for user_id, record_offset, _ in
+                                     map(self._index_entry, range(self._user_count)))
+                    self._user_ids = [user_id.decode('utf-8') for _, user_id in entries]
+                return list(self._user_ids)
+        return self.fallback.user_ids()
+
+    def stats(self) -> Dict[str, Any]:
+        if not self._current:
+            return self.fallback.stats()
+        return {
+            "path": self.path,
+            "records": self._user_count,
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+        }
+
+
+def main() -> int:
+    from utils.metadata_store import FILE_TRANSFER_METADATA_FILE, MOCK_DATA_DIR, SECRET_METADATA_FILE
+
+    if len(sys.argv) not in (2, 3) or sys.argv[1] != 'build':
+        print("Usage: python -m utils.metadata_snapshot build [data_dir]")
+        return 2
+    data_dir = sys.argv[2] if len(sys.argv) == 3 else MOCK_DATA_DIR
+    for filename in (SECRET_METADATA_FILE, FILE_TRANSFER_METADATA_FILE):
+        metadata_path = os.path.normpath(os.path.join(data_dir, filename))
+        count = write_snapshot(metadata_path)
+        print(f"Wrote {count} employees from {metadata_path} to {snapshot_path_for(metadata_path)} "
+              f"({os.path.getsize(snapshot_path_for(metadata_path))} bytes)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+"""
+Departure Shield: Employee Metadata Store
+
+This module keeps the employee metadata files parsed in memory, indexed by user ID,
+so that per-user lookups do not re-read and re-scan the whole JSON document.
+A file is only re-parsed when its modification time or size changes on disk.
+
+When a binary snapshot of a file is up to date (see utils.metadata_snapshot), lookups
+memory-map it instead and the JSON file is not parsed at all. With METADATA_BACKEND=sqlite,
+lookups go to the SQLite database of utils.metadata_db, imported from the JSON files.
+"""
+
+import datetime
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Union
+
+from utils.metadata_db import METADATA_DB_FILE, METADATA_TABLES, MetadataDatabase, MetadataTable, get_metadata_database, is_recent
+from utils.metadata_snapshot import SnapshotStore, snapshot_path_for
+
+
+MOCK_DATA_DIR = os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), '..', 'mock_data')
+
+SECRET_METADATA_FILE = 'secret_metadata.json'
+FILE_TRANSFER_METADATA_FILE = 'file_transfer_metadata.json'
+
+# The items field of the employee records in each metadata file
+METADATA_FILES = {
+    SECRET_METADATA_FILE: 'secrets',
+    FILE_TRANSFER_METADATA_FILE: 'files_and_transfers',
+}
+
+# 'json' reads the metadata files; 'sqlite' the database imported from them with
+# `python -m utils.metadata_db import`
+METADATA_BACKEND = os.environ.get("METADATA_BACKEND", "json")
+# The database path; by default metadata.sqlite3 in the data directory
+METADATA_DB_PATH = os.environ.get("METADATA_DB_PATH")
+
+# Whether lookups use a metadata file's binary snapshot when there is an up-to-date one
+METADATA_SNAPSHOT_ENABLED = os.environ.get("METADATA_SNAPSHOT_ENABLED", "1") != "0"
+
+
+class MetadataStore:
+    """
+    In-memory, user_id-indexed view of one employee metadata file.
+
+    The file is parsed lazily on first access and re-parsed only when its
+    (mtime, size) signature changes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._signature = None
+        self._index: Dict[str, Dict[str, Any]] = {}
+        self._user_ids: List[str] = []
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def _file_signature(self):
+        stat = os.stat(self.path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _ensure_loaded(self):
+        signature = self._file_signature()
+        if signature == self._signature:
+            return
+
+        with open(self.path, 'r') as f:
+            all_data = json.load(f)
+
+        index = {}
+        user_ids = []
+        for employee in all_data['employees']:
+            # Keep the first record for a user, matching the old linear scan
+            if employee['user_id'] not in index:
+                index[employee['user_id']] = employee
+                user_ids.append(employee['user_id'])
+
+        self._index = index
+        self._user_ids = user_ids
+        self._signature = signature
+        self.reloads += 1
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up the metadata record for a user.
+
+        Args:
+            user_id (str): The ID of the user to look up.
+
+        Returns:
+            Optional[Dict[str, Any]]: The employee record, or None if the user is not found.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            record = self._index.get(user_id)
+            if record is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return record
+
+    def user_ids(self) -> List[str]:
+        """Return every user ID in the file, in file order."""
+        with self._lock:
+            self._ensure_loaded()
+            return list(self._user_ids)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "records": len(self._index),
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+        }
+
+
+_stores: Dict[str, Union[MetadataStore, SnapshotStore, MetadataTable]] = {}
+_stores_lock = threading.Lock()
+
+
+def metadata_database_path(data_dir: str = MOCK_DATA_DIR) -> str:
+    """The SQLite metadata database of a data directory."""
+    return METADATA_DB_PATH or os.path.join(data_dir, METADATA_DB_FILE)
+
+
+def get_results_database(data_dir: str = MOCK_DATA_DIR) -> Optional[MetadataDatabase]:
+    """The database evaluation results are stored in: the metadata database with the sqlite backend, otherwise None."""
+    if METADATA_BACKEND != 'sqlite':
+        return None
+    return get_metadata_database(metadata_database_path(data_dir))
+
+
+def get_metadata_store(filename: str, data_dir: str = MOCK_DATA_DIR) -> Union[MetadataStore, SnapshotStore, MetadataTable]:
+    """
+    Return the shared store for a metadata file, creating it on first use.
+
+    Args:
+        filename (str): The metadata file name, e.g. 'secret_metadata.json'.
+        data_dir (str): The directory containing the metadata file.
+
+    Returns:
+        Union[MetadataStore, SnapshotStore, MetadataTable]: The process-wide store for that
+        file: its table in the metadata database with the sqlite backend, otherwise the JSON
+        file, read from its snapshot while it is up to date if snapshots are enabled.
+    """
+    path = os.path.normpath(os.path.join(data_dir, filename))
+    with _stores_lock:
+        if path not in _stores:
+            if METADATA_BACKEND == 'sqlite':
+                _stores[path] = MetadataTable(get_metadata_database(metadata_database_path(data_dir)),
+                                              METADATA_FILES[filename])
+                return _stores[path]
+            _stores[path] = MetadataStore(path)
+            if METADATA_SNAPSHOT_ENABLED:
+                _stores[path] = SnapshotStore(snapshot_path_for(path), path, _stores[path])
+        return _stores[path]
+
+
+def get_metadata_store_stats() -> List[Dict[str, Any]]:
+    with _stores_lock:
+        return [store.stats() for store in _stores.values()]
+
+
+def get_recent_metadata(filename: str, user_id: str, since: datetime.date,
+                        data_dir: str = MOCK_DATA_DIR) -> Optional[Dict[str, Any]]:
+    """
+    A user's metadata record with only the items dated on or after `since`: secrets by
+    their last access, file transfers by their timestamp. The sqlite backend filters in
+    SQL on the date index; the JSON stores filter the loaded record.
+
+    Returns:
+        Optional[Dict[str, Any]]: The filtered copy of the record, or None if the user is not found.
+    """
+    store = get_metadata_store(filename, data_dir)
+    if isinstance(store, MetadataTable):
+        return store.get(user_id, since)
+    record = store.get(user_id)
+    if record is None:
+        return None
+    kind = METADATA_FILES[filename]
+    recency_field = METADATA_TABLES[kind]["recency_field"]
+    return {**record, kind: [item for item in record.get(kind) or [] if is_recent(item, recency_field, since)]}
+
+
+def get_metadata_item_ids(filename: str, user_id: str, data_dir: str = MOCK_DATA_DIR) -> List[str]:
+    """
+    The IDs of all of a user's items in a metadata file, e.g. to keep the item state of the
+    items a date-filtered evaluation left out. The sqlite backend reads only the ID column.
+    """
+    store = get_metadata_store(filename, data_dir)
+    if isinstance(store, MetadataTable):
+        return store.item_ids(user_id)
+    kind = METADATA_FILES[filename]
+    record = store.get(user_id)
+    return [item[METADATA_TABLES[kind]["id_field"]] for item in (record or {}).get(kind) or []]
+
+
+def recently_active_user_ids(since: datetime.date, data_dir: str = MOCK_DATA_DIR) -> List[str]:
+    """
+    The users with a secret accessed or a file transfer on or after `since`. The sqlite
+    backend answers from the date indexes without reading any record.
+    """
+    user_ids = []
+    for filename, kind in METADATA_FILES.items():
+        store = get_metadata_store(filename, data_dir)
+        if isinstance(store, MetadataTable):
+            user_ids += store.recent_user_ids(since)
+            continue
+        recency_field = METADATA_TABLES[kind]["recency_field"]
+        user_ids += [user_id for user_id in store.user_ids()
+                     if any(is_recent(item, recency_field, since) for item in store.get(user_id).get(kind) or [])]
+    return list(dict.fromkeys(user_ids))
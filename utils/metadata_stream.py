@@ -0,0 +1,181 @@
+"""
+Departure Shield: Streaming Metadata Reader
+
+The employee metadata exports are one {"employees": [...]} JSON document each, which
+json.load (and so the metadata store) holds in memory whole. iter_employees instead
+decodes one employee record at a time with json.JSONDecoder.raw_decode over a text buffer
+that only ever holds the record being decoded and one read ahead, so memory depends on the
+largest record rather than on the file. Gzip and zstd exports are decompressed on the fly,
+recognized by their magic bytes; zstd needs the optional zstandard package.
+
+join_employees pairs the records of the secret and file transfer exports by user ID,
+reading both streams in step. Exports that list employees in the same order are joined in
+constant memory; a record is only held back until its match turns up in the other stream.
+"""
+
+import gzip
+import io
+import json
+import os
+from typing import Any, Dict, Iterator, Optional, TextIO, Tuple
+
+
+# Characters read from a metadata file at a time
+READ_CHUNK_SIZE = int(os.environ.get("METADATA_READ_CHUNK_SIZE", 1 << 20))
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+_WHITESPACE = ' \t\n\r'
+# Characters that can continue a number which decoded at the end of the text read so far
+_NUMBER_CONTINUATION = '0123456789.eE+-'
+
+
+def open_metadata(path: str) -> TextIO:
+    """Open a metadata file for reading as text, decompressing gzip and zstd files on the fly."""
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if magic == ZSTD_MAGIC:
+        import zstandard
+
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+        return io.TextIOWrapper(reader, encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+class _JsonReader:
+    """Decodes the JSON values of a text stream one at a time, reading only as far as needed."""
+
+    def __init__(self, stream: TextIO, chunk_size: int = READ_CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+
+    def _read_more(self, at_least: int = 0) -> bool:
+        if self.eof:
+            return False
+        # Drop what was consumed, so the buffer only holds the value being decoded
+        self.buffer = self.buffer[self.position:]
+        self.position = 0
+        chunk = self.stream.read(max(self.chunk_size, at_least))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer += chunk
+        return True
+
+    def peek(self) -> str:
+        """The next non-whitespace character, or '' at the end of the stream."""
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in _WHITESPACE:
+                self.position += 1
+            if self.position < len(self.buffer) or not self._read_more():
+                return self.buffer[self.position:self.position + 1]
+
+    def expect(self, characters: str) -> str:
+        """Consume the next non-whitespace character, which must be one of `characters`."""
+        character = self.peek()
+        if not character or character not in characters:
+            raise ValueError(f"Expected one of {characters!r} in metadata, found {character or 'end of file'!r}")
+        self.position += 1
+        return character
+
+    def value(self) -> Any:
+        """Decode the next JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                value = end = None
+            # A number may go on in the next chunk even though it decoded
+            if end is not None and (self.eof or (end < len(self.buffer) and self.buffer[end] not in _NUMBER_CONTINUATION)):
+                self.position = end
+                return value
+            # Read at least as much again, so that a large value is retried a few times only
+            if not self._read_more(len(self.buffer) - self.position):
+                if end is not None:
+                    self.position = end
+                    return value
+                raise ValueError("Truncated or malformed JSON in metadata")
+
+
+def iter_employees(path: str, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    """
+    The employee records of a metadata file, one at a time.
+
+    Args:
+        path (str): A {"employees": [...]} JSON file, optionally gzip or zstd compressed.
+        chunk_size (int): Characters to read at a time.
+
+    Yields:
+        Dict[str, Any]: Each element of the "employees" array, in file order.
+    """
+    with open_metadata(path) as stream:
+        reader = _JsonReader(stream, chunk_size)
+        reader.expect('{')
+        if reader.peek() == '}':
+            return
+        while True:
+            key = reader.value()
+            reader.expect(':')
+            if key == 'employees':
+                reader.expect('[')
+                if reader.peek() == ']':
+                    reader.position += 1
+                else:
+                    while True:
+                        yield reader.value()
+                        if reader.expect(',]') == ']':
+                            break
+            else:
+                reader.value()
+            if reader.expect(',}') == '}':
+                return
+
+
+def join_employees(secret_path: str, file_transfer_path: str,
+                   chunk_size: int = READ_CHUNK_SIZE) -> Iterator[Tuple[str, Optional[Dict[str, Any]], Optional[Dict[str, Any]]]]:
+    """
+    Pair the secret and file transfer records of each employee.
+
+    Both files are read in step. A record whose match has not been read yet is held until
+    it is; records without a match in the other file come last, with None for the missing
+    side. User IDs are expected to be unique within each file.
+
+    Args:
+        secret_path (str): The secret metadata export.
+        file_transfer_path (str): The file transfer metadata export.
+        chunk_size (int): Characters to read at a time from each file.
+
+    Yields:
+        Tuple[str, Optional[Dict[str, Any]], Optional[Dict[str, Any]]]: The user ID, the
+        user's secret record and file transfer record.
+    """
+    streams = [iter_employees(secret_path, chunk_size), iter_employees(file_transfer_path, chunk_size)]
+    pending: Tuple[Dict[str, Dict[str, Any]], Dict[str, Dict[str, Any]]] = ({}, {})
+    while streams[0] is not None or streams[1] is not None:
+        for side in (0, 1):
+            if streams[side] is None:
+                continue
+            record = next(streams[side], None)
+            if record is None:
+                streams[side] = None
+                continue
+            user_id = record['user_id']
+            match = pending[1 - side].pop(user_id, None)
+            if match is None:
+                pending[side].setdefault(user_id, record)
+            elif side == 0:
+                yield user_id, record, match
+            else:
+                yield user_id, match, record
+    for user_id, record in pending[0].items():
+        yield user_id, record, None
+    for user_id, record in pending[1].items():
+        yield user_id, None, record
@@ -0,0 +1,134 @@
+"""
+Departure Shield: Near-Duplicate Clustering
+
+Groups texts that differ only trivially ("Bulk transfer of multiple files to external
+storage" vs "Bulk transfer of several files to external storage") so that one AI request
+per cluster can answer for all of its members. Texts are normalized and shingled,
+candidate pairs are found with MinHash/LSH, and pairs whose shingle Jaccard similarity
+reaches the threshold are merged into clusters.
+"""
+
+import os
+import random
+import re
+import threading
+import zlib
+from typing import Any, Dict, List, Set
+
+
+# Jaccard similarity at which two descriptions share one data sensitivity verdict
+NEAR_DUPLICATE_DESCRIPTION_THRESHOLD = float(
+    os.environ.get("NEAR_DUPLICATE_DESCRIPTION_THRESHOLD", 0.8))
+# Jaccard similarity at which two secrets or file transfers share one enrichment. A threshold
+# above 1 turns clustering off; exactly 1 only merges texts equal after normalization.
+NEAR_DUPLICATE_ITEM_THRESHOLD = float(
+    os.environ.get("NEAR_DUPLICATE_ITEM_THRESHOLD", 0.9))
+
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+LSH_ROWS = MINHASH_PERMUTATIONS // LSH_BANDS
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_permutation_rng = random.Random(0)
+_PERMUTATIONS = [(_permutation_rng.randrange(1, _MERSENNE_PRIME), _permutation_rng.randrange(0, _MERSENNE_PRIME))
+                 for _ in range(MINHASH_PERMUTATIONS)]
+
+# Cluster-size statistics per kind of text, e.g. 'descriptions' or 'secrets'
+clustering_stats: Dict[str, Dict[str, int]] = {}
+_clustering_stats_lock = threading.Lock()
+
+
+def normalize_text(text: str) -> List[str]:
+    """Lower-case word tokens, with every number replaced by '#'."""
+    return ['#' if token.isdigit() else token for token in re.findall(r"[a-z0-9]+", text.lower())]
+
+
+def shingles(text: str) -> Set[str]:
+    """Word unigrams and bigrams of the normalized text."""
+    tokens = normalize_text(text)
+    return set(tokens) | {f"{first} {second}" for first, second in zip(tokens, tokens[1:])}
+
+
+def minhash_signature(shingle_set: Set[str]) -> List[int]:
+    hashes = [zlib.crc32(shingle.encode('utf-8')) for shingle in shingle_set] or [0]
+    return [min((a * value + b) % _MERSENNE_PRIME for value in hashes) for a, b in _PERMUTATIONS]
+
+
+def jaccard(first: Set[str], second: Set[str]) -> float:
+    if not first and not second:
+        return 1.0
+    return len(first & second) / len(first | second)
+
+
+def cluster_representatives(texts: List[str], threshold: float, kind: str = "items") -> List[int]:
+    """
+    Cluster near-duplicate texts.
+
+    Args:
+        texts (List[str]): The texts to cluster.
+        threshold (float): Minimum shingle Jaccard similarity for two texts to share a cluster.
+        kind (str): What the texts describe, for the cluster-size statistics.
+
+    Returns:
+        List[int]: For each text, the index of its cluster's representative, the first
+        member in input order. Texts without near-duplicates represent themselves.
+    """
+    parents = list(range(len(texts)))
+    if threshold > 1 or len(texts) < 2:
+        _record_clusters(kind, parents)
+        return parents
+
+    def find(index: int) -> int:
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    def union(first: int, second: int):
+        first, second = find(first), find(second)
+        if first != second:
+            # The earlier text stays the representative
+            parents[max(first, second)] = min(first, second)
+
+    shingle_sets = [shingles(text) for text in texts]
+    buckets: Dict[Any, List[int]] = {}
+    for index, shingle_set in enumerate(shingle_sets):
+        signature = minhash_signature(shingle_set)
+        for band in range(LSH_BANDS):
+            key = (band, tuple(signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]))
+            buckets.setdefault(key, []).append(index)
+
+    checked = set()
+    for members in buckets.values():
+        for position, first in enumerate(members):
+            for second in members[position + 1:]:
+                if (first, second) in checked:
+                    continue
+                checked.add((first, second))
+                if jaccard(shingle_sets[first], shingle_sets[second]) >= threshold:
+                    union(first, second)
+
+    representatives = [find(index) for index in range(len(texts))]
+    _record_clusters(kind, representatives)
+    return representatives
+
+
+def _record_clusters(kind: str, representatives: List[int]):
+    sizes: Dict[int, int] = {}
+    for representative in representatives:
+        sizes[representative] = sizes.get(representative, 0) + 1
+    with _clustering_stats_lock:
+        stats = clustering_stats.setdefault(
+            kind, {"items": 0, "clusters": 0, "largest_cluster": 0, "requests_saved": 0})
+        stats["items"] += len(representatives)
+        stats["clusters"] += len(sizes)
+        stats["largest_cluster"] = max([stats["largest_cluster"]] + list(sizes.values()))
+        stats["requests_saved"] += len(representatives) - len(sizes)
+
+
+def get_clustering_stats() -> Dict[str, Dict[str, Any]]:
+    with _clustering_stats_lock:
+        return {
+            kind: dict(stats, mean_cluster_size=stats["items"] / stats["clusters"] if stats["clusters"] else 0.0)
+            for kind, stats in clustering_stats.items()
+        }
@@ -0,0 +1,172 @@
+"""
+Departure Shield: Streaming Result Writer
+
+Long batch runs write each user's risk assessment as one compact JSON line (NDJSON) as
+soon as it completes, instead of holding every assessment in memory until the end. A
+checkpoint file next to it lists the users whose line was written, so a resumed run only
+evaluates the rest. merge_results turns the NDJSON file into the pretty JSON array the
+non-streaming run writes.
+
+Usage:
+    python -m utils.result_stream merge departure_risks.ndjson departure_risks.json
+"""
+
+import json
+import os
+import sys
+import textwrap
+from typing import Any, Dict, Iterator, Set
+
+
+CHECKPOINT_SUFFIX = '.checkpoint'
+
+
+def checkpoint_path_for(results_path: str) -> str:
+    """The default checkpoint file of an NDJSON results file."""
+    return results_path + CHECKPOINT_SUFFIX
+
+
+def read_checkpoint(checkpoint_path: str) -> Set[str]:
+    """The user IDs recorded in a checkpoint file; empty if there is none."""
+    if not os.path.exists(checkpoint_path):
+        return set()
+    with open(checkpoint_path, 'r') as f:
+        # A crash can leave the last ID without its newline; that user is evaluated again
+        return {line[:-1] for line in f if line.endswith('\n')}
+
+
+def _truncate_incomplete_line(path: str):
+    """Drop a trailing line without its newline, the remains of an interrupted write."""
+    with open(path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        position = end
+        while position > 0:
+            step = min(4096, position)
+            f.seek(position - step)
+            chunk = f.read(step)
+            newline = chunk.rfind(b'\n')
+            if newline != -1:
+                position = position - step + newline + 1
+                break
+            position -= step
+        if position != end:
+            f.truncate(position)
+
+
+class ResultStream:
+    """
+    Appends risk assessments to an NDJSON file and records each user in a checkpoint.
+
+    A user is checkpointed only after their line is flushed, so a checkpointed user always
+    has a complete result. A crash between the two leaves a result without a checkpoint
+    entry; the resumed run evaluates that user again and merge_results keeps the later line.
+    A failed evaluation, one with an 'error', is written but not checkpointed, so a resumed
+    run retries it.
+    """
+
+    def __init__(self, path: str, checkpoint_path: str = None, resume: bool = False):
+        """
+        Args:
+            path (str): The NDJSON results file.
+            checkpoint_path (str): The checkpoint file, `path` + '.checkpoint' by default.
+            resume (bool): Append to the existing files; otherwise both are started afresh.
+        """
+        self.path = path
+        self.checkpoint_path = checkpoint_path or checkpoint_path_for(path)
+        self.completed: Set[str] = read_checkpoint(self.checkpoint_path) if resume else set()
+        if resume:
+            for existing in (self.path, self.checkpoint_path):
+                if os.path.exists(existing):
+                    _truncate_incomplete_line(existing)
+        mode = 'a' if resume else 'w'
+        self._results = open(self.path, mode)
+        self._checkpoint = open(self.checkpoint_path, mode)
+        self.written = 0
+
+    def write(self, risk_assessment: Dict[str, Any]):
+        self._results.write(json.dumps(risk_assessment, separators=(',', ':')) + '\n')
+        self._results.flush()
+        if not risk_assessment.get('error'):
+            self._checkpoint.write(risk_assessment['user_id'] + '\n')
+            self._checkpoint.flush()
+            self.completed.add(risk_assessment['user_id'])
+        self.written += 1
+
+    def close(self):
+        self._results.close()
+        self._checkpoint.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def iter_results(path: str) -> Iterator[Dict[str, Any]]:
+    """The risk assessments of an NDJSON results file, skipping an incomplete last line."""
+    with open(path, 'r') as f:
+        for line in f:
+            if not line.endswith('\n'):
+                break
+            if line.strip():
+                yield json.loads(line)
+
+
+def merge_results(ndjson_path: str, output_path: str) -> int:
+    """
+    Write the assessments of an NDJSON results file as a pretty-printed JSON array.
+
+    The output is what json.dump(assessments, f, indent=2) writes, but only one assessment
+    is held in memory at a time. A user with several lines, from a run resumed after a
+    crash, appears once with their last result, in the position of their first.
+
+    Args:
+        ndjson_path (str): The NDJSON results file.
+        output_path (str): Where to write the JSON array.
+
+    Returns:
+        int: The number of assessments written.
+    """
+    # First pass: the line number of each user's last result
+    last_line: Dict[str, int] = {}
+    first_seen: Dict[str, int] = {}
+    for line_number, risk_assessment in enumerate(iter_results(ndjson_path)):
+        first_seen.setdefault(risk_assessment['user_id'], line_number)
+        last_line[risk_assessment['user_id']] = line_number
+
+    # Results that only moved due to a rerun are few, keep those aside until their slot
+    order = sorted(first_seen, key=first_seen.get)
+    pending: Dict[str, Dict[str, Any]] = {}
+    written = 0
+    with open(output_path, 'w') as out:
+        if not order:
+            out.write('[]')
+            return 0
+        out.write('[')
+        next_user = 0
+        for line_number, risk_assessment in enumerate(iter_results(ndjson_path)):
+            if last_line[risk_assessment['user_id']] != line_number:
+                continue
+            pending[risk_assessment['user_id']] = risk_assessment
+            while next_user < len(order) and order[next_user] in pending:
+                out.write((',' if written else '') + '\n' +
+                          textwrap.indent(json.dumps(pending.pop(order[next_user]), indent=2), '  '))
+                written += 1
+                next_user += 1
+        out.write('\n]')
+    return written
+
+
+def main() -> int:
+    if len(sys.argv) != 4 or sys.argv[1] != 'merge':
+        print("Usage: python -m utils.result_stream merge <results.ndjson> <output.json>")
+        return 2
+    count = merge_results(sys.argv[2], sys.argv[3])
+    print(f"Merged {count} risk assessments into {sys.argv[3]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,359 @@
+"""
+Departure Shield: Compiled Risk Adjustment Tables
+
+The risk adjustment helpers in utils/*_risk_adjustment_helper.py are pure functions of a
+tiny input space: a risk level, the influencer levels, the external mitigation status and
+the heightened risk levels. The rule compiler runs the helpers once over that space and
+stores the resulting levels in dense lookup tables, which the scalar scoring path indexes
+instead of mutating dicts of Enums, and which vectorized paths can index with NumPy arrays.
+
+Levels are coded by their enum value (1-3) and None as 0. The helpers only react to
+heightened risks that are HIGH, so heightened risks are coded as a bit mask of the risk
+vectors that are HIGH; verify_tables proves the tables equal to the helpers over the full
+input space, every vector being absent, LOW, MEDIUM or HIGH. Heightened risks are keyed
+by risk vector name, as the evaluators pass them; inputs the tables cannot code fall back
+to the helpers.
+
+ADJUSTMENT_TABLES selects the path: "on" (tables, the default), "off" (helpers) or
+"verify" (both, raising on any disagreement).
+
+Usage:
+    python -m utils.risk_adjustment_tables verify
+"""
+
+import argparse
+import itertools
+import os
+import sys
+import threading
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+from models.file_transfer_risk_models import FileTransferRiskFactor, FileTransferRiskInfluencer, FileTransferRiskLevel
+from models.secret_risk_models import MitigationStatus, RiskFactor, RiskInfluencer, RiskLevel
+from utils.file_transfer_risk_adjustment_helper import adjust_file_transfer_risk_factors_by_additional_context, adjust_file_transfer_risk_factors_by_influencers
+from utils.secret_risk_adjustment_helper import adjust_risk_factors_by_additional_context, adjust_risk_factors_by_influencers
+
+
+ADJUSTMENT_TABLES_MODES = ("on", "off", "verify")
+ADJUSTMENT_TABLES = os.environ.get("ADJUSTMENT_TABLES", "on")
+
+# Codes of the external mitigation statuses; 0 is None (not assessed)
+MITIGATION_CODES = {None: 0, MitigationStatus.PRESENT: 1,
+                    MitigationStatus.PARTIAL: 2, MitigationStatus.ABSENT: 3}
+
+
+class TransitionTable:
+    """A dense row-major table of output level codes, indexed by input codes."""
+
+    def __init__(self, name: str, shape: Tuple[int, ...], cells: bytes):
+        self.name = name
+        self.shape = shape
+        self.cells = cells
+        self.strides = _row_major_strides(shape)
+
+    def lookup(self, *codes: int) -> int:
+        return self.cells[sum(code * stride for code, stride in zip(codes, self.strides))]
+
+    def as_array(self):
+        """The table as an int8 NumPy array of `shape`, for indexing with code arrays."""
+        import numpy as np
+
+        return np.frombuffer(self.cells, dtype=np.int8).reshape(self.shape)
+
+
+def compile_table(name: str, domains: Sequence[Sequence[int]], rule: Callable[..., int]) -> TransitionTable:
+    """
+    Enumerate `rule` over the product of the input code domains into a dense table.
+
+    Args:
+        name (str): The table name, for error messages.
+        domains (Sequence[Sequence[int]]): The valid codes of each input; the table spans 0..max code.
+        rule (Callable[..., int]): Maps one code per input to the output level code.
+
+    Returns:
+        TransitionTable: The table; cells outside the domains are 0.
+    """
+    shape = tuple(max(domain) + 1 for domain in domains)
+    strides = _row_major_strides(shape)
+    cells = bytearray(shape[0] * strides[0])
+    for codes in itertools.product(*domains):
+        cells[sum(code * stride for code, stride in zip(codes, strides))] = rule(*codes)
+    return TransitionTable(name, shape, bytes(cells))
+
+
+def _row_major_strides(shape: Tuple[int, ...]) -> Tuple[int, ...]:
+    strides = []
+    stride = 1
+    for size in reversed(shape):
+        strides.append(stride)
+        stride *= size
+    return tuple(reversed(strides))
+
+
+def _level(level_type, code: int):
+    return level_type(code) if code else None
+
+
+def _level_code(level: Any, level_type) -> int:
+    if level is None:
+        return 0
+    if isinstance(level, level_type):
+        return level.value
+    raise ValueError(f"{level!r} is not a {level_type.__name__}")
+
+
+def _heightened_mask(heightened_risks: Dict[Any, Any], vectors: List[str], level_type) -> int:
+    mask = 0
+    for vector, level in heightened_risks.items():
+        # Exact str keys only: anything else may compare equal to the influencer enums
+        if type(vector) is not str or vector not in vectors or not isinstance(level, level_type):
+            raise ValueError(f"cannot code heightened risk {vector!r}: {level!r}")
+        if level == level_type.HIGH:
+            mask |= 1 << vectors.index(vector)
+    return mask
+
+
+def _heightened_risks(mask: int, vectors: List[str], level_type) -> Dict[str, Any]:
+    return {vector: level_type.HIGH if mask >> bit & 1 else level_type.LOW
+            for bit, vector in enumerate(vectors)}
+
+
+SECRET_HEIGHTENED_VECTORS = [influencer.name for influencer in RiskInfluencer]
+FILE_TRANSFER_HEIGHTENED_VECTORS = [influencer.name for influencer in FileTransferRiskInfluencer]
+LEVEL_CODES = (1, 2, 3)
+OPTIONAL_LEVEL_CODES = (0, 1, 2, 3)
+
+
+def _secret_influencer_rule(level: int, service_criticality: int, data_sensitivity: int) -> int:
+    risk_factors = {RiskFactor.PERSISTENT_ACCESS_RISK: RiskLevel(level)}
+    adjust_risk_factors_by_influencers(
+        risk_factors, _level(RiskLevel, service_criticality), _level(RiskLevel, data_sensitivity))
+    return risk_factors[RiskFactor.PERSISTENT_ACCESS_RISK].value
+
+
+def _secret_context_rule(level: int, mitigation: int, heightened_mask: int) -> int:
+    risk_factors = {RiskFactor.PERSISTENT_ACCESS_RISK: RiskLevel(level)}
+    adjust_risk_factors_by_additional_context(risk_factors, {
+        "external_mitigation": _MITIGATIONS[mitigation],
+        "heightened_risks": _heightened_risks(heightened_mask, SECRET_HEIGHTENED_VECTORS, RiskLevel)})
+    return risk_factors[RiskFactor.PERSISTENT_ACCESS_RISK].value
+
+
+def _file_transfer_influencer_rule(level: int, data_sensitivity: int, activity_type_risk: int) -> int:
+    risk_factors = {FileTransferRiskFactor.DATA_EXFILTRATION: FileTransferRiskLevel(level)}
+    adjust_file_transfer_risk_factors_by_influencers(
+        risk_factors, _level(FileTransferRiskLevel, data_sensitivity), _level(FileTransferRiskLevel, activity_type_risk))
+    return risk_factors[FileTransferRiskFactor.DATA_EXFILTRATION].value
+
+
+def _file_transfer_context_rule(level: int, heightened_mask: int) -> int:
+    risk_factors = {FileTransferRiskFactor.DATA_EXFILTRATION: FileTransferRiskLevel(level)}
+    adjust_file_transfer_risk_factors_by_additional_context(risk_factors, {
+        "heightened_risks": _heightened_risks(heightened_mask, FILE_TRANSFER_HEIGHTENED_VECTORS, FileTransferRiskLevel)})
+    return risk_factors[FileTransferRiskFactor.DATA_EXFILTRATION].value
+
+
+_MITIGATIONS = {code: status for status, code in MITIGATION_CODES.items()}
+
+_tables: Dict[str, TransitionTable] = {}
+_tables_lock = threading.Lock()
+
+
+def get_tables() -> Dict[str, TransitionTable]:
+    """The compiled tables by name, compiled on first use."""
+    with _tables_lock:
+        if not _tables:
+            secret_masks = range(1 << len(SECRET_HEIGHTENED_VECTORS))
+            file_transfer_masks = range(1 << len(FILE_TRANSFER_HEIGHTENED_VECTORS))
+            for table in (
+                compile_table("secret_influencers", (LEVEL_CODES, OPTIONAL_LEVEL_CODES, OPTIONAL_LEVEL_CODES),
+                              _secret_influencer_rule),
+                compile_table("secret_additional_context", (LEVEL_CODES, tuple(_MITIGATIONS), secret_masks),
+                              _secret_context_rule),
+                compile_table("file_transfer_influencers", (LEVEL_CODES, OPTIONAL_LEVEL_CODES, OPTIONAL_LEVEL_CODES),
+                              _file_transfer_influencer_rule),
+                compile_table("file_transfer_additional_context", (LEVEL_CODES, file_transfer_masks),
+                              _file_transfer_context_rule),
+            ):
+                _tables[table.name] = table
+        return _tables
+
+
+def _check_mode(mode: str):
+    if mode not in ADJUSTMENT_TABLES_MODES:
+        raise ValueError(
+            f"Unknown ADJUSTMENT_TABLES mode '{mode}', expected one of {', '.join(ADJUSTMENT_TABLES_MODES)}")
+
+
+def _compiled_secret_level(risk_factors: Dict[RiskFactor, RiskLevel], service_criticality: RiskLevel,
+                           data_sensitivity: RiskLevel, additional_context: Dict[str, Any]) -> RiskLevel:
+    if set(risk_factors) != {RiskFactor.PERSISTENT_ACCESS_RISK}:
+        return None
+    tables = get_tables()
+    try:
+        level = tables["secret_influencers"].lookup(
+            _level_code(risk_factors[RiskFactor.PERSISTENT_ACCESS_RISK], RiskLevel),
+            _level_code(service_criticality, RiskLevel), _level_code(data_sensitivity, RiskLevel))
+        if additional_context is not None:
+            level = tables["secret_additional_context"].lookup(
+                level, MITIGATION_CODES[additional_context['external_mitigation']],
+                _heightened_mask(additional_context['heightened_risks'], SECRET_HEIGHTENED_VECTORS, RiskLevel))
+    except (KeyError, TypeError, ValueError):
+        # Inputs outside the compiled space, e.g. heightened risks keyed by enum
+        return None
+    return RiskLevel(level) if level else None
+
+
+def adjust_secret_risk_factors(risk_factors: Dict[RiskFactor, RiskLevel], service_criticality: RiskLevel,
+                               data_sensitivity: RiskLevel, additional_context: Dict[str, Any] = None):
+    """
+    Apply adjust_risk_factors_by_influencers and, given an additional context,
+    adjust_risk_factors_by_additional_context to `risk_factors` in place.
+    """
+    _check_mode(ADJUSTMENT_TABLES)
+    level = None
+    if ADJUSTMENT_TABLES != "off":
+        level = _compiled_secret_level(risk_factors, service_criticality, data_sensitivity, additional_context)
+    if level is None or ADJUSTMENT_TABLES == "verify":
+        expected = dict(risk_factors)
+        adjust_risk_factors_by_influencers(expected, service_criticality, data_sensitivity)
+        if additional_context is not None:
+            adjust_risk_factors_by_additional_context(expected, additional_context)
+        _check_agreement(expected, RiskFactor.PERSISTENT_ACCESS_RISK, level)
+        risk_factors.update(expected)
+        return
+    risk_factors[RiskFactor.PERSISTENT_ACCESS_RISK] = level
+
+
+def _compiled_file_transfer_level(risk_factors: Dict[FileTransferRiskFactor, FileTransferRiskLevel], data_sensitivity: FileTransferRiskLevel,
+                                  activity_type_risk: FileTransferRiskLevel, additional_context: Dict[str, Any]) -> FileTransferRiskLevel:
+    if set(risk_factors) != {FileTransferRiskFactor.DATA_EXFILTRATION}:
+        return None
+    tables = get_tables()
+    try:
+        level = tables["file_transfer_influencers"].lookup(
+            _level_code(risk_factors[FileTransferRiskFactor.DATA_EXFILTRATION], FileTransferRiskLevel),
+            _level_code(data_sensitivity, FileTransferRiskLevel), _level_code(activity_type_risk, FileTransferRiskLevel))
+        if additional_context is not None:
+            level = tables["file_transfer_additional_context"].lookup(
+                level, _heightened_mask(additional_context['heightened_risks'], FILE_TRANSFER_HEIGHTENED_VECTORS, FileTransferRiskLevel))
+    except (KeyError, TypeError, ValueError):
+        return None
+    return FileTransferRiskLevel(level) if level else None
+
+
+def adjust_file_transfer_risk_factors(risk_factors: Dict[FileTransferRiskFactor, FileTransferRiskLevel], data_sensitivity: FileTransferRiskLevel,
+                                      activity_type_risk: FileTransferRiskLevel, additional_context: Dict[str, Any] = None):
+    """
+    Apply adjust_file_transfer_risk_factors_by_influencers and, given an additional context,
+    adjust_file_transfer_risk_factors_by_additional_context to `risk_factors` in place.
+    """
+    _check_mode(ADJUSTMENT_TABLES)
+    level = None
+    if ADJUSTMENT_TABLES != "off":
+        level = _compiled_file_transfer_level(risk_factors, data_sensitivity, activity_type_risk, additional_context)
+    if level is None or ADJUSTMENT_TABLES == "verify":
+        expected = dict(risk_factors)
+        adjust_file_transfer_risk_factors_by_influencers(expected, data_sensitivity, activity_type_risk)
+        if additional_context is not None:
+            adjust_file_transfer_risk_factors_by_additional_context(expected, additional_context)
+        _check_agreement(expected, FileTransferRiskFactor.DATA_EXFILTRATION, level)
+        risk_factors.update(expected)
+        return
+    risk_factors[FileTransferRiskFactor.DATA_EXFILTRATION] = level
+
+
+def _check_agreement(expected: Dict[Any, Any], factor: Any, level: Any):
+    if level is not None and expected[factor] != level:
+        raise RuntimeError(
+            f"Adjustment table disagrees with the helpers for {factor.name}: {level.name} != {expected[factor].name}")
+
+
+def _full_heightened_risks(vectors: List[str], level_type):
+    """Every heightened risks dict over `vectors`, each vector absent, LOW, MEDIUM or HIGH."""
+    for states in itertools.product((None,) + tuple(level_type), repeat=len(vectors)):
+        yield {vector: level for vector, level in zip(vectors, states) if level is not None}
+
+
+def verify_tables() -> Dict[str, int]:
+    """
+    Prove the compiled tables equal to the adjustment helpers over the full input space.
+
+    Every combination of level, influencers, mitigation status and heightened risks (each
+    vector absent, LOW, MEDIUM or HIGH, keyed by name) is run through the helpers on a
+    fresh dict and through the table lookups, including the input coding.
+
+    Returns:
+        Dict[str, int]: The number of input combinations checked per helper.
+
+    Raises:
+        RuntimeError: On the first combination where a table and a helper disagree.
+    """
+    tables = get_tables()
+    checked = {}
+
+    def check(name: str, actual: int, expected: Any, inputs: Tuple):
+        if actual != expected.value:
+            raise RuntimeError(f"{name} table gives {actual} instead of {expected.name} for {inputs}")
+        checked[name] = checked.get(name, 0) + 1
+
+    optional_levels = (None,) + tuple(RiskLevel)
+    for level, service_criticality, data_sensitivity in itertools.product(RiskLevel, optional_levels, optional_levels):
+        risk_factors = {RiskFactor.PERSISTENT_ACCESS_RISK: level}
+        adjust_risk_factors_by_influencers(risk_factors, service_criticality, data_sensitivity)
+        check("secret_influencers", tables["secret_influencers"].lookup(
+            level.value, _level_code(service_criticality, RiskLevel), _level_code(data_sensitivity, RiskLevel)),
+            risk_factors[RiskFactor.PERSISTENT_ACCESS_RISK], (level, service_criticality, data_sensitivity))
+
+    heightened_inputs = list(_full_heightened_risks(SECRET_HEIGHTENED_VECTORS, RiskLevel))
+    for level, mitigation in itertools.product(RiskLevel, MITIGATION_CODES):
+        for heightened_risks in heightened_inputs:
+            risk_factors = {RiskFactor.PERSISTENT_ACCESS_RISK: level}
+            adjust_risk_factors_by_additional_context(
+                risk_factors, {"external_mitigation": mitigation, "heightened_risks": heightened_risks})
+            check("secret_additional_context", tables["secret_additional_context"].lookup(
+                level.value, MITIGATION_CODES[mitigation], _heightened_mask(heightened_risks, SECRET_HEIGHTENED_VECTORS, RiskLevel)),
+                risk_factors[RiskFactor.PERSISTENT_ACCESS_RISK], (level, mitigation, heightened_risks))
+
+    optional_levels = (None,) + tuple(FileTransferRiskLevel)
+    for level, data_sensitivity, activity_type_risk in itertools.product(FileTransferRiskLevel, optional_levels, optional_levels):
+        risk_factors = {FileTransferRiskFactor.DATA_EXFILTRATION: level}
+        adjust_file_transfer_risk_factors_by_influencers(risk_factors, data_sensitivity, activity_type_risk)
+        check("file_transfer_influencers", tables["file_transfer_influencers"].lookup(
+            level.value, _level_code(data_sensitivity, FileTransferRiskLevel), _level_code(activity_type_risk, FileTransferRiskLevel)),
+            risk_factors[FileTransferRiskFactor.DATA_EXFILTRATION], (level, data_sensitivity, activity_type_risk))
+
+    for level in FileTransferRiskLevel:
+        for heightened_risks in _full_heightened_risks(FILE_TRANSFER_HEIGHTENED_VECTORS, FileTransferRiskLevel):
+            risk_factors = {FileTransferRiskFactor.DATA_EXFILTRATION: level}
+            adjust_file_transfer_risk_factors_by_additional_context(risk_factors, {"heightened_risks": heightened_risks})
+            check("file_transfer_additional_context", tables["file_transfer_additional_context"].lookup(
+                level.value, _heightened_mask(heightened_risks, FILE_TRANSFER_HEIGHTENED_VECTORS, FileTransferRiskLevel)),
+                risk_factors[FileTransferRiskFactor.DATA_EXFILTRATION], (level, heightened_risks))
+
+    return checked
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Inspect or verify the compiled risk adjustment tables.")
+    parser.add_argument("command", choices=["verify", "stats"])
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        for name, table in get_tables().items():
+            print(f"{name:34} shape {table.shape}, {len(table.cells)} cells")
+        return 0
+
+    try:
+        checked = verify_tables()
+    except RuntimeError as e:
+        print(f"Verification failed: {e}")
+        return 1
+    for name, count in checked.items():
+        print(f"{name:34} {count} input combinations agree")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -71,3 +71,17 @@ def adjust_risk_factors_by_influencers(risk_factors: Dict[RiskFactor, RiskLevel]
     for factor in risk_factors:
         risk_factors[factor] = max(
             min(risk_factors[factor], RiskLevel.HIGH), RiskLevel.LOW)
+
+
+def external_mitigation_can_change_risk(risk_factors: Dict[RiskFactor, RiskLevel]) -> bool:
+    # External mitigation only lowers levels that are above LOW
+    return any(level != RiskLevel.LOW for level in risk_factors.values())
+
+
+def heightened_risks_can_change_risk(risk_factors: Dict[RiskFactor, RiskLevel], external_mitigation: MitigationStatus = None) -> bool:
+    # Heightened risks only raise the persistent access risk to HIGH, after the external
+    # mitigation has been applied; an unassessed mitigation (None) lowers nothing
+    persistent_access_risk = risk_factors[RiskFactor.PERSISTENT_ACCESS_RISK]
+    if external_mitigation == MitigationStatus.PRESENT and persistent_access_risk != RiskLevel.LOW:
+        persistent_access_risk = RiskLevel(persistent_access_risk.value - 1)
+    return persistent_access_risk != RiskLevel.HIGH
@@ -0,0 +1,216 @@
+"""
+Departure Shield: Local Data Sensitivity Classifier
+
+A deterministic first tier in front of the AI data sensitivity assessment. Descriptions
+are scored with keyword/regex rules and a hashed n-gram naive Bayes model trained on a
+small seed set; only descriptions whose confidence falls below the threshold are
+escalated to the AI provider.
+"""
+
+import math
+import os
+import re
+import threading
+import zlib
+from typing import Any, Dict, List, Tuple
+
+
+# Minimum confidence for a local verdict; anything less is escalated to the AI provider.
+# A threshold above 1 disables the local tier.
+LOCAL_SENSITIVITY_THRESHOLD = float(
+    os.environ.get("LOCAL_SENSITIVITY_THRESHOLD", 0.85))
+
+LEVELS = ("LOW", "MEDIUM", "HIGH")
+
+NGRAM_BUCKETS = 4096
+# Scales the model's mean per-feature log-likelihood into a logit comparable to the rule weights
+MODEL_WEIGHT = 6.0
+
+# (pattern, level, weight): each matching rule adds its weight to the level's logit
+SENSITIVITY_RULES = [
+    (r"\bcustomers?\b.*\b(data|database|records?|information|details|list)\b", "HIGH", 3.0),
+    (r"\bpersonal(ly identifiable)? (information|data)\b|\bpii\b", "HIGH", 3.0),
+    (r"\bpayments?\b|\bcredit cards?\b|\bcardholder\b|\bbank accounts?\b", "HIGH", 3.0),
+    (r"\bsocial security\b|\bssn\b|\bpassports?\b", "HIGH", 3.0),
+    (r"\bfinancial (projections?|results|reports?|statements?)\b|\bquarterly results\b|\bearnings\b", "HIGH", 3.0),
+    (r"\bsalar(y|ies)\b|\bpayroll\b|\bcompensation\b", "HIGH", 3.0),
+    (r"\bmedical\b|\bhealth records?\b|\bpatients?\b", "HIGH", 3.0),
+    (r"\btrade secrets?\b|\bsource code\b|\bunreleased\b", "HIGH", 2.5),
+    (r"\broot account\b|\bfull access\b|\badministrative access\b", "HIGH", 2.0),
+    (r"\binternal\b.*\b(process(es)?|tools?|dashboards?|wiki|analytics|documentation)\b", "MEDIUM", 2.0),
+    (r"\bproject plans?\b|\bmeeting notes\b|\bproposals?\b", "MEDIUM", 1.5),
+    (r"\bpublic(ly available)?\b|\bpress releases?\b|\bpublished\b", "LOW", 3.0),
+    (r"\bmarketing (materials?|brochures?|collateral)\b|\bnewsletters?\b", "LOW", 2.5),
+    (r"\bteam (lunch|outing|event)s?\b|\bphotos?\b|\bholiday\b|\bparty\b|\bcafeteria\b|\bmenu\b", "LOW", 3.0),
+    (r"\btemplates?\b", "LOW", 1.5),
+]
+
+# Seed descriptions for the n-gram model, in the register of the employee metadata
+SEED_EXAMPLES = [
+    ("Export of customer records with names, emails and addresses", "HIGH"),
+    ("Read access to the customer accounts database", "HIGH"),
+    ("Signs requests to the payment processing API", "HIGH"),
+    ("Revenue forecasts and financial projections for next year", "HIGH"),
+    ("Source code of the core trading engine", "HIGH"),
+    ("Unreleased product designs and launch dates", "HIGH"),
+    ("Employee salary and payroll records", "HIGH"),
+    ("Patient health records from the clinic system", "HIGH"),
+    ("Credit card numbers and billing addresses of customers", "HIGH"),
+    ("Provides full access to all cloud services and resources", "HIGH"),
+    ("Trade secrets and proprietary manufacturing formulas", "HIGH"),
+    ("Customer contracts with pricing and personal contact details", "HIGH"),
+    ("Internal documentation of business processes", "MEDIUM"),
+    ("Project plans and timelines for the internal migration", "MEDIUM"),
+    ("Login for the internal reporting dashboard", "MEDIUM"),
+    ("Meeting notes from the weekly engineering sync", "MEDIUM"),
+    ("Draft proposal for a partner including delivery milestones", "MEDIUM"),
+    ("Internal wiki pages describing team processes", "MEDIUM"),
+    ("Access to the staging environment for testing", "MEDIUM"),
+    ("Copy of shared team folders to a backup drive", "MEDIUM"),
+    ("Team lunch photos from the quarterly offsite", "LOW"),
+    ("Publicly available marketing brochure", "LOW"),
+    ("Press release published on the company website", "LOW"),
+    ("Holiday party invitation and menu", "LOW"),
+    ("Company newsletter sent to all employees", "LOW"),
+    ("Blank presentation template with the company logo", "LOW"),
+    ("Cafeteria menu for next week", "LOW"),
+    ("Public documentation of the open source library", "LOW"),
+]
+
+
+def _tokens(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+def hashed_ngrams(text: str, buckets: int = NGRAM_BUCKETS) -> List[int]:
+    """Hash the word unigrams and bigrams of `text` into `buckets` buckets."""
+    tokens = _tokens(text)
+    grams = tokens + [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]
+    return [zlib.crc32(gram.encode('utf-8')) % buckets for gram in grams]
+
+
+class HashedNgramModel:
+    """Multinomial naive Bayes over hashed n-grams with Laplace smoothing."""
+
+    def __init__(self, examples: List[Tuple[str, str]]):
+        counts = {level: [0] * NGRAM_BUCKETS for level in LEVELS}
+        totals = {level: 0 for level in LEVELS}
+        for description, level in examples:
+            for bucket in hashed_ngrams(description):
+                counts[level][bucket] += 1
+                totals[level] += 1
+
+        self._log_likelihoods = {
+            level: [math.log((count + 1) / (totals[level] + NGRAM_BUCKETS)) for count in counts[level]]
+            for level in LEVELS
+        }
+
+    def logits(self, description: str) -> Dict[str, float]:
+        """Mean per-feature log-likelihood of each level, relative to the least likely level."""
+        buckets = hashed_ngrams(description)
+        if not buckets:
+            return {level: 0.0 for level in LEVELS}
+        means = {level: sum(self._log_likelihoods[level][bucket] for bucket in buckets) / len(buckets)
+                 for level in LEVELS}
+        floor = min(means.values())
+        return {level: mean - floor for level, mean in means.items()}
+
+
+_compiled_rules = [(re.compile(pattern, re.IGNORECASE), level, weight)
+                   for pattern, level, weight in SENSITIVITY_RULES]
+_model = HashedNgramModel(SEED_EXAMPLES)
+
+local_stats = {"local": 0, "escalated": 0}
+_local_stats_lock = threading.Lock()
+
+
+def classify_sensitivity(description: str) -> Tuple[str, float]:
+    """
+    Classify a description locally.
+
+    Args:
+        description (str): The description of the secret or file transfer.
+
+    Returns:
+        Tuple[str, float]: The most likely level name and its probability.
+    """
+    scores = {level: MODEL_WEIGHT * logit for level, logit in _model.logits(description).items()}
+    for pattern, level, weight in _compiled_rules:
+        if pattern.search(description):
+            scores[level] += weight
+
+    top = max(scores.values())
+    weights = {level: math.exp(score - top) for level, score in scores.items()}
+    total = sum(weights.values())
+    level = max(LEVELS, key=lambda name: weights[name])
+    return level, weights[level] / total
+
+
+def split_confident(descriptions: List[str], threshold: float = None) -> Tuple[Dict[str, str], List[str]]:
+    """
+    Separate the descriptions the local tier can decide from those to escalate.
+
+    Args:
+        descriptions (List[str]): The descriptions to classify; duplicates are decided once.
+        threshold (float): Minimum confidence for a local verdict, LOCAL_SENSITIVITY_THRESHOLD by default.
+
+    Returns:
+        Tuple[Dict[str, str], List[str]]: Level names of the confidently classified descriptions,
+        and the distinct descriptions to escalate, in order.
+    """
+    if threshold is None:
+        threshold = LOCAL_SENSITIVITY_THRESHOLD
+
+    decided = {}
+    escalated = []
+    for description in dict.fromkeys(descriptions):
+        level, confidence = classify_sensitivity(description)
+        if confidence >= threshold:
+            decided[description] = level
+        else:
+            escalated.append(description)
+
+    with _local_stats_lock:
+        local_stats["local"] += len(decided)
+        local_stats["escalated"] += len(escalated)
+    return decided, escalated
+
+
+def get_local_sensitivity_stats() -> Dict[str, Any]:
+    with _local_stats_lock:
+        total = local_stats["local"] + local_stats["escalated"]
+        return dict(local_stats, escalation_rate=local_stats["escalated"] / total if total else 0.0)
+
+
+def evaluate_local_classifier(samples: List[Tuple[str, str]], threshold: float = None) -> Dict[str, Any]:
+    """
+    Measure the local tier against AI verdicts on a labelled sample.
+
+    Args:
+        samples (List[Tuple[str, str]]): (description, level name assigned by the AI) pairs.
+        threshold (float): The confidence threshold to evaluate, LOCAL_SENSITIVITY_THRESHOLD by default.
+
+    Returns:
+        Dict[str, Any]: The escalation rate, and the agreement of the local verdicts with the
+        AI labels both on the items decided locally and on every item.
+    """
+    if threshold is None:
+        threshold = LOCAL_SENSITIVITY_THRESHOLD
+
+    decided = agreed = agreed_overall = 0
+    for description, label in samples:
+        level, confidence = classify_sensitivity(description)
+        agrees = level == label.upper()
+        agreed_overall += agrees
+        if confidence >= threshold:
+            decided += 1
+            agreed += agrees
+
+    items = len(samples)
+    return {
+        "items": items,
+        "threshold": threshold,
+        "escalation_rate": (items - decided) / items if items else 0.0,
+        "agreement_on_local": agreed / decided if decided else None,
+        "agreement_overall": agreed_overall / items if items else None,
+    }
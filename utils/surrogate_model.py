@@ -0,0 +1,347 @@
+"""
+Departure Shield: Surrogate Model for AI Verdicts
+
+A CPU-only stand-in for the AI assessments, trained offline on the verdicts recorded in
+the verdict store (utils.verdict_store). Each task output is a softmax regression over
+hashed word n-grams, fitted with NumPy.
+
+With SURROGATE_MODE=on the evaluation modules use the surrogate's verdict when it is at
+least SURROGATE_CONFIDENCE confident and call the live provider otherwise. A sample of the
+confident verdicts is still checked against a live call, and disagreements are logged as drift.
+
+Train or inspect the model with:
+    python -m utils.surrogate_model train [--min-examples N] [--epochs N]
+    python -m utils.surrogate_model stats
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import zlib
+from typing import Any, Dict, List, Tuple, Union
+
+from utils.sensitivity_classifier import hashed_ngrams
+from utils.verdict_store import VALID_LEVELS, record_verdict, verdict_store
+
+
+SURROGATE_MODE = os.environ.get("SURROGATE_MODE", "off")
+SURROGATE_MODEL_PATH = os.environ.get("SURROGATE_MODEL_PATH", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '.cache', 'surrogate_model.npz'))
+SURROGATE_CONFIDENCE = float(os.environ.get("SURROGATE_CONFIDENCE", 0.9))
+# Fraction of confident surrogate verdicts that are still checked against a live call
+SURROGATE_DRIFT_SAMPLE_RATE = float(
+    os.environ.get("SURROGATE_DRIFT_SAMPLE_RATE", 0.05))
+
+SURROGATE_BUCKETS = 2 ** 14
+SURROGATE_MIN_EXAMPLES = 50
+SURROGATE_EPOCHS = 300
+SURROGATE_LEARNING_RATE = 10.0
+SURROGATE_L2 = 1e-4
+# One in this many examples, chosen by a hash of the text, is held out for validation
+VALIDATION_FRACTION = 5
+
+SECRET_DATA_SENSITIVITY = 'secret_data_sensitivity'
+FILE_TRANSFER_DATA_SENSITIVITY = 'file_transfer_data_sensitivity'
+SECRET_HEIGHTENED_RISK = 'secret_heightened_risk'
+FILE_TRANSFER_HEIGHTENED_RISK = 'file_transfer_heightened_risk'
+SURROGATE_TASKS = [SECRET_DATA_SENSITIVITY, FILE_TRANSFER_DATA_SENSITIVITY,
+                   SECRET_HEIGHTENED_RISK, FILE_TRANSFER_HEIGHTENED_RISK]
+
+logger = logging.getLogger(__name__)
+
+
+def _feature_indices(text: str) -> List[int]:
+    # The last column is a bias feature every example has
+    return sorted(set(hashed_ngrams(text, SURROGATE_BUCKETS))) + [SURROGATE_BUCKETS]
+
+
+def _sparse_rows(texts: List[str]):
+    import numpy as np
+
+    indices = [_feature_indices(text) for text in texts]
+    lengths = np.array([len(row) for row in indices])
+    flat = np.array([index for row in indices for index in row], dtype=np.int64)
+    rows = np.repeat(np.arange(len(texts)), lengths)
+    values = np.repeat(1 / np.sqrt(lengths), lengths)
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    return flat, rows, values, offsets
+
+
+def _softmax(logits):
+    import numpy as np
+
+    exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def fit_softmax_regression(texts: List[str], labels: List[str], epochs: int = SURROGATE_EPOCHS,
+                           learning_rate: float = SURROGATE_LEARNING_RATE, l2: float = SURROGATE_L2):
+    """
+    Fit a softmax regression over hashed n-grams with full-batch gradient descent.
+
+    Args:
+        texts (List[str]): The inputs.
+        labels (List[str]): The level name of each input.
+
+    Returns:
+        The (SURROGATE_BUCKETS + 1, len(VALID_LEVELS)) weight matrix, columns ordered as VALID_LEVELS.
+    """
+    import numpy as np
+
+    flat, rows, values, offsets = _sparse_rows(texts)
+    targets = np.zeros((len(texts), len(VALID_LEVELS)))
+    targets[np.arange(len(texts)), [VALID_LEVELS.index(label) for label in labels]] = 1
+    weights = np.zeros((SURROGATE_BUCKETS + 1, len(VALID_LEVELS)))
+
+    for _ in range(epochs):
+        logits = np.add.reduceat(weights[flat] * values[:, None], offsets)
+        error = (_softmax(logits) - targets) / len(texts)
+        gradient = np.stack([
+            np.bincount(flat, weights=error[rows, column] * values, minlength=SURROGATE_BUCKETS + 1)
+            for column in range(len(VALID_LEVELS))], axis=1)
+        weights -= learning_rate * (gradient + l2 * weights)
+    return weights
+
+
+def predict_proba(weights, texts: List[str]):
+    import numpy as np
+
+    flat, _, values, offsets = _sparse_rows(texts)
+    return _softmax(np.add.reduceat(weights[flat] * values[:, None], offsets))
+
+
+def _is_validation(text: str) -> bool:
+    return zlib.crc32(text.encode('utf-8')) % VALIDATION_FRACTION == 0
+
+
+def train_surrogate(min_examples: int = SURROGATE_MIN_EXAMPLES, epochs: int = SURROGATE_EPOCHS,
+                    path: str = None) -> Dict[str, Any]:
+    """
+    Fit one model per task output on the recorded verdicts and save them.
+
+    Tasks with fewer than `min_examples` verdicts are skipped. Each output is first fitted
+    on the training split to report validation accuracy and coverage at SURROGATE_CONFIDENCE,
+    then refitted on every example.
+
+    Returns:
+        Dict[str, Any]: Per task, the number of examples and the per-output validation metrics.
+    """
+    import numpy as np
+
+    path = path or SURROGATE_MODEL_PATH
+    arrays = {}
+    report = {}
+    for task in SURROGATE_TASKS:
+        examples = verdict_store.examples(task)
+        if len(examples) < min_examples:
+            report[task] = {"examples": len(examples), "skipped": True}
+            continue
+
+        texts = [text for text, _ in examples]
+        outputs = sorted(set.intersection(*(set(labels) for _, labels in examples)))
+        validation = [_is_validation(text) for text in texts]
+        task_report = {"examples": len(examples), "outputs": {}}
+        for output in outputs:
+            labels = [example_labels[output] for _, example_labels in examples]
+            train_texts = [text for text, held_out in zip(texts, validation) if not held_out]
+            train_labels = [label for label, held_out in zip(labels, validation) if not held_out]
+            valid_texts = [text for text, held_out in zip(texts, validation) if held_out]
+            valid_labels = [label for label, held_out in zip(labels, validation) if held_out]
+
+            metrics = {"validation_examples": len(valid_texts)}
+            if valid_texts and train_texts:
+                probabilities = predict_proba(
+                    fit_softmax_regression(train_texts, train_labels, epochs), valid_texts)
+                predicted = [VALID_LEVELS[column] for column in probabilities.argmax(axis=1)]
+                confident = probabilities.max(axis=1) >= SURROGATE_CONFIDENCE
+                correct = np.array([p == label for p, label in zip(predicted, valid_labels)])
+                metrics["accuracy"] = float(correct.mean())
+                metrics["coverage"] = float(confident.mean())
+                metrics["accuracy_when_confident"] = float(
+                    correct[confident].mean()) if confident.any() else None
+
+            arrays[f"{task}/{output}"] = fit_softmax_regression(texts, labels, epochs)
+            task_report["outputs"][output] = metrics
+        report[task] = task_report
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    np.savez_compressed(path, **arrays)
+    reset_surrogate()
+    return report
+
+
+class SurrogateModel:
+    """The trained weights, by task and output, loaded from SURROGATE_MODEL_PATH."""
+
+    def __init__(self, weights: Dict[str, Dict[str, Any]]):
+        self._weights = weights
+
+    @classmethod
+    def load(cls, path: str) -> 'SurrogateModel':
+        import numpy as np
+
+        weights = {}
+        with np.load(path) as data:
+            for key in data.files:
+                task, output = key.split('/', 1)
+                weights.setdefault(task, {})[output] = data[key]
+        return cls(weights)
+
+    def predict(self, task: str, text: str) -> Union[Tuple[Dict[str, str], float], None]:
+        """
+        Returns:
+            Union[Tuple[Dict[str, str], float], None]: The level name per output and the lowest
+            output confidence, or None if no model was trained for the task.
+        """
+        if task not in self._weights:
+            return None
+        labels = {}
+        confidence = 1.0
+        for output, weights in self._weights[task].items():
+            probabilities = predict_proba(weights, [text])[0]
+            labels[output] = VALID_LEVELS[int(probabilities.argmax())]
+            confidence = min(confidence, float(probabilities.max()))
+        return labels, confidence
+
+
+_surrogate = None
+_surrogate_loaded = False
+_surrogate_lock = threading.Lock()
+
+surrogate_stats = {"surrogate_verdicts": 0, "live_fallbacks": 0,
+                   "drift_checks": 0, "drift_disagreements": 0}
+_surrogate_stats_lock = threading.Lock()
+
+
+def _count(key: str):
+    with _surrogate_stats_lock:
+        surrogate_stats[key] += 1
+
+
+def get_surrogate() -> Union[SurrogateModel, None]:
+    """Load the trained surrogate on first use; None if it is missing or NumPy is not installed."""
+    global _surrogate, _surrogate_loaded
+    with _surrogate_lock:
+        if not _surrogate_loaded:
+            _surrogate_loaded = True
+            try:
+                _surrogate = SurrogateModel.load(SURROGATE_MODEL_PATH)
+            except ImportError:
+                logger.warning("NumPy is not installed, the surrogate model is disabled")
+            except OSError:
+                logger.warning(
+                    f"No surrogate model at {SURROGATE_MODEL_PATH}, run `python -m utils.surrogate_model train`")
+        return _surrogate
+
+
+def reset_surrogate():
+    global _surrogate, _surrogate_loaded
+    with _surrogate_lock:
+        _surrogate = None
+        _surrogate_loaded = False
+
+
+def consult_surrogate(task: str, text: str) -> Tuple[Union[Dict[str, str], None], bool]:
+    """
+    Ask the surrogate for a verdict before calling the live provider.
+
+    Args:
+        task (str): One of SURROGATE_TASKS.
+        text (str): The surrogate input for the item.
+
+    Returns:
+        Tuple[Union[Dict[str, str], None], bool]: The confident surrogate verdict (None if there
+        is none), and whether the live provider must still be called, either because there is
+        no confident verdict or to check this one for drift.
+    """
+    if SURROGATE_MODE != 'on':
+        return None, True
+
+    surrogate = get_surrogate()
+    prediction = surrogate.predict(task, text) if surrogate else None
+    if prediction is None or prediction[1] < SURROGATE_CONFIDENCE:
+        _count("live_fallbacks")
+        return None, True
+
+    labels = prediction[0]
+    if random.random() < SURROGATE_DRIFT_SAMPLE_RATE:
+        return labels, True
+    _count("surrogate_verdicts")
+    return labels, False
+
+
+def observe_live_verdict(task: str, text: str, live_labels: Union[Dict[str, str], None],
+                         surrogate_labels: Union[Dict[str, str], None] = None):
+    """
+    Record a live verdict for training and, if the surrogate also answered, compare them.
+
+    Args:
+        task (str): One of SURROGATE_TASKS.
+        text (str): The surrogate input for the item.
+        live_labels (Union[Dict[str, str], None]): The live verdict; None if the response was unusable.
+        surrogate_labels (Union[Dict[str, str], None]): The surrogate verdict sampled for a drift check.
+    """
+    record_verdict(task, text, live_labels)
+    if surrogate_labels is None or not live_labels:
+        return
+
+    _count("drift_checks")
+    disagreements = {output: (level, live_labels.get(output))
+                     for output, level in surrogate_labels.items() if live_labels.get(output) != level}
+    if disagreements:
+        _count("drift_disagreements")
+        logger.warning(
+            f"Surrogate drift on {task} for {text!r}: {json.dumps(disagreements)} (surrogate, live)")
+
+
+def get_surrogate_stats() -> Dict[str, Any]:
+    with _surrogate_stats_lock:
+        stats = dict(surrogate_stats)
+    stats["drift_rate"] = stats["drift_disagreements"] / \
+        stats["drift_checks"] if stats["drift_checks"] else 0.0
+    return stats
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Train or inspect the surrogate model for AI verdicts.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    train_parser = subparsers.add_parser(
+        "train", help="fit the surrogate on the recorded verdicts")
+    train_parser.add_argument("--min-examples", type=int, default=SURROGATE_MIN_EXAMPLES,
+                              help=f"skip tasks with fewer verdicts (default: {SURROGATE_MIN_EXAMPLES})")
+    train_parser.add_argument("--epochs", type=int, default=SURROGATE_EPOCHS,
+                              help=f"gradient descent epochs (default: {SURROGATE_EPOCHS})")
+    subparsers.add_parser("stats", help="show the recorded verdicts per task")
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        for task, count in sorted(verdict_store.counts().items()):
+            print(f"{task:32} {count} verdicts")
+        return 0
+
+    report = train_surrogate(args.min_examples, args.epochs)
+    for task, task_report in report.items():
+        if task_report.get("skipped"):
+            print(f"{task}: skipped, {task_report['examples']} verdicts")
+            continue
+        print(f"{task}: {task_report['examples']} verdicts")
+        for output, metrics in task_report["outputs"].items():
+            if "accuracy" not in metrics:
+                print(f"  {output}: no validation examples")
+                continue
+            confident = metrics["accuracy_when_confident"]
+            confident = f"{confident:.0%}" if confident is not None else "n/a"
+            print(f"  {output}: validation accuracy {metrics['accuracy']:.0%}, "
+                  f"coverage {metrics['coverage']:.0%} at {SURROGATE_CONFIDENCE}, "
+                  f"accuracy when confident {confident}")
+    print(f"Surrogate model saved to {os.path.normpath(SURROGATE_MODEL_PATH)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""
+Departure Shield: AI Verdict Store
+
+Records the verdicts of live AI assessments together with the text they were made on,
+so they can be used as training data for the surrogate model (see utils.surrogate_model).
+Only the latest verdict per (task, input) is kept.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Tuple, Union
+
+
+AI_RECORD_VERDICTS = os.environ.get("AI_RECORD_VERDICTS", "1") != "0"
+AI_VERDICTS_PATH = os.environ.get("AI_VERDICTS_PATH", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '.cache', 'ai_verdicts.sqlite3'))
+
+VALID_LEVELS = ("LOW", "MEDIUM", "HIGH")
+
+logger = logging.getLogger(__name__)
+
+
+class VerdictStore:
+    """SQLite table of (task, input text) -> labels, where labels map output names to level names."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self.writes = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if self.path != ':memory:':
+                os.makedirs(os.path.dirname(
+                    os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS verdicts (
+                    task TEXT NOT NULL,
+                    input TEXT NOT NULL,
+                    labels TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (task, input)
+                )""")
+            self._conn.commit()
+        return self._conn
+
+    def record(self, task: str, text: str, labels: Dict[str, str]):
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO verdicts (task, input, labels, created_at) VALUES (?, ?, ?, ?)",
+                (task, text, json.dumps(labels, sort_keys=True), time.time()))
+            conn.commit()
+            self.writes += 1
+
+    def examples(self, task: str) -> List[Tuple[str, Dict[str, str]]]:
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT input, labels FROM verdicts WHERE task = ? ORDER BY input", (task,)).fetchall()
+        return [(text, json.loads(labels)) for text, labels in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT task, COUNT(*) FROM verdicts GROUP BY task").fetchall()
+        return dict(rows)
+
+
+verdict_store = VerdictStore(AI_VERDICTS_PATH)
+
+
+def configure_verdict_store(enabled: bool = None, path: str = None):
+    global AI_RECORD_VERDICTS, verdict_store
+    if enabled is not None:
+        AI_RECORD_VERDICTS = enabled
+    if path is not None and path != verdict_store.path:
+        verdict_store = VerdictStore(path)
+
+
+def record_verdict(task: str, text: str, labels: Union[Dict[str, str], None]):
+    """
+    Store the verdict of a live AI assessment.
+
+    Args:
+        task (str): The assessment, e.g. 'secret_data_sensitivity'.
+        text (str): The text the assessment was made on.
+        labels (Union[Dict[str, str], None]): Level names by output; None when the response was unusable.
+    """
+    if not (AI_RECORD_VERDICTS and labels):
+        return
+    try:
+        verdict_store.record(task, text, labels)
+    except sqlite3.Error as e:
+        logger.warning(f"Error recording AI verdict: {e}")
+
+
+def level_labels(response: Any, outputs: List[str]) -> Union[Dict[str, str], None]:
+    """
+    Extract `{output: {"level": ...}}` verdicts from a heightened risk response.
+
+    Returns:
+        Union[Dict[str, str], None]: Upper-cased level names by output, or None unless every
+        output has a valid level, so that defaults filled in by the parsers are never recorded.
+    """
+    if not isinstance(response, dict):
+        return None
+    labels = {}
+    for output in outputs:
+        entry = response.get(output)
+        level = entry.get('level') if isinstance(entry, dict) else None
+        if not (isinstance(level, str) and level.upper() in VALID_LEVELS):
+            return None
+        labels[output] = level.upper()
+    return labels
+
+
+def sensitivity_labels(response: Any) -> Union[Dict[str, str], None]:
+    """Extract the verdict of a single-item data sensitivity response, as returned by get_ai_chat_response."""
+    if not (response and isinstance(response, list) and isinstance(response[0], dict)):
+        return None
+    level = response[0].get('risk_level')
+    if not (isinstance(level, str) and level.upper() in VALID_LEVELS):
+        return None
+    return {"data_sensitivity": level.upper()}
+